@@ -0,0 +1,99 @@
+"""
+页面解析性能基准：旧的多轮正则回退 vs 单遍流式解析
+生成一个大型 QDII 页面夹具并保存到临时目录（或 --fixture 指定的路径），按 64KB 分块喂入流式解析器
+
+用法: python bench_html_parse.py [--rows 20000] [--repeat 3] [--fixture path/to/page.html]
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, List, Tuple
+
+import qdii_html_parser as hp
+from fund_quote import FundQuote
+
+CHUNK = 64 * 1024
+
+
+def _write_fixture(path: str, rows: int) -> None:
+    rnd = random.Random(7)
+    statuses = ["限100", "限大额", "暂停申购", "开放申购"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><title>QDII</title></head><body><table>\n")
+        for i in range(rows):
+            # 页面中的行没有 data-name，只能按文本标签提取，与旧正则回退的适用场景一致
+            f.write(
+                f"<tr><td>{100000 + i}</td><td>基金名称{i}</td><td>T-1溢价率 {rnd.uniform(-5, 10):.2f}%</td>"
+                f"<td>申购状态 {rnd.choice(statuses)}</td><td>净值 1.{i % 1000:03d}</td></tr>\n"
+            )
+        f.write("</table></body></html>\n")
+
+
+def _legacy_parse_with_regex(html: str) -> List[FundQuote]:
+    # 旧实现：整页去标签、压缩空白、按 6 位数字切块，每块再跑多条正则
+    text = re.sub(r"<[^>]+>", " ", html)
+    text = re.sub(r"\s+", " ", text)
+    chunks = re.split(r"(?=\b\d{6}\b)", text)
+    result: List[FundQuote] = []
+    for chunk in chunks:
+        m_code = re.search(r"\b(\d{6})\b", chunk)
+        if not m_code:
+            continue
+        code = m_code.group(1)
+        m_name = re.search(r"\b\d{6}\b\s*([^\d%\-]{2,}?)\s", chunk)
+        name = m_name.group(1).strip() if m_name else ""
+        m_t1 = re.search(r"T-1溢价率\s*([+\-]?[\d\.]+)%", chunk)
+        t1 = m_t1.group(1) + "%" if m_t1 else ""
+        m_sub = re.search(r"申购状态\s*([\u4e00-\u9fffA-Za-z0-9%]+)", chunk)
+        sub = m_sub.group(1) if m_sub else ""
+        if t1 or sub:
+            result.append(FundQuote.from_raw(code, name, t1, sub))
+    return result
+
+
+def _stream(path: str) -> List[Any]:
+    with open(path, "rb") as f:
+        return list(hp.iter_rows(iter(lambda: f.read(CHUNK), b"")))
+
+
+def _legacy(path: str) -> List[Any]:
+    with open(path, "rb") as f:
+        return _legacy_parse_with_regex(f.read().decode("utf-8", errors="ignore"))
+
+
+def _measure(fn: Callable[[], Any], repeat: int) -> Tuple[float, int, int]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    n = len(fn())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="bench_html_parse")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fixture")
+    args = parser.parse_args()
+
+    path = args.fixture or os.path.join(tempfile.gettempdir(), f"qdii_page_{args.rows}.html")
+    if not os.path.exists(path):
+        _write_fixture(path, args.rows)
+    size_mb = os.path.getsize(path) / 1e6
+    print(f"夹具: {path} ({size_mb:.1f} MB)")
+    for name, fn in (("旧正则回退", lambda: _legacy(path)), ("流式解析", lambda: _stream(path))):
+        sec, peak, n = _measure(fn, args.repeat)
+        print(f"  {name:<8} {sec * 1000:9.1f} ms  {size_mb / sec:6.1f} MB/s  峰值内存 {peak / 1e6:7.1f} MB  行数 {n}")
+
+
+if __name__ == "__main__":
+    main()
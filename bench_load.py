@@ -0,0 +1,114 @@
+"""
+并发负载基准：多个 MCP 客户端同时调用工具，统计各工具的 p50 / p99 延迟与事件循环最大停顿
+
+使用 fixtures/replay 下的录制响应（可注入上游延迟），不访问网络；
+客户端与服务在同一进程内通过 fastmcp.Client 连接。
+
+用法: python bench_load.py [--clients 50] [--rounds 3] [--latency 0.2]
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# 每个客户端每轮依次调用的工具：慢的抓取、阻塞的历史扫描、轻量的状态查询
+CALLS = (
+    ("fetch_qdii_candidates", {"threshold": 2.0}),
+    ("fetch_premium_history", {"code": "164906"}),
+    ("get_wechat_status", {"message_id": "missing"}),
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    data = sorted(values)
+    return data[min(len(data) - 1, int(q * (len(data) - 1) + 0.5))]
+
+
+async def _monitor_loop(stop: asyncio.Event, interval: float = 0.01) -> float:
+    # 事件循环停顿：定时器实际唤醒时间与预期的最大差值
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run_load(clients: int = 50, rounds: int = 3, invalidate: Any = None) -> Dict[str, Any]:
+    """
+    启动 clients 个并发客户端，每个执行 rounds 轮 CALLS，返回延迟统计
+
+    Args:
+        clients: 并发客户端数
+        rounds: 每个客户端的调用轮数
+        invalidate: 每轮开始前调用（例如使快照失效以强制重新抓取）
+    """
+    import fastmcp
+    import mcp_server
+
+    latencies: Dict[str, List[float]] = {name: [] for name, _ in CALLS}
+    busy = 0
+
+    async def client_loop(i: int) -> None:
+        nonlocal busy
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            for r in range(rounds):
+                if invalidate is not None and i == 0:
+                    invalidate()
+                for name, args in CALLS:
+                    start = time.perf_counter()
+                    result = await client.call_tool(name, args)
+                    latencies[name].append(time.perf_counter() - start)
+                    text = result.content[0].text if result.content else ""
+                    try:
+                        data = json.loads(text)
+                    except ValueError:
+                        continue
+                    if isinstance(data, dict) and data.get("error") == "busy":
+                        busy += 1
+
+    stop = asyncio.Event()
+    monitor = asyncio.ensure_future(_monitor_loop(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    loop_lag = await monitor
+    all_calls = [v for values in latencies.values() for v in values]
+    return {
+        "clients": clients,
+        "calls": len(all_calls),
+        "elapsed": round(elapsed, 3),
+        "busy": busy,
+        "max_loop_lag": round(loop_lag, 4),
+        "p50": round(percentile(all_calls, 0.5), 4),
+        "p99": round(percentile(all_calls, 0.99), 4),
+        "tools": {
+            name: {"p50": round(percentile(v, 0.5), 4), "p99": round(percentile(v, 0.99), 4)}
+            for name, v in latencies.items()
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="每个上游请求注入的延迟秒数")
+    args = parser.parse_args()
+
+    import jisilu_mcp_server as j
+    from http_clients import registry
+    from replay_transport import ReplayTransport
+
+    registry.set_transport(ReplayTransport(Path(__file__).parent / "fixtures" / "replay", latency=args.latency))
+    stats = asyncio.run(run_load(args.clients, args.rounds, invalidate=j._snapshot_cache.invalidate))
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+筛选性能基准：逐行循环 vs 溢价率索引
+在合成数据上比较，不访问网络
+
+用法: python bench_screening.py [--rows 20000] [--repeat 20]
+"""
+import argparse
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+import jisilu_mcp_server as j
+from fund_quote import FundQuote, parse_percent
+from screening import PremiumIndex, Screen
+
+STATUSES = ["限100", "限大额", "暂停申购", "开放申购", "限1万", ""]
+THRESHOLDS = [0.5, 1.0, 2.0, 3.0, 5.0]
+
+
+def _synthetic_rows(n: int) -> List[Dict[str, Any]]:
+    rnd = random.Random(42)
+    rows = []
+    for i in range(n):
+        premium = "-" if rnd.random() < 0.02 else f"{rnd.uniform(-5, 10):.2f}%"
+        rows.append({"代码": f"{100000 + i}", "名称": f"基金{i}", "T-1溢价率": premium, "申购状态": rnd.choice(STATUSES)})
+    return rows
+
+
+def _legacy_loop(rows: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    # 旧实现：每次调用都从字符串重新解析溢价率
+    out = []
+    for r in rows:
+        p = parse_percent(str(r.get("T-1溢价率", "")))
+        status = str(r.get("申购状态", ""))
+        if p == p and p > threshold and status != "暂停申购" and status != "开放申购":
+            out.append({"代码": r.get("代码", ""), "名称": r.get("名称", ""), "T-1溢价率": p, "申购状态": status})
+    return out
+
+
+def _timeit(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="bench_screening")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = _synthetic_rows(args.rows)
+    quotes = [FundQuote.from_raw(r["代码"], r["名称"], r["T-1溢价率"], r["申购状态"]) for r in rows]
+    index = PremiumIndex(quotes)
+    screens = [Screen(t) for t in THRESHOLDS]
+
+    # 结果一致性校验
+    for t, got in zip(THRESHOLDS, index.screen_many(screens)):
+        assert [q.code for q in got] == [r["代码"] for r in _legacy_loop(rows, t)]
+
+    results = {
+        "旧循环(字符串解析) x1": _timeit(lambda: _legacy_loop(rows, 2.0), args.repeat),
+        "FundQuote 循环 x1": _timeit(lambda: j._filter_candidates(quotes, 2.0), args.repeat),
+        "溢价率索引 x1": _timeit(lambda: index.screen_many(screens[2:3]), args.repeat),
+        f"旧循环(字符串解析) x{len(THRESHOLDS)}": _timeit(lambda: [_legacy_loop(rows, t) for t in THRESHOLDS], args.repeat),
+        f"溢价率索引 x{len(THRESHOLDS)} (二分 + 位图)": _timeit(lambda: index.screen_many(screens), args.repeat),
+        f"溢价率索引计数 x{len(THRESHOLDS)}": _timeit(lambda: [index.count(t) for t in THRESHOLDS], args.repeat),
+        "溢价率索引 Top 10": _timeit(lambda: index.top(10, screens[0].excluded), args.repeat),
+        "构建溢价率索引(每个快照一次)": _timeit(lambda: PremiumIndex(quotes), args.repeat),
+    }
+    print(f"行数: {args.rows}, 重复: {args.repeat} 次取最优")
+    for name, sec in results.items():
+        print(f"  {name:<32} {sec * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+启动性能基准：用 python -X importtime 统计导入服务模块的耗时，并检查冷启动预算
+
+在子进程中导入模块（默认 mcp_server），解析 importtime 输出，
+列出累计耗时最高的模块；多次运行取最小值以降低噪声。超过预算时退出码为 1，可直接用于 CI。
+
+用法: python bench_startup.py [--module mcp_server] [--repeat 3] [--top 15] [--budget-ms 3000]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 冷启动时不应被导入的重模块（只在首次调用或后台预热时加载）
+LAZY_MODULES = ("akshare", "pandas", "bs4")
+
+DEFAULT_BUDGET_MS = 3000.0
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int, int]]:
+    """解析 -X importtime 输出，返回 模块名 -> (自身微秒, 累计微秒, 嵌套深度)"""
+    out: Dict[str, Tuple[int, int, int]] = {}
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            out[name] = (int(self_us), int(cum_us), (len(indent) - 1) // 2)
+    return out
+
+
+def measure(module: str = "mcp_server") -> Dict[str, Tuple[int, int, int]]:
+    env = dict(os.environ)
+    env.setdefault("PYTHONWARNINGS", "ignore")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=str(Path(__file__).parent), env=env, capture_output=True, text=True, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{proc.stderr[-2000:]}")
+    return parse_importtime(proc.stderr)
+
+
+def total_ms(modules: Dict[str, Tuple[int, int, int]], module: str) -> float:
+    # 目标模块自身的累计耗时即整个导入链的耗时
+    return modules[module][1] / 1000.0
+
+
+def loaded_lazy_modules(modules: Dict[str, Tuple[int, int, int]]) -> List[str]:
+    return [m for m in LAZY_MODULES if m in modules]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="mcp_server")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS)))
+    args = parser.parse_args()
+
+    best: Optional[Dict[str, Tuple[int, int, int]]] = None
+    for _ in range(args.repeat):
+        run = measure(args.module)
+        if best is None or total_ms(run, args.module) < total_ms(best, args.module):
+            best = run
+    assert best is not None
+    total = total_ms(best, args.module)
+
+    print(f"{'模块':<48}{'自身(ms)':>10}{'累计(ms)':>10}")
+    for name, (self_us, cum_us, depth) in sorted(best.items(), key=lambda kv: -kv[1][1])[: args.top]:
+        print(f"{name:<48}{self_us / 1000:>10.1f}{cum_us / 1000:>10.1f}")
+    print(f"\nimport {args.module}: {total:.0f} ms（预算 {args.budget_ms:.0f} ms）")
+
+    ok = True
+    lazy = loaded_lazy_modules(best)
+    if lazy:
+        print(f"冷启动时导入了应延迟加载的模块: {', '.join(lazy)}")
+        ok = False
+    if total > args.budget_ms:
+        print("超出启动预算")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
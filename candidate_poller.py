@@ -0,0 +1,175 @@
+"""
+后台轮询：定时获取集思录快照，与上一次快照比较，只对变化的基金发送微信通知
+
+- A股交易时段（工作日 9:15-11:30、13:00-15:00，北京时间）使用较短的轮询间隔，其余时间降频
+- 仅在基金新越过阈值、或已越过阈值的基金申购状态变化时通知
+- 同一基金同一状态在冷却时间内只通知一次
+- 启动后的第一份有效快照默认只作为比较基线，重启不会把现有候选再通知一遍；抓取失败的空快照不作为基线
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fund_quote import FundQuote
+from screening import DEFAULT_EXCLUDED
+from snapshot_cache import Snapshot
+
+logger = logging.getLogger("mcp_server.poller")
+
+CN_TZ = timezone(timedelta(hours=8))
+TRADING_SESSIONS = ((9 * 60 + 15, 11 * 60 + 30), (13 * 60, 15 * 60))
+
+
+def is_trading_time(now: Optional[datetime] = None) -> bool:
+    # 未考虑节假日，节假日按工作日处理
+    now = (now or datetime.now(CN_TZ)).astimezone(CN_TZ)
+    if now.weekday() >= 5:
+        return False
+    minute = now.hour * 60 + now.minute
+    return any(start <= minute <= end for start, end in TRADING_SESSIONS)
+
+
+@dataclass
+class Alert:
+    quote: FundQuote
+    reason: str  # "new" 新越过阈值 / "status" 申购状态变化
+    previous_status: str = ""
+
+
+class CandidatePoller:
+    def __init__(
+        self,
+        get_snapshot: Callable[[], Awaitable[Snapshot[List[FundQuote]]]],
+        notify: Callable[[str, str], Awaitable[Any]],
+        threshold: float = 2.0,
+        trading_interval: float = 60.0,
+        idle_interval: float = 900.0,
+        cooldown: float = 3600.0,
+        alert_on_start: bool = False,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            get_snapshot: 获取当前快照（通常为快照缓存）
+            notify: 发送通知的协程函数，参数为 (title, desp)
+            threshold: 溢价率阈值
+            trading_interval: 交易时段轮询间隔（秒）
+            idle_interval: 非交易时段轮询间隔（秒）
+            cooldown: 同一基金同一状态的重复通知冷却时间（秒）
+            alert_on_start: 启动后的第一份快照是否把已越过阈值的基金都作为新基金通知；
+                默认只记录为基线，避免每次重启都发送一整批提醒
+        """
+        self._get_snapshot = get_snapshot
+        self._notify = notify
+        self.threshold = threshold
+        self.trading_interval = trading_interval
+        self.idle_interval = idle_interval
+        self.cooldown = cooldown
+        self.alert_on_start = alert_on_start
+        self._clock = clock
+        self._above: Optional[Dict[str, FundQuote]] = None
+        self._sent: Dict[str, Tuple[float, str]] = {}
+        self._last_version: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self.polls = 0
+        self.alerts_sent = 0
+        self.last_error: Optional[str] = None
+
+    def interval(self, now: Optional[datetime] = None) -> float:
+        return self.trading_interval if is_trading_time(now) else self.idle_interval
+
+    def diff(self, quotes: List[FundQuote]) -> List[Alert]:
+        # 跟踪所有溢价率越过阈值的基金（不论申购状态），以便发现状态变化
+        above = {q.code: q for q in quotes if q.premium > self.threshold}
+        previous = self._above
+        self._above = above
+        if previous is None:
+            if not self.alert_on_start:
+                # 第一份快照只作为基线，不知道重启前已经通知过哪些基金
+                return []
+            previous = {}
+        alerts: List[Alert] = []
+        for code, q in above.items():
+            old = previous.get(code)
+            if old is None:
+                if q.status not in DEFAULT_EXCLUDED:
+                    alerts.append(Alert(q, "new"))
+            elif old.status_text != q.status_text:
+                alerts.append(Alert(q, "status", old.status_text))
+        return [a for a in alerts if self._should_send(a)]
+
+    def _should_send(self, alert: Alert) -> bool:
+        now = self._clock()
+        code = alert.quote.code
+        last = self._sent.get(code)
+        if last is not None and last[1] == alert.quote.status_text and now - last[0] < self.cooldown:
+            return False
+        self._sent[code] = (now, alert.quote.status_text)
+        return True
+
+    @staticmethod
+    def render(alerts: List[Alert]) -> Tuple[str, str]:
+        title = f"QDII套利提醒: {len(alerts)} 只基金变化"
+        lines = ["| 代码 | 名称 | T-1溢价率 | 申购状态 | 变化 |", "| --- | --- | --- | --- | --- |"]
+        for a in alerts:
+            change = "新越过阈值" if a.reason == "new" else f"{a.previous_status or '-'} → {a.quote.status_text or '-'}"
+            lines.append(f"| {a.quote.code} | {a.quote.name} | {a.quote.premium:.2f}% | {a.quote.status_text or '-'} | {change} |")
+        return title, "\n".join(lines)
+
+    async def poll_once(self) -> List[Alert]:
+        self.polls += 1
+        snap = await self._get_snapshot()
+        # 抓取失败时快照缓存返回的占位快照（版本 0、没有行）不作为基线，也不记录版本
+        if snap.version == 0 or not snap.rows:
+            return []
+        # 快照未更新时无需比较
+        if snap.version == self._last_version:
+            return []
+        self._last_version = snap.version
+        alerts = self.diff(snap.rows)
+        if alerts:
+            title, desp = self.render(alerts)
+            await self._notify(title, desp)
+            self.alerts_sent += len(alerts)
+            logger.info(f"轮询发现 {len(alerts)} 只基金变化，已发送通知")
+        return alerts
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"轮询失败: {e}")
+            await asyncio.sleep(self.interval())
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "threshold": self.threshold,
+            "interval": self.interval(),
+            "trading_time": is_trading_time(),
+            "polls": self.polls,
+            "alerts_sent": self.alerts_sent,
+            "tracked_funds": len(self._above or {}),
+            "last_error": self.last_error,
+        }
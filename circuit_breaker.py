@@ -0,0 +1,236 @@
+"""
+上游熔断器与自适应超时
+
+每个上游（jisilu / serverchan / deepseek）一个熔断器，挂在共享 HTTP 客户端的传输层上：
+- closed：正常放行，连续失败达到阈值后进入 open
+- open：直接抛出 CircuitOpenError，不再等待超时；reset_timeout 秒后进入 half_open
+- half_open：只放行一个探测请求，成功则恢复 closed，失败则重新 open
+超时按最近成功请求的延迟分位数乘以倍数计算，并限制在 [min_timeout, 默认超时] 之间。
+连接错误、超时以及 429 / 5xx 响应计为失败。
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+import httpx
+
+from metrics import registry as _metrics
+
+logger = logging.getLogger("mcp_server.breaker")
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(httpx.TransportError):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+UPSTREAM_SECONDS = _metrics.histogram("upstream_request_seconds", "上游请求耗时（到收到响应头）", ["upstream"])
+UPSTREAM_REQUESTS = _metrics.counter("upstream_requests_total", "上游请求数，按结果分类", ["upstream", "outcome"])
+
+
+def _is_failure_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_timeout: float = 30.0,
+        min_timeout: float = 2.0,
+        timeout_percentile: float = 0.99,
+        timeout_multiplier: float = 3.0,
+        min_samples: int = 10,
+        window: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            name: 上游名称
+            failure_threshold: 连续失败多少次后打开
+            reset_timeout: 打开后多少秒进入半开状态放行探测请求
+            max_timeout: 超时上限（即原先的固定超时）
+            min_timeout: 自适应超时的下限
+            timeout_percentile: 自适应超时取成功延迟的该分位数
+            timeout_multiplier: 自适应超时 = 分位数延迟 x 该倍数
+            min_samples: 成功样本少于该数时使用 max_timeout
+            window: 保留最近多少个成功延迟
+            clock: 时间函数（测试时替换）
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self._clock = clock
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self.last_error: Optional[str] = None
+
+    # ---- 状态机 ----
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+                logger.info(f"熔断器 {self.name} 进入半开状态，放行探测请求")
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self._stats["rejected"] += 1
+            return False
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._stats["successes"] += 1
+            self._latencies.append(latency)
+            self._failures = 0
+            if self.state != CLOSED:
+                logger.info(f"熔断器 {self.name} 探测成功，恢复关闭状态")
+            self.state = CLOSED
+            self._probing = False
+
+    def record_failure(self, error: str) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+            self._failures += 1
+            self.last_error = error
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                self.state = OPEN
+                self._opened_at = self._clock()
+                self._probing = False
+                self._stats["opened"] += 1
+                logger.warning(f"熔断器 {self.name} 打开: 连续失败 {self._failures} 次, 最近错误 {error}")
+
+    def record_cancel(self) -> None:
+        # 探测请求被取消时允许下一个请求继续探测
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self._failures = 0
+            self._probing = False
+            self._latencies.clear()
+
+    # ---- 自适应超时 ----
+
+    def timeout(self) -> float:
+        if len(self._latencies) < self.min_samples:
+            return self.max_timeout
+        data = sorted(self._latencies)
+        p = data[min(len(data) - 1, int(self.timeout_percentile * (len(data) - 1) + 0.5))]
+        return max(self.min_timeout, min(self.max_timeout, p * self.timeout_multiplier))
+
+    def retry_after(self) -> Optional[float]:
+        if self.state != OPEN:
+            return None
+        return max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+
+    def stats(self) -> Dict[str, Any]:
+        retry_after = self.retry_after()
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "timeout": round(self.timeout(), 3),
+            "retry_after": round(retry_after, 3) if retry_after is not None else None,
+            "last_error": self.last_error,
+            **self._stats,
+        }
+
+
+class BreakerTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    把熔断、自适应超时与上游指标套在真实传输层外面
+
+    熔断器按上游共享，传输层按客户端各建一个；breaker 为 None 时只记录指标。
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker], inner: Any, name: str = ""):
+        self.breaker = breaker
+        self.inner = inner
+        self.name = name or (breaker.name if breaker is not None else "")
+
+    def _before(self, request: httpx.Request) -> None:
+        breaker = self.breaker
+        if breaker is None:
+            return
+        if not breaker.allow():
+            UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="rejected")
+            raise CircuitOpenError(f"{breaker.name} 熔断中，{breaker.retry_after() or 0:.0f}s 后重试", request=request)
+        # 调用方显式传入的超时与自适应超时取较小值
+        limit = breaker.timeout()
+        current = request.extensions.get("timeout") or {}
+        request.extensions["timeout"] = {
+            k: limit if current.get(k) is None else min(current[k], limit)
+            for k in ("connect", "read", "write", "pool")
+        }
+
+    def _after(self, response: httpx.Response, latency: float) -> None:
+        UPSTREAM_SECONDS.observe(latency, upstream=self.name)
+        failed = _is_failure_status(response.status_code)
+        UPSTREAM_REQUESTS.inc(upstream=self.name, outcome=f"http_{response.status_code // 100}xx")
+        if self.breaker is None:
+            return
+        if failed:
+            self.breaker.record_failure(f"HTTP {response.status_code}")
+        else:
+            self.breaker.record_success(latency)
+
+    def _error(self, e: Exception, latency: float) -> None:
+        UPSTREAM_SECONDS.observe(latency, upstream=self.name)
+        UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="timeout" if isinstance(e, httpx.TimeoutException) else "error")
+        if self.breaker is not None:
+            self.breaker.record_failure(f"{type(e).__name__}: {e}")
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._before(request)
+        start = time.perf_counter()
+        try:
+            response = self.inner.handle_request(request)
+        except Exception as e:
+            self._error(e, time.perf_counter() - start)
+            raise
+        self._after(response, time.perf_counter() - start)
+        return response
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._before(request)
+        start = time.perf_counter()
+        try:
+            response = await self.inner.handle_async_request(request)
+        except Exception as e:
+            self._error(e, time.perf_counter() - start)
+            raise
+        except BaseException:
+            # 被调用方取消（例如对冲请求）不算上游失败
+            UPSTREAM_REQUESTS.inc(upstream=self.name, outcome="cancelled")
+            if self.breaker is not None:
+                self.breaker.record_cancel()
+            raise
+        self._after(response, time.perf_counter() - start)
+        return response
+
+    def close(self) -> None:
+        self.inner.close()
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
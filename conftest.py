@@ -0,0 +1,38 @@
+"""
+pytest 公共夹具：把共享 HTTP 客户端切换到 fixtures/replay 下的录制响应，测试全程不访问网络
+"""
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# 溢价率历史写到临时目录，避免测试数据落入仓库
+os.environ.setdefault("PREMIUM_HISTORY_DIR", tempfile.mkdtemp(prefix="premium_history_"))
+# LLM 响应缓存写到临时目录
+os.environ.setdefault("LLM_CACHE_DIR", tempfile.mkdtemp(prefix="llm_cache_"))
+# 测试中不做后台预热，避免进程退出时等待 akshare 导入
+os.environ.setdefault("WARMUP_ENABLED", "0")
+
+from http_clients import registry
+from replay_transport import ReplayTransport
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "replay"
+
+
+@pytest.fixture
+def replay():
+    import jisilu_mcp_server as j
+    previous = registry.transport
+    transport = ReplayTransport(FIXTURES_DIR)
+    registry.set_transport(transport)
+    j._snapshot_cache.invalidate()
+    j._orchestrator.reset()
+    j._payloads.clear()
+    j._last_api_rows = None
+    try:
+        yield transport
+    finally:
+        registry.set_transport(previous)
+        j._snapshot_cache.invalidate()
+        j._orchestrator.reset()
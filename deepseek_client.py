@@ -3,7 +3,8 @@ import json
 import os
 from pathlib import Path
 from typing import Any
-import httpx
+
+import llm_gateway
 
 
 def _load_api_key() -> str | None:
@@ -22,23 +23,16 @@ def _load_api_key() -> str | None:
     return None
 
 
+# 响应缓存、并发上限与相同请求去重见 llm_gateway.py；lambda 保证每次读取最新的 API Key
+gateway = llm_gateway.from_env(lambda: _load_api_key())
+
+
 def chat(prompt: str, model: str = "deepseek-chat", system: str | None = None, max_tokens: int | None = None) -> dict[str, Any]:
-    api_key = _load_api_key()
-    if not api_key:
-        raise RuntimeError("Missing deepseek-api-key in config.json or DEEPSEEK_API_KEY env")
-    url = "https://api.deepseek.com/v1/chat/completions"
-    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-    messages: list[dict[str, str]] = []
-    if system:
-        messages.append({"role": "system", "content": system})
-    messages.append({"role": "user", "content": prompt})
-    payload: dict[str, Any] = {"model": model, "messages": messages}
-    if max_tokens is not None:
-        payload["max_tokens"] = max_tokens
-    with httpx.Client(timeout=60) as client:
-        resp = client.post(url, json=payload, headers=headers)
-        resp.raise_for_status()
-        return resp.json()
+    return gateway.chat_sync(prompt, model, system, max_tokens)
+
+
+async def chat_async(prompt: str, model: str = "deepseek-chat", system: str | None = None, max_tokens: int | None = None) -> dict[str, Any]:
+    return await gateway.chat(prompt, model, system, max_tokens)
 
 
 def _parse_args() -> argparse.Namespace:
@@ -59,7 +53,7 @@ def _dry_run_output(prompt: str, model: str, system: str | None) -> dict[str, An
     messages.append({"role": "user", "content": prompt})
     return {
         "has_key": has_key,
-        "url": "https://api.deepseek.com/v1/chat/completions",
+        "url": f"{gateway.base_url}/chat/completions",
         "payload": {"model": model, "messages": messages},
     }
 
@@ -70,9 +64,4 @@ if __name__ == "__main__":
         print(json.dumps(_dry_run_output(args.prompt, args.model, args.system), ensure_ascii=False))
     else:
         data = chat(args.prompt, args.model, args.system, args.max_tokens)
-        content: str = ""
-        try:
-            content = str(data.get("choices", [{}])[0].get("message", {}).get("content", ""))
-        except Exception:
-            content = ""
-        print(json.dumps({"content": content, "raw": data}, ensure_ascii=False))
\ No newline at end of file
+        print(json.dumps({"content": llm_gateway.message_content(data), "raw": data}, ensure_ascii=False))
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""
+基金行情记录：抓取时一次性解析溢价率与申购状态，仅在 MCP 边界转换为中文键字典
+"""
+import math
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict
+
+
+class ApplyStatus(Enum):
+    OPEN = "开放申购"
+    SUSPENDED = "暂停申购"
+    LIMITED = "限购"
+    OTHER = "其他"
+    UNKNOWN = ""
+
+    @classmethod
+    def parse(cls, text: str) -> "ApplyStatus":
+        # 集思录的限购状态形如 "限100"、"限大额"，统一归为 LIMITED
+        s = text.strip()
+        if not s:
+            return cls.UNKNOWN
+        if s == cls.OPEN.value:
+            return cls.OPEN
+        if s == cls.SUSPENDED.value:
+            return cls.SUSPENDED
+        if s.startswith("限"):
+            return cls.LIMITED
+        return cls.OTHER
+
+
+def parse_percent(s: Any) -> float:
+    # 将百分数字符串转为浮点数（去掉%和+号），无法解析时返回 nan
+    if isinstance(s, (int, float)):
+        return float(s)
+    s = str(s).strip().replace("%", "").replace("+", "")
+    try:
+        return float(s)
+    except Exception:
+        return float("nan")
+
+
+@dataclass(slots=True)
+class FundQuote:
+    code: str
+    name: str
+    premium: float
+    status: ApplyStatus
+    status_text: str
+
+    @classmethod
+    def from_raw(cls, code: Any, name: Any, premium: Any, status: Any) -> "FundQuote":
+        status_text = "" if status is None else str(status).strip()
+        return cls(
+            code="" if code is None else str(code),
+            name="" if name is None else str(name),
+            premium=parse_percent("" if premium is None else premium),
+            status=ApplyStatus.parse(status_text),
+            status_text=status_text,
+        )
+
+    @property
+    def has_premium(self) -> bool:
+        return not math.isnan(self.premium)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "代码": self.code,
+            "名称": self.name,
+            "T-1溢价率": self.premium if self.has_premium else None,
+            "申购状态": self.status_text,
+        }
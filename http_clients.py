@@ -0,0 +1,178 @@
+"""
+共享 HTTP 客户端注册表
+
+按用途（jisilu / serverchan / deepseek）复用 httpx 客户端，保持长连接，
+避免每次请求重新进行 DNS、TCP 与 TLS 握手。arbitrage-suite 服务在启动时
+调用 start() 预建客户端，关闭时调用 aclose() 释放连接池。
+每个用途一个熔断器（见 circuit_breaker.py），套在客户端的传输层上。
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerTransport, CircuitBreaker
+from metrics import registry as _metrics
+
+logger = logging.getLogger("mcp_server.http")
+
+# 各上游的默认超时（秒），与原先各模块中的写法保持一致
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "jisilu": 20.0,
+    "serverchan": 30.0,
+    "deepseek": 60.0,
+}
+
+
+def _env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+class ClientRegistry:
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        transport: Any = None,
+        breaker_options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            max_connections: 每个客户端的最大连接数
+            max_keepalive_connections: 每个客户端保留的空闲长连接数
+            keepalive_expiry: 空闲长连接的保留秒数
+            http2: 是否启用 HTTP/2（需安装 h2，未安装时自动回退到 HTTP/1.1）
+            transport: 自定义传输层（测试或录制回放时使用），同时用于同步与异步客户端
+            breaker_options: 熔断器参数（见 CircuitBreaker），为 None 时不启用熔断
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("未安装 h2，HTTP/2 已回退为 HTTP/1.1（pip install 'httpx[http2]'）")
+            http2 = False
+        self.http2 = http2
+        self.transport = transport
+        self.breaker_options = breaker_options
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._async: Dict[str, Tuple[httpx.AsyncClient, asyncio.AbstractEventLoop]] = {}
+        self._sync: Dict[str, httpx.Client] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ClientRegistry":
+        transport = None
+        replay_dir = os.getenv("HTTP_REPLAY_DIR")
+        if replay_dir:
+            # 录制 / 回放模式：所有上游请求改走夹具目录
+            from replay_transport import ReplayTransport
+            transport = ReplayTransport(
+                replay_dir,
+                mode=os.getenv("HTTP_REPLAY_MODE", "replay"),
+                latency=float(os.getenv("HTTP_REPLAY_LATENCY", "0")),
+                failure_rate=float(os.getenv("HTTP_REPLAY_FAILURE_RATE", "0")),
+            )
+        breaker_options = None
+        if _env_flag("BREAKER_ENABLED", "1"):
+            breaker_options = {
+                "failure_threshold": int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+                "reset_timeout": float(os.getenv("BREAKER_RESET_TIMEOUT", "30")),
+                "min_timeout": float(os.getenv("BREAKER_MIN_TIMEOUT", "2")),
+                "timeout_percentile": float(os.getenv("BREAKER_TIMEOUT_PERCENTILE", "99")) / 100,
+                "timeout_multiplier": float(os.getenv("BREAKER_TIMEOUT_MULTIPLIER", "3")),
+            }
+        return cls(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+            http2=_env_flag("HTTP2"),
+            transport=transport,
+            breaker_options=breaker_options,
+        )
+
+    def set_transport(self, transport: Any) -> None:
+        # 替换传输层（测试中挂载回放传输），已创建的客户端在下次使用时重建，熔断状态清零
+        self.transport = transport
+        self._async = {}
+        self.close()
+        for breaker in self.breakers.values():
+            breaker.reset()
+
+    def breaker(self, name: str) -> Optional[CircuitBreaker]:
+        if self.breaker_options is None:
+            return None
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            # 原先的固定超时作为自适应超时的上限
+            breaker = CircuitBreaker(name, max_timeout=DEFAULT_TIMEOUTS.get(name, 30.0), **self.breaker_options)
+            self.breakers[name] = breaker
+        return breaker
+
+    def breaker_stats(self) -> Dict[str, Any]:
+        return {name: b.stats() for name, b in self.breakers.items()}
+
+    def _kwargs(self, name: str, is_async: bool) -> Dict[str, Any]:
+        inner = self.transport
+        if inner is None:
+            # 传入自定义传输层后 limits / http2 需要设置在传输层上
+            transport_cls = httpx.AsyncHTTPTransport if is_async else httpx.HTTPTransport
+            inner = transport_cls(limits=self.limits, http2=self.http2)
+        return {
+            "timeout": DEFAULT_TIMEOUTS.get(name, 30.0),
+            # 外层传输记录上游指标，启用熔断时同时负责熔断与自适应超时
+            "transport": BreakerTransport(self.breaker(name), inner, name=name),
+        }
+
+    def async_client(self, name: str) -> httpx.AsyncClient:
+        # 异步客户端与事件循环绑定；循环变化时（例如多次 asyncio.run）重新创建
+        loop = asyncio.get_running_loop()
+        entry = self._async.get(name)
+        if entry is not None and entry[1] is loop and not entry[0].is_closed:
+            return entry[0]
+        client = httpx.AsyncClient(**self._kwargs(name, is_async=True))
+        self._async[name] = (client, loop)
+        return client
+
+    def sync_client(self, name: str) -> httpx.Client:
+        with self._lock:
+            client = self._sync.get(name)
+            if client is None or client.is_closed:
+                client = httpx.Client(**self._kwargs(name, is_async=False))
+                self._sync[name] = client
+            return client
+
+    def start(self, *names: str) -> None:
+        # 预建客户端，需在事件循环中调用
+        for name in names or tuple(DEFAULT_TIMEOUTS):
+            self.async_client(name)
+
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        entries, self._async = self._async, {}
+        for client, client_loop in entries.values():
+            # 其他事件循环创建的客户端无法在当前循环中关闭，直接丢弃
+            if client_loop is loop:
+                await client.aclose()
+        self.close()
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._sync = self._sync, {}
+        for client in clients.values():
+            client.close()
+
+
+registry = ClientRegistry.from_env()
+
+_BREAKER_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+_metrics.gauge("upstream_circuit_state", "上游熔断器状态（0 关闭 / 1 半开 / 2 打开）", ["upstream"]).set_function(
+    lambda: {(name,): _BREAKER_STATE_VALUE[b.state] for name, b in registry.breakers.items()}
+)
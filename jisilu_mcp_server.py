@@ -1,38 +1,36 @@
-import sys
+import os
+import asyncio
 import json
-import re
+import logging
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+
+import premium_history
+import premium_stats
+import qdii_html_parser
+import serializers
+import snapshot_store
+from fund_quote import ApplyStatus, FundQuote
+from metrics import registry as _metrics
+from payload_tracker import PayloadTracker
+from screening import PremiumIndex, Screen
+from snapshot_cache import Snapshot, SnapshotCache
+from source_orchestrator import Source, SourceOrchestrator
+from worker_pool import pool as _pool
 
 try:
     import httpx  # type: ignore
+    from http_clients import registry as _clients
 except Exception:
     httpx = None  # type: ignore
+    _clients = None  # type: ignore
 
-try:
-    from bs4 import BeautifulSoup  # type: ignore
-except Exception:
-    BeautifulSoup = None  # type: ignore
-
-
-try:
-    from mcp.server.fastmcp import FastMCP  # type: ignore
-except Exception:
-    FastMCP = None  # type: ignore
-
+logger = logging.getLogger("mcp_server.jisilu")
 
 URL = "https://www.jisilu.cn/data/qdii/#qdiie"
 
 
-def _to_float_percent(s: str) -> float:
-    # 将百分数字符串转为浮点数（去掉%和+号）
-    s = s.strip().replace("%", "").replace("+", "")
-    try:
-        return float(s)
-    except Exception:
-        return float("nan")
-
-
 def _fetch_html(url: str) -> str:
     # 简单HTTP抓取，优先使用httpx，失败时回退到urllib
     headers = {
@@ -41,10 +39,9 @@ def _fetch_html(url: str) -> str:
         "Accept-Language": "zh-CN,zh;q=0.9",
     }
     if httpx is not None:
-        with httpx.Client(timeout=20) as client:
-            resp = client.get(url, headers=headers)
-            resp.raise_for_status()
-            return resp.text
+        resp = _clients.sync_client("jisilu").get(url, headers=headers)
+        resp.raise_for_status()
+        return resp.text
     import urllib.request
 
     req = urllib.request.Request(url, headers=headers)
@@ -52,196 +49,684 @@ def _fetch_html(url: str) -> str:
         return resp.read().decode("utf-8", errors="ignore")
 
 
-def _parse_with_bs4(html: str) -> List[Dict[str, Any]]:
-    # 使用BeautifulSoup解析表格，提取 T-1溢价率 与 申购状态 等字段
-    try:
-        from lxml import html as lxml_html  # type: ignore
-    except Exception:
-        return []
+def _parse_html(html: str) -> List[FundQuote]:
+    # 页面表格回退解析：单遍流式解析，有 data-name 的单元格直接取值，否则按行文本标签提取
+    return qdii_html_parser.parse_rows(html)
+
+
+async def _fetch_html_rows_async(url: str = URL, deadline: float = 20.0) -> List[FundQuote]:
+    # 流式读取页面响应，边下载边解析，每个 <tr> 结束即得到一行
+    if httpx is None:
+        return await asyncio.to_thread(lambda: _parse_html(_fetch_html(url)))
+    headers = {k: v for k, v in API_HEADERS.items() if k != "Accept"}
+    parser = qdii_html_parser.StreamingRowParser()
+    out: List[FundQuote] = []
+
+    async def consume() -> None:
+        async with _clients.async_client("jisilu").stream("GET", url, headers=headers) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.aiter_bytes():
+                out.extend(parser.feed(chunk))
+        out.extend(parser.close())
+
+    start = time.perf_counter()
     try:
-        tree = lxml_html.fromstring(html)
+        await asyncio.wait_for(consume(), deadline)
     except Exception:
-        return []
-    nodes = tree.xpath('//td[@data-name="apply_status"]/text()')
-    result: List[Dict[str, Any]] = []
-    for txt in nodes:
-        s = str(txt).strip()
-        if s:
-            result.append({"申购状态": s})
-    return result
-
-
-def _parse_with_regex(html: str) -> List[Dict[str, Any]]:
-    # 当表格解析失败时，使用正则从纯文本回退提取核心字段
-    text = re.sub(r"<[^>]+>", " ", html)
-    text = re.sub(r"\s+", " ", text)
-    chunks = re.split(r"(?=\b\d{6}\b)", text)
-    result: List[Dict[str, Any]] = []
-    for chunk in chunks:
-        m_code = re.search(r"\b(\d{6})\b", chunk)
-        if not m_code:
-            continue
-        code = m_code.group(1)
-        m_name = re.search(r"\b\d{6}\b\s*([^\d%\-]{2,}?)\s", chunk)
-        name = m_name.group(1).strip() if m_name else ""
-        m_t1 = re.search(r"T-1溢价率\s*([+\-]?[\d\.]+)%", chunk)
-        t1 = m_t1.group(1) + "%" if m_t1 else ""
-        m_sub = re.search(r"申购状态\s*([\u4e00-\u9fffA-Za-z0-9%]+)", chunk)
-        sub = m_sub.group(1) if m_sub else ""
-        if t1 or sub:
-            result.append({"代码": code, "名称": name, "T-1溢价率": t1, "申购状态": sub})
-    return result
-
-
-def _fetch_api_rows() -> List[Dict[str, Any]]:
-    """从集思录 API 获取数据，包括 QDII 和 LOF 基金"""
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
-        "Referer": "https://www.jisilu.cn/data/qdii/",
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "zh-CN,zh;q=0.9",
-    }
-    out: List[Dict[str, Any]] = []
-    
-    # 1. 获取 QDII 数据
+        # 超时或失败时返回已解析出的行
+        SOURCE_ERRORS.inc(source="html", category="page", reason="error")
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="html")
+    return _count_rows("html", "page", out)
+
+
+API_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Referer": "https://www.jisilu.cn/data/qdii/",
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "zh-CN,zh;q=0.9",
+}
+
+# 单个数据源（QDII 某一分类或 LOF 列表）的最长等待时间，超时的来源直接丢弃
+SOURCE_DEADLINE = float(os.getenv("JISILU_SOURCE_DEADLINE", "20"))
+# 分页抓取时每个来源同时进行的请求数，以及单个来源最多抓取的页数
+PAGE_CONCURRENCY = int(os.getenv("JISILU_PAGE_CONCURRENCY", "4"))
+MAX_PAGES = int(os.getenv("JISILU_MAX_PAGES", "50"))
+# akshare 回退数据源：四个数据集并发调用，每个调用的最长等待时间
+AK_CALL_TIMEOUT = float(os.getenv("JISILU_AK_CALL_TIMEOUT", "20"))
+
+
+# 抓取流水线指标：各阶段耗时、按来源 / 分类的行数与错误数
+STAGE_SECONDS = _metrics.histogram("qdii_stage_seconds", "抓取流水线各阶段耗时", ["stage"])
+ROWS_FETCHED = _metrics.counter("qdii_rows_fetched_total", "抓取到的行数", ["source", "category"])
+ROWS_DROPPED = _metrics.counter("qdii_rows_dropped_total", "缺少代码或溢价率、无法参与筛选的行数", ["source", "category"])
+SOURCE_ERRORS = _metrics.counter("qdii_source_errors_total", "被丢弃的分类 / 分页数", ["source", "category", "reason"])
+SCREEN_ROWS = _metrics.counter("qdii_screen_rows_total", "筛选结果行数（matched 命中 / filtered 被过滤）", ["result"])
+
+
+def _count_rows(source: str, category: str, rows: List[FundQuote]) -> List[FundQuote]:
+    ROWS_FETCHED.inc(len(rows), source=source, category=category)
+    dropped = sum(1 for q in rows if not q.code or not q.has_premium)
+    if dropped:
+        ROWS_DROPPED.inc(dropped, source=source, category=category)
+    return rows
+
+
+def _api_sources() -> List[Tuple[str, str, Dict[str, str]]]:
+    # 返回 (来源名, URL, 第一页查询参数) 列表：QDII 的 E/C/A 三个分类 + LOF 列表
+    ts = f"LST___t={int(time.time()*1000)}"
+    sources: List[Tuple[str, str, Dict[str, str]]] = []
     for cat in ["E", "C", "A"]:
-        url = f"https://www.jisilu.cn/data/qdii/qdii_list/{cat}"
-        params = {"___jsl": f"LST___t={int(time.time()*1000)}", "rp": "22"}
+        params = {"___jsl": ts, "rp": "22", "page": "1"}
         if cat in ("E", "A"):
             params.update({"only_lof": "y", "only_etf": "y"})
+        sources.append((f"qdii_{cat}", f"https://www.jisilu.cn/data/qdii/qdii_list/{cat}", params))
+    sources.append(("lof", "https://www.jisilu.cn/data/lof/index_lof_list/", {"___jsl": ts, "rp": "25", "page": "1"}))
+    return sources
+
+
+def _rows_from_cells(cells: List[Any]) -> List[FundQuote]:
+    # (代码, 名称, 溢价率, 申购状态) 元组转为 FundQuote
+    start = time.perf_counter()
+    out = [FundQuote.from_raw(*cell) for cell in cells]
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="parse_api")
+    return out
+
+
+def _rows_from_payload(data: Any) -> List[FundQuote]:
+    # 将集思录列表接口返回的 rows[].cell 转为 FundQuote；LOF 与 QDII 字段名一致
+    if not isinstance(data, dict):
+        return []
+    return _rows_from_cells(serializers.fund_cells(data)[0])
+
+
+def _pages(total: Any, page_size: int) -> int:
+    # 以第一页实际行数作为页大小，服务端忽略 rp 一次返回全部时即为 1 页
+    try:
+        total = int(total or 0)
+    except (TypeError, ValueError):
+        return 1
+    if page_size <= 0 or total <= page_size:
+        return 1
+    return -(-total // page_size)
+
+
+def _capped_pages(pages: int, source: str, category: str) -> int:
+    # 超过 MAX_PAGES 的分页不再抓取，记入 reason="truncated" 并记录日志，缺失的行可见
+    if pages <= MAX_PAGES:
+        return pages
+    SOURCE_ERRORS.inc(source=source, category=category, reason="truncated")
+    logger.warning(f"{source}/{category} 共 {pages} 页，只抓取前 {MAX_PAGES} 页（JISILU_MAX_PAGES）")
+    return MAX_PAGES
+
+
+def _page_count(data: Any) -> int:
+    # 列表接口返回 {"page": 1, "rows": [...], "total": 总行数}
+    if not isinstance(data, dict):
+        return 1
+    return _pages(data.get("total"), len(data.get("rows") or []))
+
+
+def _fetch_api_rows_urllib() -> List[FundQuote]:
+    # 未安装 httpx 时的顺序抓取回退
+    import urllib.parse
+    import urllib.request
+
+    def get(url: str, params: Dict[str, str]) -> Any:
+        q = urllib.parse.urlencode(params)
+        req = urllib.request.Request(url + "?" + q, headers=API_HEADERS)
+        with urllib.request.urlopen(req, timeout=SOURCE_DEADLINE) as f:
+            return serializers.loads(f.read())
+
+    out: List[FundQuote] = []
+    for name, url, params in _api_sources():
         try:
-            data = None
-            if httpx is not None:
-                resp = httpx.get(url, params=params, headers=headers, timeout=20)
-                resp.raise_for_status()
-                data = resp.json()
-            else:
-                import urllib.parse
-                import urllib.request
-                q = urllib.parse.urlencode(params)
-                req = urllib.request.Request(url + "?" + q, headers=headers)
-                with urllib.request.urlopen(req, timeout=20) as f:
-                    data = json.loads(f.read().decode("utf-8", errors="ignore"))
+            data = get(url, params)
         except Exception:
-            data = None
-        if not isinstance(data, dict):
             continue
-        for row in data.get("rows", []):
-            cell = row.get("cell", {})
-            out.append({
-                "代码": str(cell.get("fund_id", "")),
-                "名称": str(cell.get("fund_nm", "")),
-                "T-1溢价率": str(cell.get("discount_rt", "")),
-                "申购状态": str(cell.get("apply_status", "")),
-            })
-    
-    # 2. 获取 LOF 数据
-    lof_url = "https://www.jisilu.cn/data/lof/index_lof_list/"
-    lof_params = {
-        "___jsl": f"LST___t={int(time.time()*1000)}",
-        "rp": "25",
-        "page": "1"
-    }
-    try:
-        data = None
-        if httpx is not None:
-            resp = httpx.get(lof_url, params=lof_params, headers=headers, timeout=20)
-            resp.raise_for_status()
-            data = resp.json()
-        else:
-            import urllib.parse
-            import urllib.request
-            q = urllib.parse.urlencode(lof_params)
-            req = urllib.request.Request(lof_url + "?" + q, headers=headers)
-            with urllib.request.urlopen(req, timeout=20) as f:
-                data = json.loads(f.read().decode("utf-8", errors="ignore"))
-        
-        if isinstance(data, dict):
-            for row in data.get("rows", []):
-                cell = row.get("cell", {})
-                # LOF 数据格式可能与 QDII 略有不同，需要适配
-                out.append({
-                    "代码": str(cell.get("fund_id", "")),
-                    "名称": str(cell.get("fund_nm", "")),
-                    "T-1溢价率": str(cell.get("discount_rt", "")),
-                    "申购状态": str(cell.get("apply_status", "")),
-                })
-    except Exception as e:
-        # LOF 数据获取失败时不影响整体流程，记录错误但继续
-        pass
-    
+        out.extend(_rows_from_payload(data))
+        for page in range(2, _capped_pages(_page_count(data), "jisilu_api", name) + 1):
+            try:
+                out.extend(_rows_from_payload(get(url, {**params, "page": str(page)})))
+            except Exception:
+                continue
     return out
 
 
-def _fetch_ak_rows() -> List[Dict[str, Any]]:
+def _decode_page(content: bytes) -> Tuple[List[FundQuote], int]:
+    # 只解码用到的字段（见 serializers.decode_fund_page）
+    cells, total = serializers.decode_fund_page(content)
+    return _rows_from_cells(cells), _pages(total, len(cells))
+
+
+# 各分类每一页上次响应的摘要与解码结果；内容未变化时跳过解码
+_payloads = PayloadTracker()
+
+
+async def _get_page_async(client: Any, url: str, params: Dict[str, str], category: str = "") -> Tuple[List[FundQuote], int, bool]:
+    """
+    返回 (该页的行, 总页数, 是否与上次相同)
+
+    带上次的 ETag / Last-Modified 发送条件请求；304 或内容摘要相同时复用上次的解码结果，
+    否则在工作线程池中解码 JSON 并构造行
+    """
+    key = _payloads.key(url, params)
+    resp = await client.get(url, params=params, headers={**API_HEADERS, **_payloads.request_headers(key)})
+    if resp.status_code != 304:
+        # httpx 对 3xx 同样抛出异常，304 由变化检测处理
+        resp.raise_for_status()
+    hashed, previous = _payloads.lookup(key, resp.status_code, resp.content, category)
+    if hashed is None:
+        # 304 但上次的结果已被淘汰：按未命中处理，不带条件头重新请求
+        resp = await client.get(url, params=params, headers=API_HEADERS)
+        resp.raise_for_status()
+        hashed, previous = _payloads.lookup(key, resp.status_code, resp.content, category)
+    if previous is not None:
+        rows, pages = previous
+        return rows, pages, True
+    rows, pages = await _pool.run(_decode_page, resp.content, admit=False)
+    _payloads.store(key, hashed, (rows, pages), resp.headers)
+    return rows, pages, False
+
+
+async def _produce_source_rows(client: Any, url: str, params: Dict[str, str], queue: "asyncio.Queue[List[FundQuote]]", category: str = "") -> bool:
+    # 先取第一页得到总页数，其余页在信号量限制下并发抓取，每页完成即放入队列；
+    # 返回该分类的全部分页是否都与上次相同
+    rows, pages, unchanged = await _get_page_async(client, url, params, category)
+    await queue.put(_count_rows("jisilu_api", category, rows))
+    pages = _capped_pages(pages, "jisilu_api", category)
+    if pages <= 1:
+        return unchanged
+    sem = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+    async def fetch_page(page: int) -> Tuple[List[FundQuote], bool]:
+        async with sem:
+            rows, _, same = await _get_page_async(client, url, {**params, "page": str(page)}, category)
+            return rows, same
+
+    tasks = [asyncio.ensure_future(fetch_page(p)) for p in range(2, pages + 1)]
     try:
-        import akshare as ak  # type: ignore
-    except Exception:
-        return []
-    names = [
-        "qdii_e_index_jsl",
-        "qdii_e_comm_jsl",
-        "qdii_c_jsl",
-        "qdii_a_jsl",
-    ]
-    datasets: List[Any] = []
-    for n in names:
+        for fut in asyncio.as_completed(tasks):
+            try:
+                rows, same = await fut
+            except Exception:
+                # 单页失败只丢弃该页
+                SOURCE_ERRORS.inc(source="jisilu_api", category=category, reason="page_error")
+                unchanged = False
+                continue
+            unchanged = unchanged and same
+            await queue.put(_count_rows("jisilu_api", category, rows))
+    finally:
+        for t in tasks:
+            t.cancel()
+    return unchanged
+
+
+async def _iter_api_rows_async(client: Any = None, deadline: float = SOURCE_DEADLINE, changes: Optional[Dict[str, bool]] = None) -> AsyncIterator[List[FundQuote]]:
+    """
+    并发抓取集思录 QDII(E/C/A) 与 LOF 列表的所有分页，按页到达顺序逐批产出行
+
+    所有来源共用注册表中的 jisilu 长连接客户端；每个来源（含其全部分页）单独计时，
+    超时或失败的来源只丢弃尚未到达的页，已到达的行照常产出（部分结果）。
+
+    Args:
+        client: 异步 HTTP 客户端，默认使用注册表中的 jisilu 客户端
+        deadline: 每个来源的超时秒数
+        changes: 传入时按分类写入本轮是否与上次相同（失败的分类为 False）
+    """
+    if client is None:
+        client = _clients.async_client("jisilu")
+    queue: "asyncio.Queue[List[FundQuote]]" = asyncio.Queue()
+
+    async def run_source(name: str, url: str, params: Dict[str, str]) -> None:
+        unchanged = False
         try:
-            fn = getattr(ak, n, None)
-            if callable(fn):
-                df = fn()
-                datasets.append(df)
+            unchanged = await asyncio.wait_for(_produce_source_rows(client, url, params, queue, name), deadline)
+        except asyncio.TimeoutError:
+            SOURCE_ERRORS.inc(source="jisilu_api", category=name, reason="timeout")
         except Exception:
+            SOURCE_ERRORS.inc(source="jisilu_api", category=name, reason="error")
+        _payloads.mark(name, unchanged)
+        if changes is not None:
+            changes[name] = unchanged
+
+    producers = [asyncio.ensure_future(run_source(name, url, params)) for name, url, params in _api_sources()]
+    done = asyncio.ensure_future(asyncio.gather(*producers))
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait([getter, done], return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+                continue
+            getter.cancel()
+            while not queue.empty():
+                yield queue.get_nowait()
+            break
+    finally:
+        for t in producers:
+            t.cancel()
+        done.cancel()
+
+
+# 上一轮合并后的行，所有分类都未变化时原样返回
+_last_api_rows: Optional[List[FundQuote]] = None
+
+
+async def _fetch_api_rows_async(client: Any = None, deadline: float = SOURCE_DEADLINE) -> List[FundQuote]:
+    """并发获取集思录 QDII 与 LOF 的全部分页，返回合并后的行"""
+    global _last_api_rows
+    if httpx is None:
+        return await asyncio.to_thread(_fetch_api_rows_urllib)
+    out: List[FundQuote] = []
+    changes: Dict[str, bool] = {}
+    async for rows in _iter_api_rows_async(client, deadline, changes):
+        out.extend(rows)
+    if changes and all(changes.values()) and _last_api_rows is not None and len(_last_api_rows) == len(out):
+        # 所有分类都未变化：返回上一轮的同一个列表，快照缓存据此保留原版本，不重复通知监听器
+        return _last_api_rows
+    _last_api_rows = out
+    return out
+
+
+def _fetch_api_rows() -> List[FundQuote]:
+    """从集思录 API 获取数据，包括 QDII 和 LOF 基金（同步入口，不可在事件循环内调用）"""
+    if httpx is None:
+        return _fetch_api_rows_urllib()
+    return asyncio.run(_fetch_api_rows_async())
+
+
+AK_DATASETS = ("qdii_e_index_jsl", "qdii_e_comm_jsl", "qdii_c_jsl", "qdii_a_jsl")
+
+# 统一列名 -> 各版本 akshare 可能使用的原列名（按优先顺序）
+AK_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "code": ("代码", "fund_id"),
+    "name": ("名称", "fund_nm"),
+    "premium": ("T-1溢价率", "T-1 溢价率", "discount_rt"),
+    "status": ("申购状态", "apply_status"),
+}
+
+# 每个数据集调用一个线程；超时的调用在线程中跑完，线程数限制其堆积
+_ak_call_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _ak_calls() -> ThreadPoolExecutor:
+    global _ak_call_executor
+    if _ak_call_executor is None:
+        _ak_call_executor = ThreadPoolExecutor(max_workers=len(AK_DATASETS), thread_name_prefix="akshare-call")
+    return _ak_call_executor
+
+
+def _call_ak_datasets(ak: Any, timeout: Optional[float] = None) -> List[Tuple[str, Any]]:
+    # 并发调用各数据集，返回按 AK_DATASETS 顺序排列的 (数据集名, DataFrame)；失败或超时（默认 AK_CALL_TIMEOUT 秒）的数据集跳过
+    from concurrent.futures import wait
+
+    futures = {}
+    for name in AK_DATASETS:
+        fn = getattr(ak, name, None)
+        if callable(fn):
+            futures[name] = _ak_calls().submit(fn)
+    wait(futures.values(), timeout=AK_CALL_TIMEOUT if timeout is None else timeout)
+    datasets: List[Tuple[str, Any]] = []
+    for name, fut in futures.items():
+        if not fut.done():
+            fut.cancel()
+            SOURCE_ERRORS.inc(source="akshare", category=name, reason="timeout")
             continue
-    out: List[Dict[str, Any]] = []
-    for df in datasets:
         try:
-            for _, r in df.iterrows():
-                out.append({
-                    "代码": str(r.get("代码", r.get("fund_id", ""))),
-                    "名称": str(r.get("名称", r.get("fund_nm", ""))),
-                    "T-1溢价率": str(r.get("T-1溢价率", r.get("T-1 溢价率", r.get("discount_rt", "")))),
-                    "申购状态": str(r.get("申购状态", r.get("apply_status", ""))),
-                })
+            datasets.append((name, fut.result()))
         except Exception:
-            continue
-    return out
+            SOURCE_ERRORS.inc(source="akshare", category=name, reason="error")
+    return datasets
+
+
+def _normalize_ak_frame(df: Any) -> Any:
+    # 每个 DataFrame 只解析一次列名：选取并重命名为统一列名，缺失的列补空字符串
+    mapping: Dict[str, str] = {}
+    for target, candidates in AK_COLUMNS.items():
+        source = next((c for c in candidates if c in df.columns), None)
+        if source is not None:
+            mapping[source] = target
+    out = df[list(mapping)].rename(columns=mapping)
+    for target in AK_COLUMNS:
+        if target not in out.columns:
+            out[target] = ""
+    return out[list(AK_COLUMNS)]
 
-def _fetch_data() -> List[Dict[str, Any]]:
+
+def _fetch_ak_rows(ak: Any = None) -> List[FundQuote]:
+    """
+    akshare 回退数据源：并发调用四个数据集，列名统一后合并为一个 DataFrame 再构造 FundQuote
+
+    Args:
+        ak: akshare 模块（基准测试传入桩模块），默认导入 akshare
+    """
+    if ak is None:
+        try:
+            import akshare as ak  # type: ignore
+        except Exception:
+            return []
+    datasets = _call_ak_datasets(ak)
+    if not datasets:
+        return []
+    import pandas as pd  # type: ignore
+
+    start = time.perf_counter()
+    frames, names = [], []
+    for name, df in datasets:
+        try:
+            frames.append(_normalize_ak_frame(df))
+            names.append(name)
+        except Exception:
+            SOURCE_ERRORS.inc(source="akshare", category=name, reason="parse_error")
+    if not frames:
+        return []
+    merged = pd.concat(frames, ignore_index=True)
+    rows = list(map(
+        FundQuote.from_raw,
+        merged["code"].tolist(),
+        merged["name"].tolist(),
+        merged["premium"].tolist(),
+        merged["status"].tolist(),
+    ))
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="parse_akshare")
+    # 按各数据集的行数切分，分别计数
+    offset = 0
+    for name, frame in zip(names, frames):
+        _count_rows("akshare", name, rows[offset:offset + len(frame)])
+        offset += len(frame)
+    return rows
+
+# akshare 为阻塞调用，放到独立线程池中执行；被对冲取消的调用会在线程中跑完，线程数限制其堆积
+_ak_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="akshare")
+
+
+async def _fetch_ak_rows_async() -> List[FundQuote]:
+    if _pool.processes > 0:
+        # 配置了进程池时 akshare 与 pandas 解析在子进程中执行，不与事件循环争用 GIL（子进程内的埋点不回传）
+        return await _pool.run(_fetch_ak_rows, cpu=True, admit=False)
+    return await asyncio.get_running_loop().run_in_executor(_ak_executor, _fetch_ak_rows)
+
+
+# 集思录 API 与 akshare 由编排器并行 / 对冲请求，按历史延迟与成功率决定先后
+_orchestrator = SourceOrchestrator(
+    [
+        Source("jisilu_api", _fetch_api_rows_async, timeout=SOURCE_DEADLINE + 5),
+        Source("akshare", _fetch_ak_rows_async, timeout=float(os.getenv("JISILU_AK_DEADLINE", "60"))),
+    ],
+    mode=os.getenv("JISILU_SOURCE_MODE", "hedged"),
+    hedge_percentile=float(os.getenv("JISILU_HEDGE_PERCENTILE", "90")) / 100,
+    hedge_delay=float(os.getenv("JISILU_HEDGE_DELAY", "3")),
+    hedge_min_delay=float(os.getenv("JISILU_HEDGE_MIN_DELAY", "0.5")),
+    merge=os.getenv("JISILU_SOURCE_MERGE", "0").lower() in ("1", "true", "yes"),
+)
+
+
+def source_stats() -> Dict[str, Any]:
+    return {**_orchestrator.stats(), "payloads": _payloads.stats()}
+
+
+def payload_unchanged(category: str) -> bool:
+    # 分类（qdii_E / qdii_C / qdii_A / lof）最近一轮抓取的全部分页是否与上一轮相同
+    return _payloads.unchanged(category)
+
+
+def _fetch_data() -> List[FundQuote]:
+    if httpx is not None:
+        return asyncio.run(_fetch_data_async())
     rows = _fetch_api_rows()
     if rows:
         return rows
     return _fetch_ak_rows()
 
 
-def qdii_candidates(threshold: float = 2.0) -> List[Dict[str, Any]]:
+async def _fetch_data_async() -> List[FundQuote]:
+    with STAGE_SECONDS.time(stage="fetch"):
+        rows = await _orchestrator.fetch()
+        if rows:
+            return rows
+        # 最后回退到页面表格
+        return await _fetch_html_rows_async()
+
+
+_EXCLUDED_STATUS = (ApplyStatus.SUSPENDED, ApplyStatus.OPEN)
+
+
+def _filter_candidates(rows: List[FundQuote], threshold: float) -> List[FundQuote]:
     # 过滤逻辑：T-1溢价率 > threshold 且 申购状态 ≠ "暂停申购" 且 申购状态 ≠ "开放申购"
-    rows = _fetch_data()
-    out: List[Dict[str, Any]] = []
-    for r in rows:
-        p = _to_float_percent(str(r.get("T-1溢价率", "")))
-        status = str(r.get("申购状态", ""))
-        # if p == p and p > threshold and status.startswith("限"):
-        if p == p and p > threshold and status != "暂停申购" and status != "开放申购":
-            out.append({
-                "代码": r.get("代码", ""),
-                "名称": r.get("名称", ""),
-                "T-1溢价率": p,
-                "申购状态": status,
-            })
-    return out
+    # 溢价率在抓取时已解析为 float，nan 与任何阈值比较均为 False
+    return [q for q in rows if q.premium > threshold and q.status not in _EXCLUDED_STATUS]
+
+
+def qdii_candidates(threshold: float = 2.0) -> List[FundQuote]:
+    return _filter_candidates(_fetch_data(), threshold)
+
+
+# 集思录数据几分钟才更新一次，进程内所有调用共享同一份快照
+def _upstream_open() -> bool:
+    # 集思录熔断器打开时不等待抓取，直接返回已有快照
+    breaker = _clients.breaker("jisilu") if _clients is not None else None
+    return breaker is not None and breaker.state == "open"
+
+
+# 多副本部署（配置 SNAPSHOT_STORE）时只有 leader 访问上游，其他副本读取共享存储
+shared = snapshot_store.from_env(_fetch_data_async)
+
+_snapshot_cache: SnapshotCache[List[FundQuote]] = SnapshotCache(
+    shared.fetch if shared is not None else _fetch_data_async,
+    ttl=float(os.getenv("QDII_CACHE_TTL", "60")),
+    max_stale=float(os.getenv("QDII_CACHE_MAX_STALE", "600")),
+    fast_fail=_upstream_open,
+    # 历史写盘与滚动统计放到工作线程池，不占用事件循环
+    run_listeners=lambda fn, snap: _pool.run(fn, snap, admit=False),
+)
+
+# 每个新快照追加写入按日分区的溢价率历史
+history = premium_history.from_env()
+
+
+def _record_history(snap: Snapshot[List[FundQuote]]) -> None:
+    # 多副本时只由 leader 写入，避免共享卷上的历史重复
+    if shared is None or shared.is_leader:
+        history.on_snapshot(snap)
+
+
+_snapshot_cache.add_listener(_record_history)
+
+
+def _premium_index(snap: Snapshot[List[FundQuote]]) -> PremiumIndex:
+    # 快照的溢价率有序索引，新快照产生时由监听器预先构建，之后的查询直接复用
+    with STAGE_SECONDS.time(stage="index"):
+        return snap.memo("index", lambda: PremiumIndex(snap.rows))
+
+
+# 新快照在工作线程中预先构建溢价率索引，查询时不再占用事件循环
+_snapshot_cache.add_listener(_premium_index)
+
+# 逐基金的滚动统计（EWMA、滚动最高、连续超阈值天数），随快照增量更新
+rolling_stats = premium_stats.from_env()
+_snapshot_cache.add_listener(rolling_stats.on_snapshot)
+
+
+def cache_stats() -> Dict[str, Any]:
+    return _snapshot_cache.stats()
+
+
+def _snapshot_gauges() -> Dict[Tuple[str, ...], float]:
+    snap = _snapshot_cache.snapshot
+    if snap is None:
+        return {}
+    return {("age",): snap.age, ("rows",): len(snap.rows), ("version",): snap.version}
+
+
+def _cache_counters() -> Dict[Tuple[str, ...], float]:
+    stats = _snapshot_cache.stats()
+    return {("hit",): stats["hits"], ("stale_hit",): stats["stale_hits"], ("miss",): stats["misses"], ("error",): stats["errors"]}
+
+
+_metrics.gauge("qdii_snapshot", "当前快照的年龄（秒）、行数与版本号", ["field"]).set_function(_snapshot_gauges)
+_metrics.counter("qdii_cache_requests_total", "快照缓存请求与刷新失败数", ["result"]).set_function(_cache_counters)
+
+
+def freshness(snap: Optional[Snapshot] = None) -> Dict[str, Any]:
+    """
+    快照的新旧程度与集思录熔断状态，供 MCP 工具标记旧数据
+
+    stale 只在上游熔断或快照已超出 ttl + max_stale 时为 True；正常的 stale-while-revalidate 命中不算旧数据
+
+    Args:
+        snap: 实际返回给调用方的快照，默认取当前快照
+    """
+    if snap is None:
+        snap = _snapshot_cache.snapshot
+    breaker = _clients.breaker("jisilu") if _clients is not None else None
+    upstream = breaker.state if breaker is not None else "closed"
+    age = snap.age if snap is not None else None
+    return {
+        "stale": age is None or upstream == "open" or age >= _snapshot_cache.ttl + _snapshot_cache.max_stale,
+        "age": round(age, 1) if age is not None else None,
+        "upstream": upstream,
+        "retry_after": breaker.retry_after() if breaker is not None else None,
+    }
+
+
+def add_snapshot_listener(listener: Any) -> None:
+    # 新快照生成后调用 listener(snapshot)，在工作线程池中执行
+    _snapshot_cache.add_listener(listener)
+
+
+def start_shared() -> None:
+    # 在服务的事件循环中启动共享快照同步（续租、leader 刷新、follower 监视新版本）
+    if shared is not None:
+        shared.start(_snapshot_cache)
+
+
+async def stop_shared() -> None:
+    if shared is not None:
+        await shared.stop()
+
+
+def shared_stats() -> Dict[str, Any]:
+    return shared.stats() if shared is not None else {"enabled": False}
+
+
+async def snapshot_async() -> Snapshot[List[FundQuote]]:
+    # 返回当前快照（含全部基金，未过滤），供轮询等内部组件使用
+    return await _snapshot_cache.get()
+
+
+def premium_history_of(code: str, start: str = "", end: str = "") -> List[Dict[str, Any]]:
+    """
+    查询单只基金的历史溢价率，只读取时间范围覆盖的日分区
+
+    Args:
+        code: 基金代码
+        start: 起始时间，默认 7 天前
+        end: 结束时间，默认当前时间
+    """
+    t_end = premium_history.parse_time(end, end=True) if end else time.time()
+    t_start = premium_history.parse_time(start) if start else t_end - 7 * 86400
+    return history.history(code, t_start, t_end)
+
+
+async def qdii_candidates_async(threshold: float = 2.0) -> List[FundQuote]:
+    return (await qdii_screens_async([threshold]))[0]
+
+
+async def qdii_screens_async(thresholds: List[float]) -> List[List[FundQuote]]:
+    # 多个阈值在同一份快照的溢价率索引上完成，每个阈值一次二分
+    return _screen_snapshot(await _snapshot_cache.get(), thresholds)
+
+
+def _screen_snapshot(snap: Snapshot[List[FundQuote]], thresholds: List[float]) -> List[List[FundQuote]]:
+    index = _premium_index(snap)
+    with STAGE_SECONDS.time(stage="screen"):
+        results = index.screen_many([Screen(t) for t in thresholds])
+    for matched in results:
+        SCREEN_ROWS.inc(len(matched), result="matched")
+        SCREEN_ROWS.inc(len(snap.rows) - len(matched), result="filtered")
+    return results
+
+
+async def premium_index_async() -> Tuple[Snapshot[List[FundQuote]], PremiumIndex]:
+    # 当前快照及其溢价率索引，供 Top N 与区间计数查询
+    snap = await _snapshot_cache.get()
+    return snap, _premium_index(snap)
+
+
+# 每个快照最多缓存的已编码响应数（不同阈值各一份）
+ENCODED_CACHE_MAX = 64
+ENCODED_RESPONSES = _metrics.counter("qdii_encoded_responses_total", "候选列表编码结果的缓存命中（hit / miss）", ["result"])
+
+
+async def qdii_candidates_json(threshold: float = 2.0) -> Tuple[int, str, Dict[str, Any]]:
+    """
+    返回 (候选基金数, 中文键字典列表的 JSON 文本, 所返回快照的 freshness())
+
+    编码结果随快照缓存（按阈值），快照版本不变时重复调用直接返回，不再筛选与序列化
+    """
+    snap = await _snapshot_cache.get()
+    # 新旧程度取自实际返回的快照，后台刷新可能已替换 _snapshot_cache.snapshot
+    fresh = freshness(snap)
+    encoded: Dict[float, Tuple[int, str]] = snap.memo("encoded", dict)
+    cached = encoded.get(threshold)
+    if cached is not None:
+        ENCODED_RESPONSES.inc(result="hit")
+        return cached + (fresh,)
+    ENCODED_RESPONSES.inc(result="miss")
+    matched = _screen_snapshot(snap, [threshold])[0]
+    with STAGE_SECONDS.time(stage="encode"):
+        # 仅在 MCP 边界把 FundQuote 渲染为中文键字典
+        result = (len(matched), serializers.dumps([q.to_dict() for q in matched]))
+    if len(encoded) < ENCODED_CACHE_MAX:
+        encoded[threshold] = result
+    return result + (fresh,)
+
+
+def _import_akshare() -> float:
+    start = time.perf_counter()
+    try:
+        import akshare  # type: ignore  # noqa: F401
+    except Exception:
+        pass
+    return time.perf_counter() - start
+
+
+def warmup() -> Dict[str, float]:
+    """
+    预热首次调用才会用到的重模块（服务开始监听后在后台调用）
+
+    akshare 会连带导入 pandas，耗时一秒以上；在 akshare 线程池中导入，不占用事件循环。
+    """
+    return {"akshare": round(_ak_executor.submit(_import_akshare).result(), 3)}
+
+
+# MCP工具：返回满足条件的QDII基金列表
+async def fetch_qdii_candidates(threshold: float = 2.0) -> List[Dict[str, Any]]:
+    return [q.to_dict() for q in await qdii_candidates_async(threshold)]
+
+
+_server = None
+
+
+def build_server():
+    """单独运行本模块时才创建 FastMCP 实例；作为 mcp_server 的依赖导入时不会加载 MCP SDK"""
+    global _server
+    if _server is None:
+        from mcp.server.fastmcp import FastMCP  # type: ignore
+        _server = FastMCP("jisilu-qdii")
+        _server.tool()(fetch_qdii_candidates)
+    return _server
 
-mcp = FastMCP("jisilu-qdii") if FastMCP is not None else None
 
-if mcp is not None:
-    # MCP工具：返回满足条件的QDII基金列表
-    @mcp.tool()
-    def fetch_qdii_candidates(threshold: float = 2.0) -> List[Dict[str, Any]]:
-        return qdii_candidates(threshold)
+def __getattr__(name: str) -> Any:
+    # 兼容原来的模块属性 mcp
+    if name == "mcp":
+        return build_server()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
     res = qdii_candidates(2.0)
-    print(json.dumps(res, ensure_ascii=False, indent=2))
+    print(json.dumps([q.to_dict() for q in res], ensure_ascii=False, indent=2))
 # MCP服务器：抓取集思录QDII页面数据，筛选满足溢价与申购条件的基金
 # 提供工具 fetch_qdii_candidates 供外部通过MCP调用
\ No newline at end of file
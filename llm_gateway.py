@@ -0,0 +1,351 @@
+"""
+LLM 网关：DeepSeek（OpenAI 兼容接口）补全请求的缓存、并发控制与去重
+
+- 按请求内容（模型、消息、参数）的哈希缓存响应到磁盘，带 TTL，超过条目上限时按最近使用时间淘汰
+- 相同请求同时在途时只发送一次，其余调用等待同一结果
+- 异步批量发送（chat_many），同时在途的请求数有上限
+- summarize_candidates：候选基金集合（代码、溢价率、申购状态）与上次总结时相同则直接返回上次结果，不调用 LLM
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from fund_quote import FundQuote
+from http_clients import registry as _clients
+from metrics import registry as _metrics
+
+logger = logging.getLogger("mcp_server.llm")
+
+DEFAULT_BASE_URL = "https://api.deepseek.com/v1"
+
+LLM_REQUESTS = _metrics.counter("llm_requests_total", "LLM 请求数，按结果分类（cache_hit / coalesced / sent / skipped / error）", ["result"])
+LLM_SECONDS = _metrics.histogram("llm_request_seconds", "实际发送到 LLM 的请求耗时")
+
+SUMMARY_SYSTEM = "你是一名基金套利分析助手。根据给出的 QDII/LOF 溢价候选列表，用简短的中文总结溢价最高的基金、申购限制与值得关注的变化。"
+
+
+def request_key(payload: Dict[str, Any]) -> str:
+    # 规范化 JSON（键排序、无多余空白）的 SHA-256，作为缓存键
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def candidates_fingerprint(quotes: Sequence[FundQuote]) -> str:
+    # 候选集合的指纹：代码、两位小数的溢价率与申购状态，与顺序无关
+    items = sorted((q.code, round(q.premium, 2) if q.has_premium else None, q.status_text) for q in quotes)
+    return request_key({"candidates": items})
+
+
+def message_content(response: Dict[str, Any]) -> str:
+    try:
+        return str(response.get("choices", [{}])[0].get("message", {}).get("content", ""))
+    except Exception:
+        return ""
+
+
+class ResponseCache:
+    def __init__(self, root: "str | Path", ttl: float = 86400.0, max_entries: int = 1000):
+        """
+        Args:
+            root: 缓存目录，每个响应一个文件 <root>/<键前两位>/<键>.json
+            ttl: 响应的有效秒数，0 表示不缓存
+            max_entries: 条目上限，超过时删除最久未使用的条目
+        """
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._count: Optional[int] = None
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _entries(self) -> List[Path]:
+        if not self.root.exists():
+            return []
+        return [p for p in self.root.glob("*/*.json")]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._stats["misses"] += 1
+            return None
+        if time.time() - float(data.get("created", 0)) >= self.ttl:
+            self._stats["expired"] += 1
+            self._remove(path)
+            return None
+        # 以文件修改时间记录最近使用，用于 LRU 淘汰
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._stats["hits"] += 1
+        return data.get("response")
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"created": time.time(), "response": response}, ensure_ascii=False), encoding="utf-8")
+        existed = path.exists()
+        # 先写临时文件再替换，其他进程不会读到写了一半的条目
+        os.replace(tmp, path)
+        with self._lock:
+            if self._count is None:
+                self._count = len(self._entries())
+            elif not existed:
+                self._count += 1
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _remove(self, path: Path) -> None:
+        try:
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            if self._count is not None:
+                self._count -= 1
+
+    def _evict(self) -> None:
+        # 调用方持有锁；一次淘汰到上限的 90%，避免每次写入都扫描目录
+        entries = []
+        for p in self._entries():
+            try:
+                entries.append((p.stat().st_mtime, p))
+            except OSError:
+                continue
+        entries.sort()
+        target = int(self.max_entries * 0.9)
+        for _, p in entries[: max(0, len(entries) - target)]:
+            try:
+                p.unlink()
+                self._stats["evicted"] += 1
+            except OSError:
+                pass
+        self._count = min(len(entries), target)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"root": str(self.root), "ttl": self.ttl, "max_entries": self.max_entries, "entries": self._count, **self._stats}
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        api_key: Callable[[], Optional[str]],
+        cache: ResponseCache,
+        base_url: str = DEFAULT_BASE_URL,
+        max_concurrency: int = 4,
+        state_path: Optional["str | Path"] = None,
+    ):
+        """
+        Args:
+            api_key: 返回 API Key 的函数（每次发送时调用，便于读取最新配置）
+            cache: 响应缓存
+            base_url: OpenAI 兼容接口地址，本地测试时可指向桩服务
+            max_concurrency: 同时发送到 LLM 的请求数上限
+            state_path: 保存上次候选总结（指纹与结果）的文件，重启后仍可跳过未变化的总结
+        """
+        self._api_key = api_key
+        self.cache = cache
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.state_path = Path(state_path) if state_path else None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._sem_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._sync_sem = threading.BoundedSemaphore(max_concurrency)
+        self._inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+        self._last_summary: Optional[Dict[str, Any]] = None
+        self._stats = {"sent": 0, "cache_hits": 0, "coalesced": 0, "skipped": 0, "errors": 0}
+
+    # ---- 请求构造 ----
+
+    @staticmethod
+    def build_payload(prompt: str, model: str = "deepseek-chat", system: Optional[str] = None, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        messages: List[Dict[str, str]] = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        messages.append({"role": "user", "content": prompt})
+        payload: Dict[str, Any] = {"model": model, "messages": messages}
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+        return payload
+
+    def _headers(self) -> Dict[str, str]:
+        api_key = self._api_key()
+        if not api_key:
+            raise RuntimeError("Missing deepseek-api-key in config.json or DEEPSEEK_API_KEY env")
+        return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+    def _cached(self, key: str) -> Optional[Dict[str, Any]]:
+        response = self.cache.get(key)
+        if response is not None:
+            self._stats["cache_hits"] += 1
+            LLM_REQUESTS.inc(result="cache_hit")
+        return response
+
+    def _sent(self, key: str, response: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+        self._stats["sent"] += 1
+        LLM_REQUESTS.inc(result="sent")
+        LLM_SECONDS.observe(elapsed)
+        self.cache.put(key, response)
+        return response
+
+    def _failed(self) -> None:
+        self._stats["errors"] += 1
+        LLM_REQUESTS.inc(result="error")
+
+    # ---- 同步接口 ----
+
+    def chat_sync(self, prompt: str, model: str = "deepseek-chat", system: Optional[str] = None, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """阻塞调用（命令行与脚本使用），命中缓存时不发送请求"""
+        payload = self.build_payload(prompt, model, system, max_tokens)
+        key = request_key(payload)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        headers = self._headers()
+        with self._sync_sem:
+            start = time.perf_counter()
+            try:
+                resp = _clients.sync_client("deepseek").post(f"{self.base_url}/chat/completions", json=payload, headers=headers)
+                resp.raise_for_status()
+                response = resp.json()
+            except Exception:
+                self._failed()
+                raise
+        return self._sent(key, response, time.perf_counter() - start)
+
+    # ---- 异步接口 ----
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # 信号量绑定事件循环，循环更换时（例如多次 asyncio.run）重新创建
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._sem_loop is not loop:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+            self._sem_loop = loop
+            self._inflight = {}
+        return self._sem
+
+    async def chat(self, prompt: str, model: str = "deepseek-chat", system: Optional[str] = None, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """异步调用：先查缓存，相同请求在途时等待同一结果，否则在并发上限内发送"""
+        payload = self.build_payload(prompt, model, system, max_tokens)
+        key = request_key(payload)
+        cached = self._cached(key)
+        if cached is not None:
+            return cached
+        sem = self._semaphore()
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._stats["coalesced"] += 1
+            LLM_REQUESTS.inc(result="coalesced")
+            return await asyncio.shield(pending)
+        future: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            headers = self._headers()
+            async with sem:
+                start = time.perf_counter()
+                resp = await _clients.async_client("deepseek").post(f"{self.base_url}/chat/completions", json=payload, headers=headers)
+                resp.raise_for_status()
+                response = self._sent(key, resp.json(), time.perf_counter() - start)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                self._failed()
+            future.set_exception(e)
+            # 没有其他等待者时避免 "Future exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def chat_many(self, prompts: Sequence[str], model: str = "deepseek-chat", system: Optional[str] = None, max_tokens: Optional[int] = None) -> List[Any]:
+        """批量并发发送，同时在途的请求数受 max_concurrency 限制；单个失败时该位置返回异常对象"""
+        return list(await asyncio.gather(*(self.chat(p, model, system, max_tokens) for p in prompts), return_exceptions=True))
+
+    # ---- 候选总结 ----
+
+    def _load_state(self) -> Optional[Dict[str, Any]]:
+        if self._last_summary is None and self.state_path is not None and self.state_path.exists():
+            try:
+                self._last_summary = json.loads(self.state_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._last_summary = None
+        return self._last_summary
+
+    def _save_state(self, state: Dict[str, Any]) -> None:
+        self._last_summary = state
+        if self.state_path is None:
+            return
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            self.state_path.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"保存候选总结状态失败: {e}")
+
+    @staticmethod
+    def candidates_prompt(quotes: Sequence[FundQuote]) -> str:
+        lines = ["| 代码 | 名称 | T-1溢价率 | 申购状态 |", "| --- | --- | --- | --- |"]
+        for q in sorted(quotes, key=lambda q: -q.premium if q.has_premium else 0.0):
+            premium = f"{q.premium:.2f}%" if q.has_premium else "-"
+            lines.append(f"| {q.code} | {q.name} | {premium} | {q.status_text or '-'} |")
+        return "今日溢价候选基金：\n" + "\n".join(lines)
+
+    async def summarize_candidates(self, quotes: Sequence[FundQuote], model: str = "deepseek-chat", max_tokens: Optional[int] = 400) -> Dict[str, Any]:
+        """
+        总结候选基金列表；候选集合与上次总结时相同时直接返回上次的总结
+
+        Args:
+            quotes: 候选基金
+            model: 模型名
+            max_tokens: 最大输出 token 数
+        """
+        fingerprint = candidates_fingerprint(quotes)
+        last = self._load_state()
+        if last is not None and last.get("fingerprint") == fingerprint:
+            self._stats["skipped"] += 1
+            LLM_REQUESTS.inc(result="skipped")
+            return {"summary": last.get("summary", ""), "skipped": True, "fingerprint": fingerprint, "summarized_at": last.get("summarized_at")}
+        hits = self._stats["cache_hits"]
+        response = await self.chat(self.candidates_prompt(quotes), model, SUMMARY_SYSTEM, max_tokens)
+        state = {"fingerprint": fingerprint, "summary": message_content(response), "summarized_at": time.time()}
+        self._save_state(state)
+        return {**state, "skipped": False, "cached": self._stats["cache_hits"] > hits}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"base_url": self.base_url, "max_concurrency": self.max_concurrency, **self._stats, "cache": self.cache.stats()}
+
+
+def from_env(api_key: Callable[[], Optional[str]]) -> LLMGateway:
+    root = os.getenv("LLM_CACHE_DIR") or str(Path(__file__).parent / "data" / "llm_cache")
+    cache = ResponseCache(
+        root,
+        ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000")),
+    )
+    return LLMGateway(
+        api_key,
+        cache,
+        base_url=os.getenv("DEEPSEEK_BASE_URL", DEFAULT_BASE_URL),
+        max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "4")),
+        state_path=Path(root) / "last_summary.json",
+    )
@@ -1,52 +1,339 @@
+"""
+日志配置：调用方只把记录放进内存队列，格式化与写盘在后台监听线程完成
+
+- QueueHandler / QueueListener：事件循环里的 logger 调用不做磁盘 I/O，队列满时丢弃并计数，不阻塞
+- JSON 结构化记录：附带当前工具调用的 ID、工具名与各阶段耗时（LOG_FORMAT=json|text）
+- 文件按大小或时间轮转，轮转出的文件 gzip 压缩，只保留最近 LOG_BACKUP_COUNT 个
+- 按 logger 采样：轮询等高频 INFO 消息只保留一部分（LOG_SAMPLE），WARNING 及以上总是保留
+"""
+import atexit
+import contextvars
+import copy
+import gzip
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# LogRecord 自带的属性，其余属性视为 extra 字段写入 JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "tool_call_id", "tool"}
+
+# 当前工具调用：{"id", "tool", "stages"}，由 tool_call() 设置，随 asyncio 任务与工作线程传播
+_call: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("tool_call", default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+@contextmanager
+def tool_call(tool: str) -> Iterator[Dict[str, Any]]:
+    """
+    标记一次工具调用，期间的日志记录都带上同一个调用 ID
+
+    Args:
+        tool: 工具名
+    """
+    ctx = {"id": uuid.uuid4().hex[:12], "tool": tool, "stages": {}}
+    token = _call.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _call.reset(token)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """把阶段耗时累加到当前工具调用上（不在工具调用中时忽略）"""
+    ctx = _call.get()
+    if ctx is not None:
+        stages = ctx["stages"]
+        stages[stage] = round(stages.get(stage, 0.0) + seconds * 1000, 3)
+
+
+def current_call() -> Optional[Dict[str, Any]]:
+    return _call.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """每条记录输出一行 JSON；extra 传入的字段原样写入"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "tool_call_id", None):
+            out["tool_call_id"] = record.tool_call_id
+            out["tool"] = record.tool
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                out[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        if record.stack_info:
+            out["stack"] = record.stack_info
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按 logger 名前缀采样低于 WARNING 的记录，按计数均匀保留（rate=0.1 即每 10 条保留 1 条）
+
+    Args:
+        rates: {logger 名前缀: 保留比例}，最长前缀优先
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = {name: min(1.0, max(0.0, r)) for name, r in rates.items()}
+        self._resolved: Dict[str, float] = {}
+        self._seen: Dict[str, int] = {}
+        self.dropped: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _rate(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, best = 1.0, -1
+            for prefix, r in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = r, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        with self._lock:
+            n = self._seen.get(record.name, 0)
+            self._seen[record.name] = n + 1
+            # 第 n 条记录使 floor(n * rate) 增加时保留，保留的记录均匀分布
+            keep = int((n + 1) * rate) > int(n * rate)
+            if not keep:
+                self.dropped[record.name] = self.dropped.get(record.name, 0) + 1
+        return keep
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    在调用方线程只做消息拼接与上下文捕获，队列满时丢弃记录而不是阻塞或报错
+
+    Args:
+        q: 有界队列
+    """
+
+    def __init__(self, q: "queue.Queue[logging.LogRecord]"):
+        super().__init__(q)
+        self.dropped = 0
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 监听线程里拿不到调用方的 contextvars，入队前把调用 ID 写到记录上；
+        # 与默认实现不同，不在这里格式化整条记录，只合并参数并把异常转成文本
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        ctx = _call.get()
+        if ctx is not None and not hasattr(record, "tool_call_id"):
+            record.tool_call_id, record.tool = ctx["id"], ctx["tool"]
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RotatingCompressedFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    文件超过 max_bytes 或到达下一个时间边界时轮转，轮转出的文件 gzip 压缩
+
+    轮转文件名为 <名称>-YYYYMMDD-HHMMSS.log.gz（同一秒内重复轮转时追加序号），保留最近 backup_count 个。
+    写盘与压缩都在监听线程执行，不占用事件循环
+
+    Args:
+        filename: 当前写入的日志文件
+        max_bytes: 单个文件的最大字节数，0 表示不按大小轮转
+        interval: 按时间轮转的间隔（秒），从本地零点起对齐，0 表示不按时间轮转
+        backup_count: 保留的轮转文件数，0 表示全部保留
+        compress: 是否 gzip 压缩轮转出的文件
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 50 * 1024 * 1024, interval: float = 86400,
+                 backup_count: int = 14, compress: bool = True):
+        super().__init__(filename, "a", encoding="utf-8", delay=False)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.rollovers = 0
+        self._next_rollover = self._compute_next(time.time())
+
+    def _compute_next(self, now: float) -> float:
+        if self.interval <= 0:
+            return float("inf")
+        midnight = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        return midnight + (int((now - midnight) // self.interval) + 1) * self.interval
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        if time.time() >= self._next_rollover:
+            return True
+        return self.max_bytes > 0 and self.stream.tell() >= self.max_bytes
+
+    def _rotated_name(self) -> str:
+        base, ext = os.path.splitext(self.baseFilename)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        suffix = ext + (".gz" if self.compress else "")
+        name, n = f"{base}-{stamp}{suffix}", 1
+        while os.path.exists(name):
+            name, n = f"{base}-{stamp}.{n}{suffix}", n + 1
+        return name
+
+    def rotated_files(self) -> List[str]:
+        base, ext = os.path.splitext(self.baseFilename)
+        folder, prefix = os.path.dirname(base), os.path.basename(base) + "-"
+        names = [f for f in os.listdir(folder) if f.startswith(prefix) and (f.endswith(ext) or f.endswith(ext + ".gz"))]
+        # 同一秒内轮转出的文件名不能反映先后，按修改时间排序
+        return sorted((os.path.join(folder, f) for f in names), key=lambda f: (os.path.getmtime(f), f))
+
+    def doRollover(self) -> None:
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            dest = self._rotated_name()
+            if self.compress:
+                with open(self.baseFilename, "rb") as src, gzip.open(dest, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.baseFilename)
+            else:
+                os.replace(self.baseFilename, dest)
+            self.rollovers += 1
+        if self.backup_count > 0:
+            for old in self.rotated_files()[:-self.backup_count]:
+                os.remove(old)
+        self._next_rollover = self._compute_next(time.time())
+        self.stream = self._open()
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    # "mcp_server.poller=0.1,mcp_server.subscriptions=0.2"
+    rates = {}
+    for item in spec.split(","):
+        name, sep, rate = item.strip().partition("=")
+        if sep and name.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def stats() -> Dict[str, Any]:
+    """返回日志队列深度、因队列满或采样丢弃的记录数与文件轮转次数"""
+    if _queue_handler is None:
+        return {}
+    sampler = next((f for f in _queue_handler.filters if isinstance(f, SamplingFilter)), None)
+    rotating = [h for h in (_listener.handlers if _listener else ()) if isinstance(h, RotatingCompressedFileHandler)]
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped_full": _queue_handler.dropped,
+        "sampled_out": dict(sampler.dropped) if sampler else {},
+        "rollovers": sum(h.rollovers for h in rotating),
+    }
+
+
+def shutdown_logging() -> None:
+    """停止监听线程并写完队列中剩余的记录"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
 
 def setup_logging(log_dir="/app/logs", log_level=logging.INFO):
     """
     配置日志系统
-    
+
     Args:
         log_dir: 日志目录路径
         log_level: 日志级别
     """
+    global _listener, _queue_handler
     # 获取环境变量，判断是否为生产环境
     env = os.getenv("ENV", "dev").lower()
     is_prod = env in ("prod", "production")
-    
-    # 配置日志格式
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    date_format = '%Y-%m-%d %H:%M:%S'
-    
-    # 处理器列表
+    log_level = os.getenv("LOG_LEVEL", "").upper() or log_level
+    use_json = os.getenv("LOG_FORMAT", "json" if is_prod else "text").lower() == "json"
+    formatter = JsonFormatter() if use_json else logging.Formatter(LOG_FORMAT, DATE_FORMAT)
+
+    # 重复调用时先停掉上一次的监听线程
+    shutdown_logging()
+
+    # 处理器列表（在监听线程中执行）
     handlers = []
-    
+
     # 始终添加控制台处理器
     console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(log_format, date_format))
+    console_handler.setFormatter(formatter)
     handlers.append(console_handler)
-    
+
     # 仅在生产环境添加文件处理器
+    log_file = None
     if is_prod:
         # 确保日志目录存在
         os.makedirs(log_dir, exist_ok=True)
-        
-        # 生成日志文件名（按日期）
-        log_file = os.path.join(log_dir, f"mcp_server_{datetime.now().strftime('%Y%m%d')}.log")
-        
-        # 添加文件处理器
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setFormatter(logging.Formatter(log_format, date_format))
+        log_file = os.path.join(log_dir, "mcp_server.log")
+        file_handler = RotatingCompressedFileHandler(
+            log_file,
+            max_bytes=int(float(os.getenv("LOG_MAX_MB", "50")) * 1024 * 1024),
+            interval=float(os.getenv("LOG_ROTATE_HOURS", "24")) * 3600,
+            backup_count=int(os.getenv("LOG_BACKUP_COUNT", "14")),
+            compress=os.getenv("LOG_COMPRESS", "1").lower() in ("1", "true", "yes"),
+        )
+        file_handler.setFormatter(formatter)
         handlers.append(file_handler)
-    
-    # 配置根日志记录器
-    logging.basicConfig(
-        level=log_level,
-        format=log_format,
-        datefmt=date_format,
-        handlers=handlers
-    )
-    
+
+    # 调用方只入队，队列满时丢弃
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    rates = _parse_rates(os.getenv("LOG_SAMPLE", ""))
+    if rates:
+        _queue_handler.addFilter(SamplingFilter(rates))
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.unregister(shutdown_logging)
+    atexit.register(shutdown_logging)
+
+    # 配置根日志记录器：只挂队列处理器
+    root = logging.getLogger()
+    root.setLevel(log_level)
+    root.addHandler(_queue_handler)
+
     # 返回日志记录器
     logger = logging.getLogger('mcp_server')
     if is_prod:
@@ -54,5 +341,5 @@ def setup_logging(log_dir="/app/logs", log_level=logging.INFO):
         logger.info(f"日志文件: {log_file}")
     else:
         logger.info(f"开发环境 - 日志仅输出到控制台")
-    
+
     return logger
@@ -5,12 +5,29 @@ LastEditors: duyulin@kingsoft.com
 LastEditTime: 2025-12-05 16:52:41
 '''
 import os
+import time
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from typing import Any, Dict, List
-from fastmcp import FastMCP
-import httpx
+from fastmcp import Context, FastMCP
+from fastmcp.server.middleware import Middleware
+from mcp import types as mcp_types
 import jisilu_mcp_server as j
 import wechat_server as w
+import deepseek_client
+from http_clients import registry as http_registry
+from candidate_poller import CandidatePoller
+from notify_queue import NotificationQueue
+from screening import Screen
+from fund_quote import ApplyStatus
+from subscriptions import SubscriptionHub
+from worker_pool import PoolBusyError, pool as worker_pool
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry as metrics_registry
+from serializers import dumps
+import logging_config
+from starlette.requests import Request
+from starlette.responses import Response
 
 # 配置日志（如果在 Docker 环境中运行）
 try:
@@ -21,22 +38,348 @@ except Exception:
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger('mcp_server')
 
+# 微信通知队列：合并窗口内的消息、令牌桶限速并失败重试，调用方立即拿到消息 ID
+notify_queue = NotificationQueue(
+    w.send_wechat,
+    window=float(os.getenv("NOTIFY_WINDOW", "10")),
+    rate_per_minute=float(os.getenv("NOTIFY_RATE_PER_MINUTE", "6")),
+    burst=int(os.getenv("NOTIFY_BURST", "3")),
+    max_retries=int(os.getenv("NOTIFY_MAX_RETRIES", "3")),
+)
+
+# 后台轮询：POLL_ENABLED=1 时随服务启动，发现变化的候选基金时自动发送微信通知
+poller = CandidatePoller(
+    j.snapshot_async,
+    notify_queue.notify,
+    threshold=float(os.getenv("POLL_THRESHOLD", "2.0")),
+    trading_interval=float(os.getenv("POLL_TRADING_INTERVAL", "60")),
+    idle_interval=float(os.getenv("POLL_IDLE_INTERVAL", "900")),
+    cooldown=float(os.getenv("ALERT_COOLDOWN", "3600")),
+    alert_on_start=os.getenv("POLL_ALERT_ON_START", "0").lower() in ("1", "true", "yes"),
+)
+
+async def _warmup(delay: float) -> None:
+    # 服务开始监听后再预热重模块（akshare / pandas），避免拖慢启动，也避免首次调用时现场导入
+    await asyncio.sleep(delay)
+    try:
+        timings = await asyncio.to_thread(j.warmup)
+        logger.info(f"后台预热完成: {timings}")
+    except Exception as e:
+        logger.warning(f"后台预热失败: {type(e).__name__}: {e}")
+
+# 候选基金订阅：所有订阅共用一次抓取，快照变化时只向结果有变化的订阅推送增量
+subscriptions = SubscriptionHub(
+    j.snapshot_async,
+    trading_interval=float(os.getenv("SUBSCRIBE_TRADING_INTERVAL", "60")),
+    idle_interval=float(os.getenv("SUBSCRIBE_IDLE_INTERVAL", "900")),
+    max_subscriptions=int(os.getenv("SUBSCRIBE_MAX", "1000")),
+)
+j.add_snapshot_listener(subscriptions.on_snapshot)
+
+@asynccontextmanager
+async def lifespan(server: FastMCP):
+    # 启动时预建共享 HTTP 客户端，关闭时释放连接池
+    http_registry.start()
+    logger.info(f"HTTP 客户端已就绪: http2={http_registry.http2}")
+    if j.shared is not None:
+        j.start_shared()
+        logger.info(f"共享快照已启用: store={type(j.shared.store).__name__}, owner={j.shared.owner}")
+    poll_enabled = os.getenv("POLL_ENABLED", "0").lower() in ("1", "true", "yes")
+    if poll_enabled:
+        poller.start()
+        logger.info(f"后台轮询已启动: threshold={poller.threshold}")
+    warmup_task = None
+    if os.getenv("WARMUP_ENABLED", "1").lower() in ("1", "true", "yes"):
+        warmup_task = asyncio.create_task(_warmup(float(os.getenv("WARMUP_DELAY", "1"))))
+    try:
+        yield
+    finally:
+        if warmup_task is not None:
+            warmup_task.cancel()
+        await poller.stop()
+        await j.stop_shared()
+        subscriptions.clear()
+        await notify_queue.aclose()
+        await http_registry.aclose()
+        worker_pool.shutdown()
+        logger.info("HTTP 客户端已关闭")
+
+class ToolCallLogging(Middleware):
+    """为每次工具调用分配调用 ID（期间的日志都带上），结束时记录一条带总耗时与各阶段耗时的日志"""
+
+    async def on_call_tool(self, context, call_next):
+        name = context.message.name
+        with logging_config.tool_call(name) as call:
+            start = time.perf_counter()
+            status = "ok"
+            try:
+                return await call_next(context)
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                duration_ms = round((time.perf_counter() - start) * 1000, 3)
+                logger.info(f"工具调用结束: {name} {status} {duration_ms}ms",
+                            extra={"status": status, "duration_ms": duration_ms, "stages": dict(call["stages"])})
+
 # 初始化 MCP 服务器
-mcp = FastMCP("arbitrage-suite")
+mcp = FastMCP("arbitrage-suite", lifespan=lifespan)
+mcp.add_middleware(ToolCallLogging())
+
+# 抓取流水线的阶段耗时同时累加到当前工具调用上，随调用结束日志输出
+j.STAGE_SECONDS.add_observer(lambda seconds, labels: logging_config.record_stage(labels.get("stage", ""), seconds))
+
+TOOL_SECONDS = metrics_registry.histogram("mcp_tool_seconds", "MCP 工具调用耗时", ["tool"])
+metrics_registry.gauge("notify_queue_messages", "微信通知队列中各状态的消息数", ["status"]).set_function(
+    lambda: {(k,): v for k, v in notify_queue.stats().items()}
+)
+metrics_registry.counter("log_records_dropped_total", "因日志队列满或采样丢弃的日志记录数", ["reason"]).set_function(
+    lambda: {("queue_full",): logging_config.stats().get("dropped_full", 0),
+             ("sampled",): sum(logging_config.stats().get("sampled_out", {}).values())}
+)
+metrics_registry.counter("poller_events_total", "后台轮询次数与发送的提醒数", ["event"]).set_function(
+    lambda: {("poll",): poller.polls, ("alert",): poller.alerts_sent}
+)
+
+def _busy(e: PoolBusyError) -> str:
+    # 准入控制拒绝时立即返回，由调用方稍后重试
+    logger.warning(f"请求被拒绝: {e}")
+    return dumps({"error": "busy", "message": str(e), "retry_after": e.retry_after})
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_endpoint(request: Request) -> Response:
+    """Prometheus 文本格式的指标，与 SSE 传输共用同一端口"""
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
 
 @mcp.tool(description="获取QDII溢价套利候选列表")
-def fetch_qdii_candidates(threshold: float = 2.0) -> str:
+async def fetch_qdii_candidates(threshold: float = 2.0) -> str:
     """
     获取QDII溢价套利候选列表
 
     Args:
         threshold: 溢价率阈值，默认为2.0%
     """
-    import json
     logger.info(f"调用 fetch_qdii_candidates, threshold={threshold}")
-    result = j.qdii_candidates(threshold)
-    logger.info(f"获取到 {len(result)} 只候选基金")
-    return json.dumps(result, ensure_ascii=False)
+    # 异步并发抓取，避免阻塞同一事件循环上的 send_wechat 等调用
+    try:
+        with worker_pool.admit("fetch_qdii_candidates"), TOOL_SECONDS.time(tool="fetch_qdii_candidates"):
+            # 同一快照版本、同一阈值的编码结果缓存在快照上，重复调用不再筛选与序列化
+            count, text, fresh = await j.qdii_candidates_json(threshold)
+    except PoolBusyError as e:
+        return _busy(e)
+    stats = j.cache_stats()
+    logger.info(f"获取到 {count} 只候选基金, 缓存命中={stats['hits']} 旧数据命中={stats['stale_hits']} 未命中={stats['misses']}")
+    if fresh["stale"]:
+        # 返回的是旧快照（上游熔断或超出 max_stale）；返回类型不变，数据年龄与熔断状态见 cache://qdii 的 freshness
+        logger.warning(f"返回旧快照: age={fresh['age']}s upstream={fresh['upstream']}")
+    return text
+
+@mcp.tool(description="查询单只基金的历史溢价率")
+async def fetch_premium_history(code: str, start: str = "", end: str = "") -> str:
+    """
+    查询单只基金的历史溢价率（每次刷新快照时记录）
+
+    Args:
+        code: 基金代码，如 164906
+        start: 起始时间，格式 YYYY-MM-DD 或 YYYY-MM-DD HH:MM，默认 7 天前
+        end: 结束时间，格式同上，只给日期时包含当天，默认当前时间
+    """
+    logger.info(f"调用 fetch_premium_history, code={code}, start={start}, end={end}")
+    try:
+        # 历史分区扫描是阻塞的文件读取，放到工作线程池
+        with worker_pool.admit("fetch_premium_history"), TOOL_SECONDS.time(tool="fetch_premium_history"):
+            points = await worker_pool.run(j.premium_history_of, code, start, end)
+    except PoolBusyError as e:
+        return _busy(e)
+    except ValueError as e:
+        return dumps({"code": code, "error": str(e)})
+    return dumps({"code": code, "count": len(points), "points": points})
+
+@mcp.tool(description="按溢价率z分数或连续超阈值天数对基金排序")
+async def rank_premium_signals(by: str = "zscore", top: int = 20, min_days: int = 5) -> str:
+    """
+    按溢价率z分数或连续超阈值天数对基金排序
+
+    Args:
+        by: 排序方式，zscore（当前溢价率相对EWMA均值的偏离）或 persistence（连续超阈值天数）
+        top: 返回的基金数，默认20
+        min_days: 按z分数排序时要求的最少历史交易日数，默认5
+    """
+    logger.info(f"调用 rank_premium_signals, by={by}, top={top}")
+    try:
+        with worker_pool.admit("rank_premium_signals"), TOOL_SECONDS.time(tool="rank_premium_signals"):
+            # 确保至少有一份快照进入统计
+            await j.snapshot_async()
+            ranked = await worker_pool.run(j.rolling_stats.rank, by, top, min_days)
+    except PoolBusyError as e:
+        return _busy(e)
+    except ValueError as e:
+        return dumps({"error": str(e)})
+    return dumps(ranked)
+
+@mcp.tool(description="按溢价率索引查询溢价最高的基金或各溢价区间的基金数")
+async def query_premium_index(view: str = "top", top: int = 10, edges: str = "0,1,2,3,5,10", exclude_status: str = "") -> str:
+    """
+    按溢价率索引查询溢价最高的基金或各溢价区间的基金数
+
+    Args:
+        view: top（溢价率最高的基金，降序）或 buckets（各溢价率区间的基金数）
+        top: view=top 时返回的基金数，默认10
+        edges: view=buckets 时的区间边界，逗号分隔的溢价率（%），默认 0,1,2,3,5,10
+        exclude_status: 排除的申购状态，逗号分隔（开放申购、暂停申购、限购、其他），默认不排除
+    """
+    logger.info(f"调用 query_premium_index, view={view}, top={top}, edges={edges}")
+    try:
+        excluded = _parse_statuses(exclude_status)
+        with worker_pool.admit("query_premium_index"), TOOL_SECONDS.time(tool="query_premium_index"):
+            # 索引在快照产生时已构建，查询只做二分与位图前缀计数，不遍历全部行
+            snap, index = await j.premium_index_async()
+            if view == "top":
+                body: Dict[str, Any] = {"funds": [q.to_dict() for q in index.top(top, excluded)]}
+            elif view == "buckets":
+                body = {"buckets": index.buckets(_parse_edges(edges), excluded)}
+            else:
+                raise ValueError(f"未知的 view: {view}，可选 top 或 buckets")
+    except PoolBusyError as e:
+        return _busy(e)
+    except ValueError as e:
+        return dumps({"error": str(e)})
+    return dumps({"view": view, "version": snap.version, "indexed": len(index), **body})
+
+@mcp.tool(description="用DeepSeek总结QDII溢价候选列表")
+async def summarize_qdii_candidates(threshold: float = 2.0) -> str:
+    """
+    用DeepSeek总结QDII溢价候选列表
+
+    候选集合（代码、溢价率、申购状态）与上次总结时相同时直接返回上次的总结，不调用模型
+
+    Args:
+        threshold: 溢价率阈值，默认为2.0%
+    """
+    logger.info(f"调用 summarize_qdii_candidates, threshold={threshold}")
+    try:
+        with worker_pool.admit("summarize_qdii_candidates"), TOOL_SECONDS.time(tool="summarize_qdii_candidates"):
+            quotes = await j.qdii_candidates_async(threshold)
+            result = await deepseek_client.gateway.summarize_candidates(quotes)
+    except PoolBusyError as e:
+        return _busy(e)
+    except Exception as e:
+        logger.warning(f"候选总结失败: {type(e).__name__}: {e}")
+        return dumps({"error": str(e)})
+    return dumps({"threshold": threshold, "count": len(quotes), **result})
+
+@mcp.resource("cache://qdii")
+def qdii_cache_stats() -> str:
+    """返回QDII快照缓存的命中统计、快照年龄，以及 fetch_qdii_candidates 返回的是否为旧数据（freshness）"""
+    return dumps({**j.cache_stats(), "freshness": j.freshness()})
+
+@mcp.resource("sources://qdii")
+def qdii_source_stats() -> str:
+    """返回各数据源的延迟、成功率与当前优先顺序"""
+    return dumps(j.source_stats())
+
+@mcp.resource("breakers://status")
+def breaker_status() -> str:
+    """返回各上游熔断器的状态、自适应超时与失败统计"""
+    return dumps(http_registry.breaker_stats())
+
+@mcp.resource("pool://status")
+def worker_pool_status() -> str:
+    """返回工作池的排队深度、在途调用与拒绝统计"""
+    return dumps(worker_pool.stats())
+
+@mcp.resource("llm://status")
+def llm_gateway_status() -> str:
+    """返回LLM网关的缓存命中、去重、跳过与发送统计"""
+    return dumps(deepseek_client.gateway.stats())
+
+def _parse_statuses(text: str) -> frozenset:
+    # 逗号分隔的申购状态（开放申购、暂停申购、限购、其他）
+    out = set()
+    for item in text.replace("，", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            out.add(ApplyStatus(item))
+        except ValueError:
+            raise ValueError(f"未知的申购状态: {item}，可选 {', '.join(s.value for s in ApplyStatus if s.value)}")
+    return frozenset(out)
+
+def _parse_edges(text: str) -> List[float]:
+    # 逗号分隔的溢价率区间边界
+    try:
+        return [float(item) for item in text.replace("，", ",").split(",") if item.strip()]
+    except ValueError:
+        raise ValueError(f"区间边界必须是逗号分隔的数字: {text}")
+
+def _session_sender(session: Any):
+    # 以 notifications/resources/updated 推送增量，增量放在通知参数中，客户端无需再读取资源
+    async def send(payload: Dict[str, Any]) -> None:
+        params = mcp_types.ResourceUpdatedNotificationParams(**payload)
+        await session.send_notification(mcp_types.ServerNotification(mcp_types.ResourceUpdatedNotification(params=params)))
+    return send
+
+@mcp.tool(description="订阅QDII候选基金的增量变化")
+async def subscribe_qdii_candidates(ctx: Context, threshold: float = 2.0, exclude_status: str = "暂停申购,开放申购") -> str:
+    """
+    订阅QDII候选基金，快照变化时通过 notifications/resources/updated 推送新增、移除与变化的基金
+
+    Args:
+        threshold: 溢价率阈值，默认为2.0%
+        exclude_status: 排除的申购状态，逗号分隔，默认排除暂停申购与开放申购，传空字符串表示不排除
+    """
+    try:
+        excluded = _parse_statuses(exclude_status)
+        sub = await subscriptions.subscribe(Screen(threshold, excluded), _session_sender(ctx.session))
+    except (ValueError, RuntimeError) as e:
+        return dumps({"error": str(e)})
+    logger.info(f"新订阅 {sub.id}: threshold={threshold}, exclude={exclude_status}, 当前订阅数={len(subscriptions)}")
+    return dumps(sub.snapshot())
+
+@mcp.tool(description="取消QDII候选基金订阅")
+async def unsubscribe_qdii_candidates(subscription_id: str) -> str:
+    """
+    取消QDII候选基金订阅
+
+    Args:
+        subscription_id: subscribe_qdii_candidates 返回的订阅 ID
+    """
+    return dumps({"subscription_id": subscription_id, "removed": subscriptions.unsubscribe(subscription_id)})
+
+@mcp.resource("candidates://subscriptions/{subscription_id}")
+def subscription_state(subscription_id: str) -> str:
+    """返回订阅的当前完整结果，漏收推送后用于重新同步"""
+    sub = subscriptions.get(subscription_id)
+    if sub is None:
+        return dumps({"subscription_id": subscription_id, "error": "未找到该订阅"})
+    return dumps(sub.snapshot())
+
+@mcp._mcp_server.subscribe_resource()
+async def _resubscribe(uri: Any) -> None:
+    # resources/subscribe：重连后的会话接管已有订阅的推送
+    sub = subscriptions.get(str(uri).rsplit("/", 1)[-1])
+    if sub is not None:
+        sub.send = _session_sender(mcp._mcp_server.request_context.session)
+
+@mcp._mcp_server.unsubscribe_resource()
+async def _unsubscribe(uri: Any) -> None:
+    subscriptions.unsubscribe(str(uri).rsplit("/", 1)[-1])
+
+@mcp.resource("shared://status")
+def shared_snapshot_status() -> str:
+    """返回多副本共享快照的 leader、版本与同步统计"""
+    return dumps(j.shared_stats())
+
+@mcp.resource("subscriptions://status")
+def subscription_status() -> str:
+    """返回订阅数、扇出与推送统计"""
+    return dumps(subscriptions.stats())
+
+@mcp.resource("poller://status")
+def poller_status() -> str:
+    """返回后台轮询的运行状态"""
+    return dumps(poller.status())
 
 @mcp.tool(description="发送微信通知")
 async def send_wechat(title: str, desp: str) -> str:
@@ -47,11 +390,23 @@ async def send_wechat(title: str, desp: str) -> str:
         title: 通知的标题
         desp: 通知的详细内容
     """
-    import json
     logger.info(f"调用 send_wechat, title={title}")
-    result = await w.send_wechat(title, desp)
-    logger.info(f"微信通知发送完成: {result.get('status_code', 'unknown')}")
-    return json.dumps(result, ensure_ascii=False)
+    message_id = notify_queue.submit(title, desp)
+    logger.info(f"微信通知已入队: {message_id}")
+    return dumps(notify_queue.status(message_id))
+
+@mcp.tool(description="查询微信通知的投递状态")
+async def get_wechat_status(message_id: str) -> str:
+    """
+    查询微信通知的投递状态
+
+    Args:
+        message_id: send_wechat 返回的消息 ID
+    """
+    status = notify_queue.status(message_id)
+    if status is None:
+        return dumps({"message_id": message_id, "error": "未找到该消息"})
+    return dumps(status)
 
 if __name__ == "__main__":
     # 获取端口，默认使用 4567
@@ -0,0 +1,229 @@
+"""
+微信通知发送队列
+
+send_wechat 调用只入队并立即返回消息 ID；后台任务把时间窗口内的消息合并为一条摘要，
+经令牌桶限速后发送到 Server酱，失败时指数退避重试。可通过消息 ID 查询投递状态。
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("mcp_server.notify")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 令牌桶容量（允许的突发条数）
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        # 成功取得令牌返回 0，否则返回需要等待的秒数
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self) -> None:
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+@dataclass
+class QueuedMessage:
+    id: str
+    title: str
+    desp: str
+    created_at: float = field(default_factory=time.time)
+    status: str = "queued"  # queued / sending / sent / failed
+    attempts: int = 0
+    digest_size: int = 0
+    result: Any = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message_id": self.id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "digest_size": self.digest_size,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+def _split_table(desp: str) -> Optional[List[str]]:
+    # 若正文是单个 markdown 表格，返回其行；否则返回 None
+    lines = [line for line in desp.strip().splitlines() if line.strip()]
+    if len(lines) < 2 or not all(line.lstrip().startswith("|") for line in lines):
+        return None
+    return lines
+
+
+def build_digest(messages: List[QueuedMessage]) -> "tuple[str, str]":
+    """把多条消息合并为一条：表头相同的表格合并为一张表（按首列去重），其余按标题分节"""
+    if len(messages) == 1:
+        return messages[0].title, messages[0].desp
+    title = f"汇总 {len(messages)} 条通知: {messages[0].title}"
+    tables = [_split_table(m.desp) for m in messages]
+    if all(t is not None for t in tables) and len({tuple(t[:2]) for t in tables}) == 1:  # type: ignore[index]
+        rows: "OrderedDict[str, str]" = OrderedDict()
+        for t in tables:
+            for line in t[2:]:  # type: ignore[index]
+                key = line.strip().strip("|").split("|")[0].strip()
+                rows.pop(key, None)
+                rows[key] = line
+        return title, "\n".join(tables[0][:2] + list(rows.values()))  # type: ignore[index]
+    sections = [f"### {m.title}\n\n{m.desp}" for m in messages]
+    return title, "\n\n---\n\n".join(sections)
+
+
+def _is_retryable(result: Any) -> bool:
+    if not isinstance(result, dict) or "error" in result:
+        return True
+    code = result.get("status_code", 0)
+    return code == 429 or code >= 500
+
+
+class NotificationQueue:
+    def __init__(
+        self,
+        send: Callable[[str, str], Awaitable[Dict[str, Any]]],
+        window: float = 10.0,
+        rate_per_minute: float = 6.0,
+        burst: int = 3,
+        max_retries: int = 3,
+        backoff: float = 2.0,
+        history: int = 1000,
+    ):
+        """
+        Args:
+            send: 实际发送函数（wechat_server.send_wechat）
+            window: 合并窗口秒数，窗口内的消息合并为一条摘要
+            rate_per_minute: 每分钟允许发送的条数
+            burst: 允许的突发条数
+            max_retries: 失败后的最大重试次数
+            backoff: 重试退避基数（秒），第 n 次重试等待 backoff * 2**(n-1)
+            history: 保留可查询状态的消息数量
+        """
+        self._send = send
+        self.window = window
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._history = history
+        self._messages: "OrderedDict[str, QueuedMessage]" = OrderedDict()
+        self._pending: List[QueuedMessage] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ids = itertools.count(1)
+
+    def submit(self, title: str, desp: str) -> str:
+        msg = QueuedMessage(id=f"msg-{int(time.time())}-{next(self._ids)}", title=title, desp=desp)
+        self._messages[msg.id] = msg
+        while len(self._messages) > self._history:
+            self._messages.popitem(last=False)
+        self._pending.append(msg)
+        self._ensure_worker()
+        self._wakeup.set()  # type: ignore[union-attr]
+        return msg.id
+
+    async def notify(self, title: str, desp: str) -> str:
+        # 与 send_wechat 相同的调用签名，便于替换
+        return self.submit(title, desp)
+
+    def status(self, message_id: str) -> Optional[Dict[str, Any]]:
+        msg = self._messages.get(message_id)
+        return msg.to_dict() if msg is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for m in self._messages.values():
+            counts[m.status] = counts.get(m.status, 0) + 1
+        return {"pending": len(self._pending), **counts}
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()  # type: ignore[union-attr]
+            self._wakeup.clear()  # type: ignore[union-attr]
+            if not self._pending:
+                continue
+            # 等待合并窗口结束，期间到达的消息一起发送
+            await asyncio.sleep(self.window)
+            batch, self._pending = self._pending, []
+            try:
+                await self._deliver(batch)
+            except Exception as e:
+                for m in batch:
+                    m.status = "failed"
+                    m.error = str(e)
+                logger.warning(f"微信通知发送异常: {e}")
+
+    async def _deliver(self, batch: List[QueuedMessage]) -> None:
+        title, desp = build_digest(batch)
+        for m in batch:
+            m.status = "sending"
+            m.digest_size = len(batch)
+        result: Any = None
+        error: Optional[str] = None
+        attempts = 0
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            attempts = attempt + 1
+            try:
+                result = await self._send(title, desp)
+                error = result.get("error") if isinstance(result, dict) else None
+            except Exception as e:
+                result, error = None, str(e)
+            if not _is_retryable(result):
+                break
+            if attempt < self.max_retries:
+                # 上游熔断时至少等到熔断器允许探测
+                retry_after = result.get("retry_after") if isinstance(result, dict) else None
+                await asyncio.sleep(max(self.backoff * 2 ** attempt, retry_after or 0.0))
+        ok = not _is_retryable(result) and isinstance(result, dict) and result.get("status_code", 0) < 400
+        for m in batch:
+            m.attempts = attempts
+            m.result = result
+            m.error = error
+            m.status = "sent" if ok else "failed"
+        logger.info(f"微信通知{'已发送' if ok else '发送失败'}: 合并 {len(batch)} 条, 尝试 {attempts} 次")
+
+    async def aclose(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for m in self._pending:
+            m.status = "failed"
+            m.error = "服务关闭，未发送"
+        self._pending = []
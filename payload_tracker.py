@@ -0,0 +1,124 @@
+"""
+上游响应的变化检测：内容未变化时跳过 JSON 解码与行构造
+
+- 每个请求（URL + 去掉缓存参数 ___jsl 后的查询参数）记录上次响应的摘要、ETag / Last-Modified 与解码结果
+- 下次请求带上 If-None-Match / If-Modified-Since；服务端返回 304 或响应内容摘要相同时直接复用上次的解码结果
+- 按分类记录最近一轮抓取是否未变化，供缓存、筛选与通知短路
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from metrics import registry as _metrics
+
+PAYLOADS = _metrics.counter("upstream_payloads_total", "上游响应的变化检测结果（changed / unchanged / not_modified / evicted）", ["category", "result"])
+
+# 不参与请求标识的查询参数（每次请求都不同的缓存参数）
+VOLATILE_PARAMS = ("___jsl",)
+
+
+def digest(content: bytes) -> str:
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class PayloadTracker:
+    def __init__(self, max_entries: int = 256):
+        """
+        Args:
+            max_entries: 记录的请求数上限（每个分类的每一页一条），超过时丢弃最久未用的
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._categories: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"changed": 0, "unchanged": 0, "not_modified": 0, "evicted": 0}
+
+    @staticmethod
+    def key(url: str, params: Mapping[str, str]) -> str:
+        stable = sorted((k, v) for k, v in params.items() if k not in VOLATILE_PARAMS)
+        return url + "?" + "&".join(f"{k}={v}" for k, v in stable)
+
+    def request_headers(self, key: str) -> Dict[str, str]:
+        # 有上次的 ETag / Last-Modified 时发送条件请求
+        with self._lock:
+            entry = self._entries.get(key)
+        headers: Dict[str, str] = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def lookup(self, key: str, status_code: int, content: bytes, category: str = "") -> Tuple[Optional[str], Any]:
+        """
+        返回 (响应摘要, 上次的解码结果)；304 或摘要与上次相同时第二项为上次的结果，否则为 None
+
+        收到 304 但上次的结果已被淘汰（发出条件请求之后）时返回 (None, None)，调用方应去掉条件头重新请求
+
+        Args:
+            key: 请求标识（见 key）
+            status_code: 响应状态码
+            content: 响应内容
+            category: 分类名，用于指标
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if status_code == 304:
+            if entry is None:
+                self.discard(key)
+                self._stats["evicted"] += 1
+                PAYLOADS.inc(category=category, result="evicted")
+                return None, None
+            self._stats["not_modified"] += 1
+            PAYLOADS.inc(category=category, result="not_modified")
+            return entry["digest"], entry["value"]
+        hashed = digest(content)
+        if entry is not None and entry["digest"] == hashed:
+            self._stats["unchanged"] += 1
+            PAYLOADS.inc(category=category, result="unchanged")
+            return hashed, entry["value"]
+        self._stats["changed"] += 1
+        PAYLOADS.inc(category=category, result="changed")
+        return hashed, None
+
+    def store(self, key: str, hashed: str, value: Any, headers: Optional[Mapping[str, str]] = None) -> None:
+        """记录本次响应的摘要、缓存校验头与解码结果"""
+        headers = headers or {}
+        with self._lock:
+            self._entries[key] = {
+                "digest": hashed,
+                "value": value,
+                "etag": headers.get("ETag") or headers.get("etag"),
+                "last_modified": headers.get("Last-Modified") or headers.get("last-modified"),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        # 丢弃该请求的摘要与 ETag / Last-Modified，下次请求不带条件头
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def mark(self, category: str, unchanged: bool) -> None:
+        # 记录分类最近一轮抓取（全部分页）是否与上一轮相同
+        self._categories[category] = {"unchanged": unchanged, "checked_at": time.time()}
+
+    def unchanged(self, category: str) -> bool:
+        return bool(self._categories.get(category, {}).get("unchanged"))
+
+    def categories(self) -> Dict[str, Dict[str, Any]]:
+        return {k: dict(v) for k, v in self._categories.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        self._categories.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), **self._stats, "categories": self.categories()}
@@ -0,0 +1,250 @@
+"""
+溢价率历史：只追加的按日分区列式存储
+
+每次刷新得到的快照按北京时间日期写入 <root>/<YYYYMMDD>/ 目录下的四个定长列文件：
+- ts.i8       抓取时间（Unix 秒，int64）
+- code.i4     基金代码（6 位数字转为 int32）
+- premium.f4  T-1 溢价率（float32，缺失为 NaN）
+- status.u1   申购状态编码（uint8，见 STATUS_CODES）
+
+读取时用 numpy.memmap 映射列文件，按日期目录名选择分区，查询区间之外的分区不会被打开；
+分区内时间单调递增，按时间二分得到切片视图，不复制数据。
+已封闭分区的映射按最近使用缓存，最多保留 max_open 个，长期运行时打开的文件数有上限。
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fund_quote import ApplyStatus, FundQuote
+
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None  # type: ignore
+
+logger = logging.getLogger("mcp_server.history")
+
+CN_TZ = timezone(timedelta(hours=8))
+
+# 状态编码写入磁盘，顺序固定，只允许在末尾追加
+STATUS_CODES: Tuple[ApplyStatus, ...] = (
+    ApplyStatus.UNKNOWN,
+    ApplyStatus.OPEN,
+    ApplyStatus.SUSPENDED,
+    ApplyStatus.LIMITED,
+    ApplyStatus.OTHER,
+)
+_STATUS_INDEX = {s: i for i, s in enumerate(STATUS_CODES)}
+
+# 列名 -> (文件名, dtype)
+COLUMNS: Dict[str, Tuple[str, str]] = {
+    "ts": ("ts.i8", "<i8"),
+    "code": ("code.i4", "<i4"),
+    "premium": ("premium.f4", "<f4"),
+    "status": ("status.u1", "u1"),
+}
+
+
+def day_of(ts: float) -> str:
+    return datetime.fromtimestamp(ts, CN_TZ).strftime("%Y%m%d")
+
+
+def parse_time(value: str, end: bool = False) -> float:
+    """
+    解析查询时间（北京时间），只给日期时 end=True 表示当天结束
+
+    Args:
+        value: "YYYY-MM-DD"、"YYYY-MM-DD HH:MM[:SS]" 或 Unix 秒
+        end: 只有日期时是否取当天 24:00
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d", "%Y%m%d"):
+        try:
+            dt = datetime.strptime(value, fmt).replace(tzinfo=CN_TZ)
+        except ValueError:
+            continue
+        if end and fmt in ("%Y-%m-%d", "%Y%m%d"):
+            dt += timedelta(days=1)
+        return dt.timestamp()
+    raise ValueError(f"无法解析的时间: {value}")
+
+
+def _code_int(code: str) -> Optional[int]:
+    return int(code) if code.isdigit() else None
+
+
+class PremiumHistory:
+    def __init__(self, root: "str | Path", enabled: bool = True, max_open: int = 64):
+        """
+        Args:
+            root: 存储根目录，按日期分区
+            enabled: 为 False 或未安装 numpy 时 append 不写入、查询返回空
+            max_open: 缓存映射的已封闭分区数上限，超过时淘汰最久未用的分区
+        """
+        self.root = Path(root)
+        self.enabled = enabled and np is not None
+        self.max_open = max(1, max_open)
+        self._lock = threading.Lock()
+        # 已封闭（非当天）分区的映射缓存（LRU）: 日期 -> 列 memmap
+        self._sealed: "OrderedDict[str, Dict[str, np.ndarray]]" = OrderedDict()
+        if enabled and np is None:
+            logger.warning("未安装 numpy，溢价率历史存储已禁用")
+
+    # ---- 写入 ----
+
+    def append(self, quotes: Sequence[FundQuote], ts: Optional[float] = None) -> int:
+        """追加一次快照，返回写入的行数；代码不是纯数字的行跳过"""
+        if not self.enabled or not quotes:
+            return 0
+        ts = time.time() if ts is None else ts
+        codes: List[int] = []
+        premiums: List[float] = []
+        statuses: List[int] = []
+        for q in quotes:
+            code = _code_int(q.code)
+            if code is None:
+                continue
+            codes.append(code)
+            premiums.append(q.premium)
+            statuses.append(_STATUS_INDEX.get(q.status, 0))
+        if not codes:
+            return 0
+        n = len(codes)
+        data = {
+            "ts": np.full(n, int(ts), dtype=COLUMNS["ts"][1]),
+            "code": np.asarray(codes, dtype=COLUMNS["code"][1]),
+            "premium": np.asarray(premiums, dtype=COLUMNS["premium"][1]),
+            "status": np.asarray(statuses, dtype=COLUMNS["status"][1]),
+        }
+        day = day_of(ts)
+        part = self.root / day
+        with self._lock:
+            part.mkdir(parents=True, exist_ok=True)
+            for name, (fname, _) in COLUMNS.items():
+                with open(part / fname, "ab") as f:
+                    f.write(data[name].tobytes())
+            self._sealed.pop(day, None)
+        return n
+
+    def on_snapshot(self, snap) -> None:
+        # 作为 SnapshotCache 的监听器，每个新快照写入一次
+        self.append(snap.rows, snap.fetched_at)
+
+    # ---- 读取 ----
+
+    def partitions(self) -> List[str]:
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir() and p.name.isdigit() and len(p.name) == 8)
+
+    def _open(self, day: str) -> Optional[Dict[str, "np.ndarray"]]:
+        with self._lock:
+            cols = self._sealed.get(day)
+            if cols is not None:
+                self._sealed.move_to_end(day)
+                return cols
+        part = self.root / day
+        sizes = {}
+        for name, (fname, dtype) in COLUMNS.items():
+            path = part / fname
+            sizes[name] = path.stat().st_size // np.dtype(dtype).itemsize if path.exists() else 0
+        # 写入中途崩溃时各列长度可能不同，以最短的列为准
+        rows = min(sizes.values())
+        if rows == 0:
+            return None
+        cols = {
+            name: np.memmap(part / fname, dtype=dtype, mode="r", shape=(rows,))
+            for name, (fname, dtype) in COLUMNS.items()
+        }
+        # 当天分区仍在追加，不缓存映射；淘汰的映射在正在使用的切片释放后关闭
+        if day < day_of(time.time()):
+            with self._lock:
+                self._sealed[day] = cols
+                self._sealed.move_to_end(day)
+                while len(self._sealed) > self.max_open:
+                    self._sealed.popitem(last=False)
+        return cols
+
+    def scan(self, start: float, end: float) -> Iterator[Tuple[str, Dict[str, "np.ndarray"]]]:
+        """
+        按分区产出 [start, end) 时间范围内的列切片（memmap 视图，零拷贝）
+
+        Args:
+            start: 起始时间（Unix 秒，含）
+            end: 结束时间（Unix 秒，不含）
+        """
+        if not self.enabled or end <= start:
+            return
+        first = day_of(start)
+        last = day_of(end) if math.isfinite(end) else "99999999"
+        for day in self.partitions():
+            # 目录名即日期，范围外的分区不打开
+            if day < first or day > last:
+                continue
+            cols = self._open(day)
+            if cols is None:
+                continue
+            ts = cols["ts"]
+            lo = int(np.searchsorted(ts, start, side="left"))
+            hi = int(np.searchsorted(ts, end, side="left"))
+            if lo < hi:
+                yield day, {name: col[lo:hi] for name, col in cols.items()}
+
+    def series(self, code: str, start: float, end: float) -> Dict[str, "np.ndarray"]:
+        """
+        返回单只基金在 [start, end) 内的时间序列（ts / premium / status 三列）
+
+        Args:
+            code: 基金代码
+            start: 起始时间（Unix 秒，含）
+            end: 结束时间（Unix 秒，不含）
+        """
+        key = _code_int(code)
+        parts: Dict[str, List["np.ndarray"]] = {"ts": [], "premium": [], "status": []}
+        if key is not None:
+            for _, cols in self.scan(start, end):
+                mask = cols["code"] == key
+                if not mask.any():
+                    continue
+                for name in parts:
+                    parts[name].append(cols[name][mask])
+        if np is None:
+            return {}
+        return {
+            name: np.concatenate(chunks) if chunks else np.empty(0, dtype=COLUMNS[name][1])
+            for name, chunks in parts.items()
+        }
+
+    def history(self, code: str, start: float, end: float) -> List[Dict[str, object]]:
+        # 渲染为 MCP 工具返回的记录列表
+        if not self.enabled:
+            return []
+        s = self.series(code, start, end)
+        out: List[Dict[str, object]] = []
+        for ts, premium, status in zip(s["ts"].tolist(), s["premium"].tolist(), s["status"].tolist()):
+            out.append({
+                "时间": datetime.fromtimestamp(ts, CN_TZ).strftime("%Y-%m-%d %H:%M:%S"),
+                "T-1溢价率": None if premium != premium else round(premium, 2),
+                "申购状态": STATUS_CODES[status].value if status < len(STATUS_CODES) else "",
+            })
+        return out
+
+    def stats(self) -> Dict[str, object]:
+        parts = self.partitions()
+        return {"enabled": self.enabled, "root": str(self.root), "partitions": len(parts), "first": parts[0] if parts else None, "last": parts[-1] if parts else None}
+
+
+def from_env() -> PremiumHistory:
+    root = os.getenv("PREMIUM_HISTORY_DIR") or str(Path(__file__).parent / "data" / "premium_history")
+    enabled = os.getenv("PREMIUM_HISTORY_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+    return PremiumHistory(root, enabled=enabled, max_open=int(os.getenv("PREMIUM_HISTORY_MAX_OPEN", "64")))
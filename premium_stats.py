@@ -0,0 +1,219 @@
+"""
+溢价率滚动统计：随快照增量更新的逐基金状态
+
+T-1 溢价率每个交易日只变化一次，统计按交易日（北京时间工作日）推进：
+- 当天内的快照只更新"今日值"与今日最高值
+- 跨日时把前一交易日的最后一个值并入 EWMA 均值 / 方差，并更新连续超阈值天数
+- 滚动最高值用 (基金数 x 窗口天数) 的环形日最高值矩阵维护，更新 O(1)，查询按行取最大
+- 天数按收到过快照的交易日计算，没有快照的日子不推进窗口
+
+所有状态保存在按基金槽位索引的 NumPy 数组中，更新只触及本次快照中的基金，不回看历史。
+"""
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from fund_quote import FundQuote
+
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None  # type: ignore
+
+logger = logging.getLogger("mcp_server.stats")
+
+CN_TZ = timezone(timedelta(hours=8))
+
+RANK_KEYS = ("zscore", "persistence")
+
+
+def trading_day(ts: float) -> Optional[int]:
+    # 返回北京时间日期的序号，周末返回 None（未考虑节假日）
+    d = datetime.fromtimestamp(ts, CN_TZ).date()
+    if d.weekday() >= 5:
+        return None
+    return d.toordinal()
+
+
+class RollingPremiumStats:
+    def __init__(self, threshold: float = 2.0, halflife: float = 20.0, window: int = 60, capacity: int = 1024):
+        """
+        Args:
+            threshold: 计算连续超阈值天数使用的溢价率阈值
+            halflife: EWMA 半衰期（交易日）
+            window: 滚动最高值的窗口（交易日）
+            capacity: 初始基金槽位数，不足时自动翻倍
+        """
+        self.threshold = threshold
+        self.alpha = 1.0 - 0.5 ** (1.0 / halflife)
+        self.window = window
+        self.enabled = np is not None
+        self._lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._day: Optional[int] = None
+        self._ring_pos = 0
+        self.updates = 0
+        if self.enabled:
+            self._alloc(capacity)
+        else:
+            logger.warning("未安装 numpy，溢价率滚动统计已禁用")
+
+    def _alloc(self, capacity: int) -> None:
+        self.mean = np.zeros(capacity)
+        self.var = np.zeros(capacity)
+        self.days = np.zeros(capacity, dtype=np.int32)  # 已并入 EWMA 的交易日数
+        self.streak = np.zeros(capacity, dtype=np.int32)  # 截至上一交易日的连续超阈值天数
+        self.current = np.full(capacity, np.nan)  # 当日最新值
+        self.seen = np.zeros(capacity, dtype=bool)  # 当日是否出现过
+        self.daily_max = np.full((capacity, self.window), -np.inf)
+
+    def _grow(self, need: int) -> None:
+        cap = len(self.mean)
+        if need <= cap:
+            return
+        new_cap = max(need, cap * 2)
+        old = (self.mean, self.var, self.days, self.streak, self.current, self.seen, self.daily_max)
+        self._alloc(new_cap)
+        for dst, src in zip((self.mean, self.var, self.days, self.streak, self.current, self.seen, self.daily_max), old):
+            dst[:cap] = src
+
+    def _slot_indices(self, quotes: Sequence[FundQuote]) -> "np.ndarray":
+        idx = np.empty(len(quotes), dtype=np.intp)
+        for i, q in enumerate(quotes):
+            slot = self._slots.get(q.code)
+            if slot is None:
+                slot = len(self._names)
+                self._slots[q.code] = slot
+                self._names.append(q.name)
+            else:
+                self._names[slot] = q.name
+            idx[i] = slot
+        self._grow(len(self._names))
+        return idx
+
+    def _roll(self, day: int) -> None:
+        # 把上一交易日的值并入 EWMA 与连续天数，然后开启新的一天
+        n = len(self._names)
+        seen = self.seen[:n]
+        x = self.current[:n][seen]
+        first = self.days[:n][seen] == 0
+        mean = self.mean[:n][seen]
+        var = self.var[:n][seen]
+        diff = x - mean
+        incr = self.alpha * diff
+        new_mean = np.where(first, x, mean + incr)
+        new_var = np.where(first, 0.0, (1.0 - self.alpha) * (var + diff * incr))
+        self.mean[:n][seen] = new_mean
+        self.var[:n][seen] = new_var
+        self.days[:n][seen] += 1
+        above = x > self.threshold
+        self.streak[:n][seen] = np.where(above, self.streak[:n][seen] + 1, 0)
+        self.seen[:n] = False
+        self.current[:n] = np.nan
+        self._ring_pos = (self._ring_pos + 1) % self.window
+        self.daily_max[:, self._ring_pos] = -np.inf
+        self._day = day
+
+    def update(self, quotes: Sequence[FundQuote], ts: Optional[float] = None) -> int:
+        """并入一次快照，返回更新的基金数；周末的快照忽略"""
+        if not self.enabled or not quotes:
+            return 0
+        day = trading_day(time.time() if ts is None else ts)
+        if day is None:
+            return 0
+        quotes = [q for q in quotes if not math.isnan(q.premium)]
+        if not quotes:
+            return 0
+        with self._lock:
+            if self._day is None:
+                self._day = day
+            elif day > self._day:
+                self._roll(day)
+            elif day < self._day:
+                # 乱序的旧快照不参与统计
+                return 0
+            idx = self._slot_indices(quotes)
+            premium = np.fromiter((q.premium for q in quotes), dtype=np.float64, count=len(quotes))
+            self.current[idx] = premium
+            self.seen[idx] = True
+            col = self.daily_max[:, self._ring_pos]
+            col[idx] = np.maximum(col[idx], premium)
+            self.updates += 1
+        return len(quotes)
+
+    def on_snapshot(self, snap) -> None:
+        # 作为 SnapshotCache 的监听器
+        self.update(snap.rows, snap.fetched_at)
+
+    def _view(self) -> Dict[str, "np.ndarray"]:
+        n = len(self._names)
+        seen = self.seen[:n]
+        current = self.current[:n]
+        std = np.sqrt(self.var[:n])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.where((std > 0) & seen, (current - self.mean[:n]) / std, np.nan)
+        # 当日低于阈值的基金连续天数归零；当日未出现的基金连续天数仍保留到上一交易日
+        streak = np.where(seen, np.where(current > self.threshold, self.streak[:n] + 1, 0), self.streak[:n])
+        rolling_max = self.daily_max[:n].max(axis=1)
+        return {"current": current, "seen": seen, "mean": self.mean[:n], "std": std, "z": z, "streak": streak, "max": rolling_max, "days": self.days[:n]}
+
+    def rank(self, by: str = "zscore", top: int = 20, min_days: int = 5) -> List[Dict[str, Any]]:
+        """
+        按溢价率 z 分数或连续超阈值天数排序
+
+        Args:
+            by: "zscore" 或 "persistence"
+            top: 返回的基金数
+            min_days: 计算 z 分数至少需要的历史交易日数
+        """
+        if by not in RANK_KEYS:
+            raise ValueError(f"未知的排序方式: {by}，可选 {', '.join(RANK_KEYS)}")
+        if not self.enabled or not self._names:
+            return []
+        with self._lock:
+            v = self._view()
+            if by == "zscore":
+                eligible = v["seen"] & (v["days"] >= min_days) & ~np.isnan(v["z"])
+                key = v["z"]
+            else:
+                eligible = v["streak"] > 0
+                # 连续天数相同时按当前溢价率排序
+                key = v["streak"] + np.nan_to_num(v["current"], nan=0.0) / 1e4
+            cand = np.flatnonzero(eligible)
+            if len(cand) > top:
+                cand = cand[np.argpartition(-key[cand], top - 1)[:top]]
+            order = cand[np.argsort(-key[cand], kind="stable")]
+            codes = list(self._slots)
+            return [self._record(codes[i], i, v) for i in order.tolist()]
+
+    def _record(self, code: str, i: int, v: Dict[str, "np.ndarray"]) -> Dict[str, Any]:
+        def num(x: float, nd: int = 2) -> Optional[float]:
+            return None if not math.isfinite(x) else round(float(x), nd)
+
+        return {
+            "代码": code,
+            "名称": self._names[i],
+            "T-1溢价率": num(v["current"][i]),
+            "均值": num(v["mean"][i]),
+            "标准差": num(v["std"][i]),
+            "z分数": num(v["z"][i]),
+            "滚动最高": num(v["max"][i]),
+            "连续超阈值天数": int(v["streak"][i]),
+            "历史天数": int(v["days"][i]),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "funds": len(self._names), "updates": self.updates, "threshold": self.threshold, "window": self.window}
+
+
+def from_env() -> RollingPremiumStats:
+    return RollingPremiumStats(
+        threshold=float(os.getenv("PREMIUM_STATS_THRESHOLD", "2.0")),
+        halflife=float(os.getenv("PREMIUM_STATS_HALFLIFE", "20")),
+        window=int(os.getenv("PREMIUM_STATS_WINDOW", "60")),
+    )
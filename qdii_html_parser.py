@@ -0,0 +1,110 @@
+"""
+集思录 QDII 页面的单遍流式解析
+
+按块喂入响应字节，用预编译的 <tr> 分词正则在滚动缓冲区上扫描，每当一个 <tr> 结束
+就产出一行 FundQuote。不构建整棵文档树，也不对整页做多轮正则替换，
+缓冲区只保留尚未闭合的那一行，内存占用与页面大小无关。
+"""
+import codecs
+import html
+import re
+from typing import Iterable, Iterator, List, Optional
+
+from fund_quote import FundQuote
+
+# 表格单元格的 data-name 与 FundQuote 字段的对应关系
+_FIELDS = ("fund_id", "fund_nm", "discount_rt", "apply_status")
+
+_RE_ROW = re.compile(r"<tr\b[^>]*>(.*?)</tr\s*>", re.S | re.I)
+_RE_ROW_START = re.compile(r"<tr\b", re.I)
+_RE_CELL = re.compile(r"<td\b[^>]*?\bdata-name=[\"']?([\w-]+)[^>]*>(.*?)</td\s*>", re.S | re.I)
+_RE_TAG = re.compile(r"<[^>]*>")
+
+# 没有 data-name 的行按文本标签回退提取（只作用于单行文本）
+_RE_CODE = re.compile(r"\b(\d{6})\b")
+_RE_NAME = re.compile(r"\b\d{6}\b\s*([^\d%\-]{2,}?)\s")
+_RE_T1 = re.compile(r"T-1溢价率\s*([+\-]?[\d\.]+)%")
+_RE_STATUS = re.compile(r"申购状态\s*([\u4e00-\u9fffA-Za-z0-9%]+)")
+
+# 未闭合的行超过该长度视为残缺，丢弃以免反复扫描
+_MAX_PENDING = 1 << 20
+
+
+def _unescape(s: str) -> str:
+    return html.unescape(s) if "&" in s else s
+
+
+def _cell_text(raw: str) -> str:
+    return _unescape(_RE_TAG.sub("", raw)).strip()
+
+
+def _build_row(row: str) -> Optional[FundQuote]:
+    cells = {name: raw for name, raw in _RE_CELL.findall(row) if name in _FIELDS}
+    if cells:
+        code = _cell_text(cells.get("fund_id", ""))
+        status = _cell_text(cells.get("apply_status", ""))
+        if not code and not status:
+            return None
+        return FundQuote.from_raw(code, _cell_text(cells.get("fund_nm", "")), _cell_text(cells.get("discount_rt", "")), status)
+    text = " ".join(_unescape(_RE_TAG.sub(" ", row)).split()) + " "
+    m_code = _RE_CODE.search(text)
+    if not m_code:
+        return None
+    m_t1 = _RE_T1.search(text)
+    m_sub = _RE_STATUS.search(text)
+    if not m_t1 and not m_sub:
+        return None
+    m_name = _RE_NAME.search(text)
+    return FundQuote.from_raw(
+        m_code.group(1),
+        m_name.group(1).strip() if m_name else "",
+        m_t1.group(1) + "%" if m_t1 else "",
+        m_sub.group(1) if m_sub else "",
+    )
+
+
+class StreamingRowParser:
+    """增量解析器：feed() 字节块，返回本块内新闭合的行"""
+
+    def __init__(self, encoding: str = "utf-8"):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+        self._buf = ""
+
+    def _scan(self, final: bool = False) -> List[FundQuote]:
+        buf = self._buf
+        rows: List[FundQuote] = []
+        pos = 0
+        for m in _RE_ROW.finditer(buf):
+            quote = _build_row(m.group(1))
+            if quote is not None:
+                rows.append(quote)
+            pos = m.end()
+        if final:
+            self._buf = ""
+            return rows
+        # 只保留最后一个未闭合的 <tr>；没有时保留末尾几个字符以防标签被截断
+        start = _RE_ROW_START.search(buf, pos)
+        if start is not None and len(buf) - start.start() <= _MAX_PENDING:
+            self._buf = buf[start.start():]
+        else:
+            self._buf = buf[-8:]
+        return rows
+
+    def feed(self, chunk: bytes) -> List[FundQuote]:
+        self._buf += self._decoder.decode(chunk)
+        return self._scan()
+
+    def close(self) -> List[FundQuote]:
+        self._buf += self._decoder.decode(b"", final=True)
+        return self._scan(final=True)
+
+
+def iter_rows(chunks: Iterable[bytes]) -> Iterator[FundQuote]:
+    parser = StreamingRowParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
+
+
+def parse_rows(page: str) -> List[FundQuote]:
+    return list(iter_rows([page.encode("utf-8")]))
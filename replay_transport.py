@@ -0,0 +1,156 @@
+"""
+录制 / 回放 HTTP 传输层
+
+挂到共享 HTTP 客户端注册表上后，jisilu_mcp_server、wechat_server 与 deepseek_client
+的所有请求都经过它：
+- record 模式：转发到真实上游，并把响应保存到夹具目录
+- replay 模式：直接从夹具目录返回响应，不访问网络
+两种模式都可以注入固定延迟与随机失败，用于离线测试与基准。
+
+环境变量 HTTP_REPLAY_DIR / HTTP_REPLAY_MODE / HTTP_REPLAY_LATENCY / HTTP_REPLAY_FAILURE_RATE
+可在启动服务时直接启用（见 http_clients.ClientRegistry.from_env）。
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import httpx
+
+# 每次请求都会变化的参数（集思录的时间戳防缓存参数），不参与夹具匹配
+VOLATILE_PARAMS = frozenset({"___jsl"})
+
+# 不写入夹具的请求 / 响应头
+_SKIP_HEADERS = frozenset({"authorization", "content-encoding", "content-length", "transfer-encoding", "set-cookie", "connection"})
+
+
+class ReplayMissError(httpx.TransportError):
+    """回放模式下没有匹配的夹具"""
+
+
+def _redacted_path(url: httpx.URL) -> str:
+    # Server酱的 SendKey 在路径中，不写入夹具也不参与匹配
+    if url.host == "sctapi.ftqq.com":
+        return "/SENDKEY.send"
+    return url.path
+
+
+def _stable_params(url: httpx.URL) -> "list[tuple[str, str]]":
+    return sorted((k, v) for k, v in url.params.multi_items() if k not in VOLATILE_PARAMS)
+
+
+def fixture_key(request: httpx.Request) -> str:
+    path = _redacted_path(request.url)
+    raw = json.dumps([request.method, request.url.host, path, _stable_params(request.url)], ensure_ascii=False)
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+    slug = re.sub(r"[^A-Za-z0-9_]+", "_", path.strip("/"))[:40] or "root"
+    return f"{request.url.host}/{request.method}_{slug}_{digest}.json"
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    def __init__(
+        self,
+        fixtures_dir: "str | Path",
+        mode: str = "replay",
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+        upstream: Optional[httpx.BaseTransport] = None,
+        async_upstream: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        Args:
+            fixtures_dir: 夹具目录
+            mode: "replay" 只读夹具，"record" 转发到上游并保存响应
+            latency: 每个请求注入的延迟（秒）
+            failure_rate: 每个请求以该概率抛出 httpx.ConnectError
+            seed: 失败注入的随机种子
+            upstream / async_upstream: record 模式使用的真实传输层
+        """
+        if mode not in ("replay", "record"):
+            raise ValueError(f"未知的回放模式: {mode}")
+        self.fixtures_dir = Path(fixtures_dir)
+        self.mode = mode
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rnd = random.Random(seed)
+        self._upstream = upstream
+        self._async_upstream = async_upstream
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        self.requests = 0
+
+    # ---- 夹具读写 ----
+
+    def path_for(self, request: httpx.Request) -> Path:
+        return self.fixtures_dir / fixture_key(request)
+
+    def _load(self, request: httpx.Request) -> httpx.Response:
+        path = self.path_for(request)
+        key = str(path)
+        data = self._cache.get(key)
+        if data is None:
+            if not path.exists():
+                raise ReplayMissError(f"没有匹配的夹具: {request.method} {request.url} -> {path}", request=request)
+            data = json.loads(path.read_text(encoding="utf-8"))
+            self._cache[key] = data
+        body = base64.b64decode(data["body_b64"]) if "body_b64" in data else data.get("body", "").encode("utf-8")
+        return httpx.Response(data["status_code"], headers=data.get("headers", {}), content=body, request=request)
+
+    def save(self, request: httpx.Request, response: httpx.Response) -> Path:
+        path = self.path_for(request)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data: Dict[str, Any] = {
+            "request": {
+                "method": request.method,
+                "url": f"{request.url.scheme}://{request.url.host}{_redacted_path(request.url)}",
+                "params": dict(_stable_params(request.url)),
+            },
+            "status_code": response.status_code,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() not in _SKIP_HEADERS},
+        }
+        try:
+            data["body"] = response.content.decode("utf-8")
+        except UnicodeDecodeError:
+            data["body_b64"] = base64.b64encode(response.content).decode("ascii")
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        self._cache.pop(str(path), None)
+        return path
+
+    def _maybe_fail(self, request: httpx.Request) -> None:
+        self.requests += 1
+        if self.failure_rate and self._rnd.random() < self.failure_rate:
+            raise httpx.ConnectError("注入的连接失败", request=request)
+
+    # ---- 同步 / 异步接口 ----
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            time.sleep(self.latency)
+        self._maybe_fail(request)
+        if self.mode == "replay":
+            return self._load(request)
+        if self._upstream is None:
+            self._upstream = httpx.HTTPTransport()
+        response = self._upstream.handle_request(request)
+        response.read()
+        self.save(request, response)
+        return self._load(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._maybe_fail(request)
+        if self.mode == "replay":
+            return self._load(request)
+        if self._async_upstream is None:
+            self._async_upstream = httpx.AsyncHTTPTransport()
+        response = await self._async_upstream.handle_async_request(request)
+        await response.aread()
+        self.save(request, response)
+        # 返回与回放时完全一致的响应（已去掉压缩相关的头）
+        return self._load(request)
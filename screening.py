@@ -0,0 +1,139 @@
+"""
+筛选引擎：PremiumIndex 为每个快照预先构建溢价率有序索引与申购状态位图，阈值查询只需一次二分，
+用于快照上的反复查询（不同阈值的候选、Top N、区间计数）。未安装 numpy 时位图用列表实现。
+"""
+import bisect
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Sequence
+
+from fund_quote import ApplyStatus, FundQuote
+
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None  # type: ignore
+
+_STATUS_ORDER: List[ApplyStatus] = list(ApplyStatus)
+_STATUS_CODE = {s: i for i, s in enumerate(_STATUS_ORDER)}
+
+# 默认排除的申购状态，与 qdii_candidates 的过滤规则一致
+DEFAULT_EXCLUDED: FrozenSet[ApplyStatus] = frozenset({ApplyStatus.SUSPENDED, ApplyStatus.OPEN})
+
+
+@dataclass(frozen=True)
+class Screen:
+    threshold: float = 2.0
+    excluded: FrozenSet[ApplyStatus] = DEFAULT_EXCLUDED
+
+
+class PremiumIndex:
+    """
+    快照的溢价率有序索引与申购状态位图，每个快照构建一次
+
+    - 有溢价率的基金按溢价率降序排列（溢价率缺失的不进入索引），阈值查询为一次二分
+    - 每个申购状态一张位图（按排名位置），状态过滤为位图的并集与前缀相交
+    - 每组排除状态的前缀计数只算一次，计数与 Top N 查询不需要遍历全部行
+    未安装 numpy 时位图与前缀计数用列表实现。
+    """
+
+    def __init__(self, quotes: Sequence[FundQuote]):
+        self.quotes = list(quotes)
+        n = len(self.quotes)
+        # 降序、稳定排序：溢价率相同时保持快照中的原始顺序
+        if np is not None:
+            premium = np.fromiter((q.premium for q in self.quotes), dtype=np.float64, count=n)
+            valid = np.flatnonzero(~np.isnan(premium))
+            self._order = valid[np.argsort(-premium[valid], kind="stable")]
+            self._ascending = premium[self._order][::-1].copy()
+            codes = np.fromiter((_STATUS_CODE[q.status] for q in self.quotes), dtype=np.int8, count=n)[self._order]
+            self._bitmaps = {s: codes == _STATUS_CODE[s] for s in _STATUS_ORDER}
+        else:
+            premiums = [q.premium for q in self.quotes]
+            self._order = sorted((i for i, p in enumerate(premiums) if p == p), key=lambda i: -premiums[i])
+            self._ascending = [premiums[i] for i in reversed(self._order)]
+            codes = [_STATUS_CODE[self.quotes[i].status] for i in self._order]
+            self._bitmaps = {s: [c == _STATUS_CODE[s] for c in codes] for s in _STATUS_ORDER}
+        # 排除状态集合 -> (允许位图, 前缀计数)
+        self._allowed: Dict[FrozenSet[ApplyStatus], Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def _prefix(self, excluded: FrozenSet[ApplyStatus]):
+        cached = self._allowed.get(excluded)
+        if cached is None:
+            allowed_statuses = [s for s in _STATUS_ORDER if s not in excluded]
+            if np is not None:
+                allowed = np.zeros(len(self._order), dtype=bool)
+                for s in allowed_statuses:
+                    allowed |= self._bitmaps[s]
+                cached = (allowed, np.cumsum(allowed))
+            else:
+                allowed = [any(self._bitmaps[s][i] for s in allowed_statuses) for i in range(len(self._order))]
+                cumsum, total = [], 0
+                for a in allowed:
+                    total += a
+                    cumsum.append(total)
+                cached = (allowed, cumsum)
+            self._allowed[excluded] = cached
+        return cached
+
+    def rank_above(self, threshold: float) -> int:
+        """溢价率大于 threshold 的基金数（不考虑申购状态），即排名前缀的长度"""
+        if np is not None:
+            return len(self._order) - int(np.searchsorted(self._ascending, threshold, side="right"))
+        return len(self._order) - bisect.bisect_right(self._ascending, threshold)
+
+    def count(self, threshold: float, excluded: Iterable[ApplyStatus] = DEFAULT_EXCLUDED) -> int:
+        """溢价率大于 threshold 且申购状态未被排除的基金数"""
+        n = self.rank_above(threshold)
+        if n == 0:
+            return 0
+        _, cumsum = self._prefix(frozenset(excluded))
+        return int(cumsum[n - 1])
+
+    def buckets(self, edges: Sequence[float], excluded: Iterable[ApplyStatus] = frozenset()) -> List[Dict[str, Any]]:
+        """
+        按溢价率区间计数：(-inf, e0]、(e0, e1]、…、(e_last, +inf)
+
+        Args:
+            edges: 区间边界，自动排序去重
+            excluded: 排除的申购状态
+        """
+        excluded = frozenset(excluded)
+        edges = sorted(set(edges))
+        if not edges:
+            return []
+        _, cumsum = self._prefix(excluded)
+        total = int(cumsum[-1]) if len(self._order) else 0
+        above = [self.count(e, excluded) for e in edges]
+        out = [{"min": None, "max": edges[0], "count": total - above[0]}]
+        for i in range(len(edges) - 1):
+            out.append({"min": edges[i], "max": edges[i + 1], "count": above[i] - above[i + 1]})
+        out.append({"min": edges[-1], "max": None, "count": above[-1]})
+        return out
+
+    def top(self, n: int, excluded: Iterable[ApplyStatus] = frozenset()) -> List[FundQuote]:
+        """溢价率最高的 n 只基金（降序），跳过被排除状态的基金"""
+        if n <= 0 or not len(self._order):
+            return []
+        _, cumsum = self._prefix(frozenset(excluded))
+        if np is not None:
+            # 前缀计数第一次达到 1..n 的位置即为前 n 个允许的排名位置
+            ranks = np.searchsorted(cumsum, np.arange(1, min(n, int(cumsum[-1])) + 1), side="left")
+            return [self.quotes[self._order[r]] for r in ranks]
+        ranks = [bisect.bisect_left(cumsum, k) for k in range(1, min(n, cumsum[-1]) + 1)]
+        return [self.quotes[self._order[r]] for r in ranks]
+
+    def screen_many(self, screens: Sequence[Screen]) -> List[List[FundQuote]]:
+        """按给定顺序返回每个筛选条件命中的基金（保持快照中的原始顺序）：每个条件一次二分加位图前缀"""
+        out: List[List[FundQuote]] = []
+        for s in screens:
+            n = self.rank_above(s.threshold)
+            allowed, _ = self._prefix(s.excluded)
+            if np is not None:
+                positions = np.sort(self._order[:n][allowed[:n]])
+            else:
+                positions = sorted(self._order[i] for i in range(n) if allowed[i])
+            out.append([self.quotes[i] for i in positions])
+        return out
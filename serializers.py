@@ -0,0 +1,115 @@
+"""
+JSON 编解码层：优先使用 msgspec / orjson，未安装时回退到标准库 json
+
+- dumps / loads：通用编解码，输出紧凑、不转义中文
+- decode_fund_page：按类型化结构只解码集思录列表接口中用到的字段
+  （rows[].cell 的 fund_id / fund_nm / discount_rt / apply_status 与 total），其余字段跳过
+- JSON_BACKEND 环境变量可指定 msgspec / orjson / json，默认 auto（按上述顺序选择已安装的）
+"""
+import json
+import logging
+import os
+from typing import Any, List, Optional, Tuple, Union
+
+logger = logging.getLogger("mcp_server.json")
+
+try:
+    import msgspec  # type: ignore
+except Exception:
+    msgspec = None  # type: ignore
+
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
+
+# (代码, 名称, 溢价率原文, 申购状态原文)
+Cell = Tuple[Any, Any, Any, Any]
+
+
+def _select_backend(name: str) -> str:
+    available = {"msgspec": msgspec is not None, "orjson": orjson is not None, "json": True}
+    if name in available:
+        if available[name]:
+            return name
+        logger.warning(f"JSON_BACKEND={name} 未安装，改为自动选择")
+    return next(n for n in ("msgspec", "orjson", "json") if available[n])
+
+
+BACKEND = _select_backend(os.getenv("JSON_BACKEND", "auto").lower())
+
+if msgspec is not None:
+    class _Cell(msgspec.Struct):
+        fund_id: Optional[str] = ""
+        fund_nm: Optional[str] = ""
+        discount_rt: Union[str, float, None] = ""
+        apply_status: Optional[str] = ""
+
+    class _Row(msgspec.Struct):
+        cell: _Cell = msgspec.field(default_factory=_Cell)
+
+    class _Page(msgspec.Struct):
+        rows: List[_Row] = []
+        total: Union[int, str, None] = 0
+
+    _page_decoder = msgspec.json.Decoder(_Page)
+    _encoder = msgspec.json.Encoder()
+    _decoder = msgspec.json.Decoder()
+
+
+def _stdlib_dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps(obj: Any) -> str:
+    """编码为紧凑 JSON 文本（中文不转义）；快速后端不支持的类型回退到标准库"""
+    try:
+        if BACKEND == "msgspec":
+            return _encoder.encode(obj).decode("utf-8")
+        if BACKEND == "orjson":
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return _stdlib_dumps(obj)
+
+
+def loads(data: "str | bytes") -> Any:
+    """解码 JSON；非法 UTF-8 时忽略无法解码的字节后用标准库解析"""
+    try:
+        if BACKEND == "msgspec":
+            return _decoder.decode(data)
+        if BACKEND == "orjson":
+            return orjson.loads(data)
+        return json.loads(data)
+    except Exception:
+        if isinstance(data, bytes):
+            return json.loads(data.decode("utf-8", errors="ignore"))
+        raise
+
+
+def fund_cells(data: Any) -> Tuple[List[Cell], Any]:
+    # 已解码的列表接口响应中取出用到的字段；LOF 与 QDII 字段名一致
+    if not isinstance(data, dict):
+        return [], 0
+    cells: List[Cell] = []
+    for row in data.get("rows") or []:
+        cell = row.get("cell", {}) if isinstance(row, dict) else {}
+        cells.append((cell.get("fund_id", ""), cell.get("fund_nm", ""), cell.get("discount_rt", ""), cell.get("apply_status", "")))
+    return cells, data.get("total")
+
+
+def decode_fund_page(content: "str | bytes") -> Tuple[List[Cell], Any]:
+    """
+    解码集思录列表接口的一页，返回 (各行的字段元组, total)
+
+    msgspec 后端按类型化结构解码，跳过未使用的字段；结构不符（例如字段类型变化）时回退为通用解码
+    """
+    if BACKEND == "msgspec":
+        try:
+            page = _page_decoder.decode(content)
+            cells = [(r.cell.fund_id, r.cell.fund_nm, r.cell.discount_rt, r.cell.apply_status) for r in page.rows]
+            return cells, page.total
+        except msgspec.DecodeError:
+            # ValidationError 是 DecodeError 的子类
+            pass
+    return fund_cells(loads(content))
@@ -0,0 +1,155 @@
+"""
+进程级快照缓存：在 TTL 内直接返回上一次抓取的数据
+
+- TTL 内命中直接返回（hit）
+- 过期但仍在 max_stale 范围内时返回旧快照，同时在后台刷新（stale-while-revalidate）
+- 无可用快照时并发请求合并为同一个抓取任务（single-flight）
+- 每个新快照产生后依次通知监听器（例如写入溢价率历史）
+- 上游熔断时（fast_fail 返回 True）直接返回已有快照，不论新旧，后台照常尝试刷新
+- 抓取函数返回与当前快照同一个对象（上游未变化）时只刷新抓取时间，版本号与派生数据不变，不通知监听器
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+logger = logging.getLogger("mcp_server.cache")
+
+
+@dataclass
+class Snapshot(Generic[T]):
+    rows: T
+    fetched_at: float
+    version: int
+    # 基于本快照计算出的派生数据（溢价率索引等），随快照一起失效
+    derived: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def memo(self, key: str, factory: Callable[[], Any]) -> Any:
+        if key not in self.derived:
+            self.derived[key] = factory()
+        return self.derived[key]
+
+
+class SnapshotCache(Generic[T]):
+    def __init__(
+        self,
+        fetch: Callable[[], Awaitable[T]],
+        ttl: float = 60.0,
+        max_stale: float = 600.0,
+        fast_fail: Optional[Callable[[], bool]] = None,
+        run_listeners: Optional[Callable[[Callable[[Snapshot[T]], None], Snapshot[T]], Awaitable[None]]] = None,
+    ):
+        """
+        Args:
+            fetch: 异步抓取函数，返回空结果视为失败，不会覆盖已有快照
+            ttl: 快照保持新鲜的秒数
+            max_stale: 过期后仍可作为旧数据返回的秒数
+            fast_fail: 返回 True 时表示上游不可用，超过 max_stale 的快照也直接返回
+            run_listeners: 执行监听器的异步函数（例如放到工作线程池），为 None 时在事件循环中同步调用
+        """
+        self._fetch = fetch
+        self._fast_fail = fast_fail
+        self._run_listeners = run_listeners
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._snapshot: Optional[Snapshot[T]] = None
+        self._inflight: Optional["asyncio.Task[Snapshot[T]]"] = None
+        self._version = 0
+        self._listeners: List[Callable[[Snapshot[T]], None]] = []
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0, "unchanged": 0}
+
+    @property
+    def snapshot(self) -> Optional[Snapshot[T]]:
+        return self._snapshot
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = dict(self._stats)
+        out["ttl"] = self.ttl
+        out["age"] = round(self._snapshot.age, 3) if self._snapshot is not None else None
+        out["version"] = self._version
+        out["stale"] = self._snapshot is not None and self._snapshot.age >= self.ttl
+        return out
+
+    def add_listener(self, listener: Callable[[Snapshot[T]], None]) -> None:
+        # 未设置 run_listeners 时监听器在事件循环中同步调用，应保持轻量；抛出的异常只记录日志
+        self._listeners.append(listener)
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    async def get(self) -> Snapshot[T]:
+        snap = self._snapshot
+        if snap is not None:
+            age = snap.age
+            if age < self.ttl:
+                self._stats["hits"] += 1
+                return snap
+            if age < self.ttl + self.max_stale or (self._fast_fail is not None and self._fast_fail()):
+                # 返回旧快照，后台刷新
+                self._stats["stale_hits"] += 1
+                self._refresh_task()
+                return snap
+        self._stats["misses"] += 1
+        return await asyncio.shield(self._refresh_task())
+
+    async def refresh(self) -> Snapshot[T]:
+        # 强制刷新（仍与进行中的抓取合并）
+        return await asyncio.shield(self._refresh_task())
+
+    def _refresh_task(self) -> "asyncio.Task[Snapshot[T]]":
+        task = self._inflight
+        # 事件循环已更换（例如多次 asyncio.run）时旧任务不可复用
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.get_running_loop().create_task(self._do_refresh())
+            self._inflight = task
+        return task
+
+    async def _do_refresh(self) -> Snapshot[T]:
+        self._stats["refreshes"] += 1
+        try:
+            rows = await self._fetch()
+        except Exception:
+            rows = None
+        if not rows:
+            self._stats["errors"] += 1
+            if self._snapshot is not None:
+                return self._snapshot
+            return Snapshot(rows if rows is not None else [], time.time(), self._version)  # type: ignore[arg-type]
+        if self._snapshot is not None and rows is self._snapshot.rows:
+            self._stats["unchanged"] += 1
+            self._snapshot.fetched_at = time.time()
+            return self._snapshot
+        self._version += 1
+        snap = self._snapshot = Snapshot(rows, time.time(), self._version)
+        await self._publish(snap)
+        return snap
+
+    async def put(self, rows: T, fetched_at: Optional[float] = None) -> Snapshot[T]:
+        """放入外部得到的快照（例如其他副本抓取后写入共享存储的版本），同样触发监听器"""
+        self._version += 1
+        snap = self._snapshot = Snapshot(rows, time.time() if fetched_at is None else fetched_at, self._version)
+        await self._publish(snap)
+        return snap
+
+    async def _publish(self, snap: Snapshot[T]) -> None:
+        if self._run_listeners is not None:
+            try:
+                await self._run_listeners(self._notify, snap)
+            except Exception as e:
+                logger.warning(f"快照监听器执行失败: {e}")
+        else:
+            self._notify(snap)
+
+    def _notify(self, snap: Snapshot[T]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(snap)
+            except Exception as e:
+                logger.warning(f"快照监听器执行失败: {e}")
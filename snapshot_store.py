@@ -0,0 +1,382 @@
+"""
+多副本共享快照：选举一个负责抓取集思录的 leader，其余副本只读取共享存储中的快照
+
+- 存储后端：SQLite 文件（同一主机上的多个进程 / 挂载同一卷的容器）或 Redis（可选依赖，跨主机）
+- 快照带递增版本号；follower 监视版本变化，新版本到达后放入本地快照缓存并触发监听器（订阅推送等）
+- leader 通过带过期时间的租约选出，定期续租；leader 退出或卡住后租约过期，由其他副本接管
+- 只有 leader 访问上游，副本数增加不会增加对集思录的请求
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import serializers
+from fund_quote import ApplyStatus, FundQuote
+from metrics import registry as _metrics
+
+logger = logging.getLogger("mcp_server.shared")
+
+LEASE_NAME = "qdii_fetcher"
+
+PUBLISHED = _metrics.counter("shared_snapshots_total", "写入 / 从共享存储读取的快照数", ["op"])
+
+
+def encode_rows(rows: List[FundQuote]) -> str:
+    # 紧凑的 [代码, 名称, 溢价率, 申购状态原文] 数组，溢价率缺失为 null
+    return serializers.dumps([[q.code, q.name, q.premium if q.has_premium else None, q.status_text] for q in rows])
+
+
+def decode_rows(payload: "str | bytes") -> List[FundQuote]:
+    out: List[FundQuote] = []
+    for code, name, premium, status in serializers.loads(payload):
+        out.append(FundQuote(code, name, math.nan if premium is None else float(premium), ApplyStatus.parse(status), status))
+    return out
+
+
+@dataclass
+class StoredSnapshot:
+    version: int
+    fetched_at: float
+    producer: str
+    rows: List[FundQuote]
+
+
+class SQLiteSnapshotStore:
+    def __init__(self, path: str, keep: int = 10):
+        """
+        Args:
+            path: 数据库文件路径，所有副本需指向同一个文件
+            keep: 保留最近多少个版本
+        """
+        self.path = path
+        self.keep = keep
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots (version INTEGER PRIMARY KEY AUTOINCREMENT, fetched_at REAL, producer TEXT, rows TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+
+    def publish(self, rows: List[FundQuote], fetched_at: float, producer: str) -> int:
+        payload = encode_rows(rows)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO snapshots (fetched_at, producer, rows) VALUES (?, ?, ?)", (fetched_at, producer, payload)
+            )
+            version = int(cur.lastrowid)
+            self._conn.execute("DELETE FROM snapshots WHERE version <= ?", (version - self.keep,))
+        return version
+
+    def version(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT MAX(version) FROM snapshots").fetchone()
+        return int(row[0] or 0)
+
+    def latest(self) -> Optional[StoredSnapshot]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, fetched_at, producer, rows FROM snapshots ORDER BY version DESC LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredSnapshot(int(row[0]), float(row[1]), row[2], decode_rows(row[3]))
+
+    def wait_for_change(self, version: int, timeout: float) -> Optional[StoredSnapshot]:
+        # SQLite 没有跨进程通知，按短间隔比较最大版本号（主键索引查询）
+        deadline = time.monotonic() + timeout
+        while True:
+            if self.version() > version:
+                return self.latest()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(0.2, remaining))
+
+    def try_acquire(self, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (LEASE_NAME,)).fetchone()
+                if row is None or row[0] == owner or row[1] < now:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO leases (name, owner, expires) VALUES (?, ?, ?)", (LEASE_NAME, owner, now + ttl)
+                    )
+                    acquired = True
+                else:
+                    acquired = False
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return acquired
+
+    def release(self, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (LEASE_NAME, owner))
+
+    def leader(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (LEASE_NAME,)).fetchone()
+        return row[0] if row is not None and row[1] >= time.time() else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# 只在持有者匹配时续租，保证续租与过期判断是原子的
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) and 1 or 0
+"""
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisSnapshotStore:
+    def __init__(self, url: str, prefix: str = "qdii"):
+        """
+        Args:
+            url: Redis 地址，如 redis://redis:6379/0
+            prefix: 键名前缀
+        """
+        try:
+            import redis  # type: ignore
+        except Exception as e:
+            raise RuntimeError("使用 Redis 共享快照需要安装 redis（pip install redis）") from e
+        self.url = url
+        self._redis = redis.Redis.from_url(url)
+        self._keys = {
+            "version": f"{prefix}:snapshot:version",
+            "latest": f"{prefix}:snapshot:latest",
+            "channel": f"{prefix}:snapshot:changes",
+            "lease": f"{prefix}:lease:{LEASE_NAME}",
+        }
+        self._pubsub = None
+        self._renew = self._redis.register_script(_RENEW_LUA)
+        self._release = self._redis.register_script(_RELEASE_LUA)
+
+    def publish(self, rows: List[FundQuote], fetched_at: float, producer: str) -> int:
+        version = int(self._redis.incr(self._keys["version"]))
+        doc = json.dumps({"version": version, "fetched_at": fetched_at, "producer": producer}, ensure_ascii=False)
+        pipe = self._redis.pipeline()
+        pipe.set(self._keys["latest"], doc + "\n" + encode_rows(rows))
+        pipe.publish(self._keys["channel"], version)
+        pipe.execute()
+        return version
+
+    def version(self) -> int:
+        return int(self._redis.get(self._keys["version"]) or 0)
+
+    def latest(self) -> Optional[StoredSnapshot]:
+        raw = self._redis.get(self._keys["latest"])
+        if not raw:
+            return None
+        head, _, body = raw.decode("utf-8").partition("\n")
+        meta = json.loads(head)
+        return StoredSnapshot(int(meta["version"]), float(meta["fetched_at"]), meta.get("producer", ""), decode_rows(body))
+
+    def wait_for_change(self, version: int, timeout: float) -> Optional[StoredSnapshot]:
+        # 订阅变更频道，收到通知或超时后比较版本号
+        if self._pubsub is None:
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(self._keys["channel"])
+        if self.version() <= version:
+            self._pubsub.get_message(timeout=timeout)
+        latest = self.latest()
+        return latest if latest is not None and latest.version > version else None
+
+    def try_acquire(self, owner: str, ttl: float) -> bool:
+        return bool(self._renew(keys=[self._keys["lease"]], args=[owner, int(ttl * 1000)]))
+
+    def release(self, owner: str) -> None:
+        self._release(keys=[self._keys["lease"]], args=[owner])
+
+    def leader(self) -> Optional[str]:
+        raw = self._redis.get(self._keys["lease"])
+        return raw.decode("utf-8") if raw else None
+
+    def close(self) -> None:
+        if self._pubsub is not None:
+            self._pubsub.close()
+        self._redis.close()
+
+
+class SharedSnapshots:
+    def __init__(
+        self,
+        store: Any,
+        fetch: Callable[[], Awaitable[List[FundQuote]]],
+        owner: Optional[str] = None,
+        lease_ttl: float = 15.0,
+        watch_interval: float = 1.0,
+    ):
+        """
+        Args:
+            store: SQLiteSnapshotStore 或 RedisSnapshotStore
+            fetch: 真正访问上游的抓取函数，只在持有租约时调用
+            owner: 本副本的标识，默认 主机名:进程号:随机串
+            lease_ttl: 租约有效秒数，leader 每 lease_ttl/3 秒续租一次
+            watch_interval: follower 等待新版本的单次超时
+        """
+        self.store = store
+        self._fetch = fetch
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.lease_ttl = lease_ttl
+        self.watch_interval = watch_interval
+        self.is_leader = False
+        self.version = 0
+        # 最近一次发布或读取的行；上游未变化时原样返回同一对象，本地快照缓存保留原版本
+        self._rows: Optional[List[FundQuote]] = None
+        self._renewed_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stats = {"fetches": 0, "published": 0, "loaded": 0, "elections": 0}
+
+    async def _ensure_lease(self) -> bool:
+        try:
+            leader = await asyncio.to_thread(self.store.try_acquire, self.owner, self.lease_ttl)
+        except Exception as e:
+            logger.warning(f"共享存储租约操作失败: {type(e).__name__}: {e}")
+            leader = False
+        if leader and not self.is_leader:
+            self._stats["elections"] += 1
+            logger.info(f"{self.owner} 成为抓取 leader")
+        elif self.is_leader and not leader:
+            logger.info(f"{self.owner} 失去抓取 leader 身份")
+        self.is_leader = leader
+        self._renewed_at = time.monotonic()
+        return leader
+
+    async def fetch(self) -> List[FundQuote]:
+        """快照缓存的抓取函数：leader 抓取上游并发布，follower 读取共享存储中的最新版本"""
+        if await self._ensure_lease():
+            self._stats["fetches"] += 1
+            rows = await self._fetch()
+            if rows and rows is not self._rows:
+                self.version = await asyncio.to_thread(self.store.publish, rows, time.time(), self.owner)
+                self._rows = rows
+                self._stats["published"] += 1
+                PUBLISHED.inc(op="publish")
+            return rows
+        latest = await asyncio.to_thread(self.store.latest)
+        if latest is None:
+            return []
+        if latest.version == self.version and self._rows is not None:
+            return self._rows
+        self.version = latest.version
+        self._rows = latest.rows
+        self._stats["loaded"] += 1
+        PUBLISHED.inc(op="load")
+        return latest.rows
+
+    async def run(self, cache: Any) -> None:
+        """
+        后台任务：定期续租；leader 在快照过期时主动刷新，follower 监视新版本并放入本地缓存
+
+        Args:
+            cache: 本副本的 SnapshotCache
+        """
+        while True:
+            try:
+                if time.monotonic() - self._renewed_at >= self.lease_ttl / 3:
+                    await self._ensure_lease()
+                if self.is_leader:
+                    snap = cache.snapshot
+                    if snap is None or snap.age >= cache.ttl:
+                        await cache.refresh()
+                    await asyncio.sleep(self.watch_interval)
+                    continue
+                latest = await asyncio.to_thread(self.store.wait_for_change, self.version, self.watch_interval)
+                if latest is not None and latest.version > self.version:
+                    self.version = latest.version
+                    self._rows = latest.rows
+                    self._stats["loaded"] += 1
+                    PUBLISHED.inc(op="load")
+                    await cache.put(latest.rows, latest.fetched_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"共享快照同步失败: {type(e).__name__}: {e}")
+                await asyncio.sleep(self.watch_interval)
+
+    def start(self, cache: Any) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self.run(cache))
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None and not task.get_loop().is_closed():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if self.is_leader:
+            # 主动释放租约，其他副本无需等待过期即可接管
+            await asyncio.to_thread(self.store.release, self.owner)
+            self.is_leader = False
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            leader = self.store.leader()
+        except Exception:
+            leader = None
+        return {
+            "owner": self.owner,
+            "is_leader": self.is_leader,
+            "leader": leader,
+            "version": self.version,
+            "store": type(self.store).__name__,
+            **self._stats,
+        }
+
+
+def open_store(url: str) -> Any:
+    """
+    按地址创建存储后端
+
+    Args:
+        url: sqlite:///绝对路径、sqlite:相对路径 或 redis://主机:端口/库
+    """
+    if url.startswith("redis://") or url.startswith("rediss://"):
+        return RedisSnapshotStore(url, prefix=os.getenv("SNAPSHOT_STORE_PREFIX", "qdii"))
+    if url.startswith("sqlite:"):
+        path = url[len("sqlite:"):]
+        if path.startswith("///"):
+            path = path[2:]
+        return SQLiteSnapshotStore(path, keep=int(os.getenv("SNAPSHOT_STORE_KEEP", "10")))
+    raise ValueError(f"不支持的共享快照存储: {url}")
+
+
+def from_env(fetch: Callable[[], Awaitable[List[FundQuote]]]) -> Optional[SharedSnapshots]:
+    # 未配置 SNAPSHOT_STORE 时为单进程模式，返回 None
+    url = os.getenv("SNAPSHOT_STORE", "").strip()
+    if not url:
+        return None
+    return SharedSnapshots(
+        open_store(url),
+        fetch,
+        lease_ttl=float(os.getenv("SNAPSHOT_LEASE_TTL", "15")),
+        watch_interval=float(os.getenv("SNAPSHOT_WATCH_INTERVAL", "1")),
+    )
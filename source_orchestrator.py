@@ -0,0 +1,229 @@
+"""
+多数据源编排：集思录 API 与 akshare 并行或对冲请求，按各来源的历史表现排序
+
+- parallel：同时启动所有来源，取第一个非空结果（merge=True 时等待全部完成后按代码合并）
+- hedged：先启动表现最好的来源，超过其历史延迟分位数仍未返回（或已失败）时再启动下一个来源
+- sequential：依次尝试，前一个来源失败后才启动下一个（原有行为）
+
+每个来源记录最近若干次的延迟与成功率，用于决定下次的优先顺序与对冲等待时间。
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from fund_quote import FundQuote
+from metrics import registry as _metrics
+
+logger = logging.getLogger("mcp_server.sources")
+
+SOURCE_SECONDS = _metrics.histogram("source_fetch_seconds", "数据源整体抓取耗时，按结果分类（ok / empty / error）", ["source", "outcome"])
+
+MODES = ("hedged", "parallel", "sequential")
+
+
+class SourceMetrics:
+    def __init__(self, window: int = 50):
+        """
+        Args:
+            window: 统计最近多少次调用
+        """
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.wins = 0
+        self.last_error: Optional[str] = None
+
+    def record(self, ok: bool, latency: float, error: Optional[str] = None) -> None:
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.successes += 1
+            self.latencies.append(latency)
+        else:
+            self.failures += 1
+            self.last_error = error
+
+    @property
+    def success_rate(self) -> float:
+        # 没有记录时视为可用，保证新来源有机会被尝试
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 1.0
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        data = sorted(self.latencies)
+        k = min(len(data) - 1, max(0, int(round(q * (len(data) - 1)))))
+        return data[k]
+
+    def stats(self) -> Dict[str, Any]:
+        p50, p90 = self.percentile(0.5), self.percentile(0.9)
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "wins": self.wins,
+            "success_rate": round(self.success_rate, 3),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p90": round(p90, 3) if p90 is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+@dataclass
+class Source:
+    name: str
+    fetch: Callable[[], Awaitable[List[FundQuote]]]
+    timeout: float = 60.0
+    metrics: SourceMetrics = field(default_factory=SourceMetrics)
+
+
+def merge_rows(results: List[List[FundQuote]]) -> List[FundQuote]:
+    # 按代码去重合并，排在前面的来源优先
+    seen: Dict[str, FundQuote] = {}
+    for rows in results:
+        for q in rows:
+            if q.code and q.code not in seen:
+                seen[q.code] = q
+    return list(seen.values())
+
+
+class SourceOrchestrator:
+    def __init__(
+        self,
+        sources: List[Source],
+        mode: str = "hedged",
+        hedge_percentile: float = 0.9,
+        hedge_delay: float = 3.0,
+        hedge_min_delay: float = 0.5,
+        merge: bool = False,
+    ):
+        """
+        Args:
+            sources: 数据来源，列表顺序为没有历史数据时的默认优先级
+            mode: "hedged"、"parallel" 或 "sequential"
+            hedge_percentile: 对冲等待时间取首选来源成功延迟的该分位数
+            hedge_delay: 首选来源还没有延迟记录时的对冲等待秒数
+            hedge_min_delay: 对冲等待时间的下限，避免首选来源很快时频繁启动备用来源
+            merge: parallel 模式下等待全部来源并按代码合并，而不是取第一个结果
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的编排模式: {mode}，可选 {', '.join(MODES)}")
+        self.sources = sources
+        self.mode = mode
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.merge = merge
+        self.last_source: Optional[str] = None
+
+    def ranked(self) -> List[Source]:
+        # 成功率高的优先，成功率相同时中位延迟低的优先；还没有成功记录的来源排在后面，彼此保持默认顺序
+        def key(item: Tuple[int, Source]) -> Tuple[float, float, int]:
+            i, s = item
+            p50 = s.metrics.percentile(0.5)
+            return (-round(s.metrics.success_rate, 1), p50 if p50 is not None else float("inf"), i)
+        return [s for _, s in sorted(enumerate(self.sources), key=key)]
+
+    def _hedge_after(self, source: Source) -> float:
+        p = source.metrics.percentile(self.hedge_percentile)
+        return max(p, self.hedge_min_delay) if p is not None else self.hedge_delay
+
+    async def _run(self, source: Source) -> List[FundQuote]:
+        start = time.perf_counter()
+        try:
+            rows = await asyncio.wait_for(source.fetch(), source.timeout)
+        except asyncio.CancelledError:
+            source.metrics.cancelled += 1
+            raise
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            source.metrics.record(False, elapsed, f"{type(e).__name__}: {e}")
+            SOURCE_SECONDS.observe(elapsed, source=source.name, outcome="error")
+            logger.warning(f"数据源 {source.name} 失败: {type(e).__name__}: {e}")
+            return []
+        elapsed = time.perf_counter() - start
+        source.metrics.record(bool(rows), elapsed, None if rows else "empty")
+        SOURCE_SECONDS.observe(elapsed, source=source.name, outcome="ok" if rows else "empty")
+        logger.info(f"数据源 {source.name} 返回 {len(rows)} 行, 耗时 {elapsed:.2f}s")
+        return rows
+
+    def _win(self, source: Source, rows: List[FundQuote]) -> List[FundQuote]:
+        source.metrics.wins += 1
+        self.last_source = source.name
+        return rows
+
+    async def fetch(self) -> List[FundQuote]:
+        order = self.ranked()
+        if not order:
+            return []
+        if self.mode == "sequential":
+            for s in order:
+                rows = await self._run(s)
+                if rows:
+                    return self._win(s, rows)
+            return []
+        if self.mode == "parallel" and self.merge:
+            results = await asyncio.gather(*(self._run(s) for s in order))
+            merged = merge_rows(list(results))
+            self.last_source = "+".join(s.name for s, r in zip(order, results) if r) or None
+            return merged
+        return await self._race(order)
+
+    async def _race(self, order: List[Source]) -> List[FundQuote]:
+        # 取第一个非空结果；hedged 模式下按对冲等待时间逐个启动来源
+        pending: Dict["asyncio.Task[List[FundQuote]]", Source] = {}
+        queue = list(order)
+        launched: List[Source] = []
+
+        def launch() -> None:
+            s = queue.pop(0)
+            launched.append(s)
+            pending[asyncio.ensure_future(self._run(s))] = s
+
+        launch()
+        if self.mode == "parallel":
+            while queue:
+                launch()
+        try:
+            while pending:
+                # 对冲等待时间按最近启动的来源计算
+                timeout = self._hedge_after(launched[-1]) if queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 超过对冲等待时间，启动下一个来源
+                    logger.info(f"数据源未在 {timeout:.2f}s 内返回，对冲启动 {queue[0].name}")
+                    launch()
+                    continue
+                for task in done:
+                    s = pending.pop(task)
+                    rows = task.result()
+                    if rows:
+                        return self._win(s, rows)
+                # 已完成的来源失败，不再等待，立即启动下一个
+                if queue:
+                    launch()
+            return []
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def reset(self) -> None:
+        for s in self.sources:
+            s.metrics = SourceMetrics()
+        self.last_source = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "merge": self.merge,
+            "last_source": self.last_source,
+            "order": [s.name for s in self.ranked()],
+            "sources": {s.name: s.metrics.stats() for s in self.sources},
+        }
@@ -0,0 +1,194 @@
+"""
+候选基金订阅：客户端按阈值与申购状态过滤订阅，快照变化时服务端推送增量
+
+- 所有订阅共用同一份快照：一次抓取后在快照的溢价率索引上用 screen_many 算出所有不同的筛选条件，
+  再逐个订阅与其上次推送的结果比较，只推送新增 / 移除 / 变化的基金
+- 有订阅时后台按交易时段间隔刷新快照（与快照缓存共用单飞抓取），没有订阅时停止
+- 推送失败（会话已断开）的订阅自动移除
+"""
+import asyncio
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from candidate_poller import is_trading_time
+from fund_quote import FundQuote
+from screening import PremiumIndex, Screen
+from snapshot_cache import Snapshot
+
+logger = logging.getLogger("mcp_server.subscriptions")
+
+# 溢价率变化小于该值（百分点）时不视为变化
+PREMIUM_EPSILON = 0.005
+
+
+def diff_candidates(previous: Dict[str, FundQuote], current: List[FundQuote]) -> Dict[str, List[Dict[str, Any]]]:
+    """比较两次筛选结果，返回 added / removed / changed（溢价率或申购状态变化）"""
+    now = {q.code: q for q in current}
+    added = [q.to_dict() for code, q in now.items() if code not in previous]
+    removed = [q.to_dict() for code, q in previous.items() if code not in now]
+    changed = []
+    for code, q in now.items():
+        old = previous.get(code)
+        if old is None:
+            continue
+        if old.status_text != q.status_text or abs(old.premium - q.premium) > PREMIUM_EPSILON:
+            changed.append(q.to_dict())
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+@dataclass
+class Subscription:
+    id: str
+    screen: Screen
+    send: Callable[[Dict[str, Any]], Awaitable[Any]]
+    state: Dict[str, FundQuote] = field(default_factory=dict)
+    version: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    pushes: int = 0
+
+    @property
+    def uri(self) -> str:
+        return f"candidates://subscriptions/{self.id}"
+
+    def snapshot(self) -> Dict[str, Any]:
+        # 订阅的当前完整状态，客户端漏收推送后据此重新同步
+        return {
+            "subscription_id": self.id,
+            "uri": self.uri,
+            "threshold": self.screen.threshold,
+            "exclude_status": sorted(s.value for s in self.screen.excluded),
+            "version": self.version,
+            "candidates": [q.to_dict() for q in self.state.values()],
+        }
+
+
+class SubscriptionHub:
+    def __init__(
+        self,
+        get_snapshot: Callable[[], Awaitable[Snapshot[List[FundQuote]]]],
+        trading_interval: float = 60.0,
+        idle_interval: float = 900.0,
+        max_subscriptions: int = 1000,
+    ):
+        """
+        Args:
+            get_snapshot: 获取当前快照（通常为快照缓存，过期时触发抓取）
+            trading_interval: 有订阅时交易时段的刷新间隔（秒）
+            idle_interval: 有订阅时非交易时段的刷新间隔（秒）
+            max_subscriptions: 订阅数上限
+        """
+        self._get_snapshot = get_snapshot
+        self.trading_interval = trading_interval
+        self.idle_interval = idle_interval
+        self.max_subscriptions = max_subscriptions
+        self._subs: Dict[str, Subscription] = {}
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self.fanouts = 0
+        self.pushes = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._subs)
+
+    def get(self, sub_id: str) -> Optional[Subscription]:
+        return self._subs.get(sub_id)
+
+    async def subscribe(self, screen: Screen, send: Callable[[Dict[str, Any]], Awaitable[Any]]) -> Subscription:
+        """新建订阅并以当前快照初始化（初始结果随返回值给出，不推送）"""
+        if len(self._subs) >= self.max_subscriptions:
+            raise RuntimeError(f"订阅数已达上限 {self.max_subscriptions}")
+        self._loop = asyncio.get_running_loop()
+        sub = Subscription(f"s{next(self._ids)}", screen, send)
+        snap = await self._get_snapshot()
+        index: PremiumIndex = snap.memo("index", lambda: PremiumIndex(snap.rows))
+        sub.state = {q.code: q for q in index.screen_many([screen])[0]}
+        sub.version = snap.version
+        # 初始化完成后才加入，之后的快照才会触发推送
+        self._subs[sub.id] = sub
+        self.start()
+        return sub
+
+    def unsubscribe(self, sub_id: str) -> bool:
+        removed = self._subs.pop(sub_id, None) is not None
+        if not self._subs:
+            self.stop()
+        return removed
+
+    def on_snapshot(self, snap: Snapshot[List[FundQuote]]) -> None:
+        """
+        作为 SnapshotCache 的监听器：一次筛选所有不同条件，向结果有变化的订阅推送增量
+
+        可能在工作线程中调用，推送通过 call_soon_threadsafe 交给事件循环
+        """
+        subs = [s for s in list(self._subs.values()) if s.version is not None and s.version < snap.version]
+        if not subs or self._loop is None:
+            return
+        self.fanouts += 1
+        screens = list({s.screen for s in subs})
+        index: PremiumIndex = snap.memo("index", lambda: PremiumIndex(snap.rows))
+        results = dict(zip(screens, index.screen_many(screens)))
+        for sub in subs:
+            matched = results[sub.screen]
+            delta = diff_candidates(sub.state, matched)
+            sub.state = {q.code: q for q in matched}
+            previous, sub.version = sub.version, snap.version
+            if delta["added"] or delta["removed"] or delta["changed"]:
+                payload = {"subscription_id": sub.id, "uri": sub.uri, "version": snap.version, "previous_version": previous, **delta}
+                try:
+                    self._loop.call_soon_threadsafe(lambda s=sub, p=payload: asyncio.ensure_future(self._push(s, p)))
+                except RuntimeError:
+                    # 事件循环已关闭（服务已停止）
+                    return
+
+    async def _push(self, sub: Subscription, payload: Dict[str, Any]) -> None:
+        try:
+            await sub.send(payload)
+            sub.pushes += 1
+            self.pushes += 1
+        except Exception as e:
+            # 会话已断开，移除订阅
+            logger.info(f"订阅 {sub.id} 推送失败，已移除: {type(e).__name__}: {e}")
+            self.dropped += 1
+            self.unsubscribe(sub.id)
+
+    def interval(self) -> float:
+        return self.trading_interval if is_trading_time() else self.idle_interval
+
+    async def run(self) -> None:
+        # 有订阅时定期获取快照；快照缓存过期才会真正抓取，新快照经监听器扇出给所有订阅
+        while self._subs:
+            await asyncio.sleep(self.interval())
+            try:
+                await self._get_snapshot()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"订阅刷新失败: {e}")
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self.run())
+
+    def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None and not task.get_loop().is_closed():
+            task.cancel()
+
+    def clear(self) -> None:
+        self._subs.clear()
+        self.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscriptions": len(self._subs),
+            "running": self._task is not None and not self._task.done(),
+            "fanouts": self.fanouts,
+            "pushes": self.pushes,
+            "dropped": self.dropped,
+        }
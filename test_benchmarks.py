@@ -0,0 +1,109 @@
+"""
+抓取链路的离线基准（pytest-benchmark），数据来自 fixtures/replay 下的录制响应
+
+用法: python -m pytest test_benchmarks.py --benchmark-only
+回放延迟保持为 0，只测量本地开销；需要模拟网络时可设置 replay.latency
+"""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import jisilu_mcp_server as j
+import qdii_html_parser as hp
+import serializers
+from metrics import MetricsRegistry
+from payload_tracker import PayloadTracker
+from bench_html_parse import _write_fixture
+
+
+def test_bench_qdii_candidates_end_to_end(benchmark, replay):
+    # 每轮先清空快照缓存，测量抓取 + 解析 + 筛选的完整耗时
+    def run():
+        j._snapshot_cache.invalidate()
+        return j.qdii_candidates(2.0)
+
+    assert benchmark(run)
+
+
+def test_bench_parse_api_payload(benchmark, replay):
+    page = next(replay.fixtures_dir.glob("www.jisilu.cn/GET_data_qdii_qdii_list_E_*.json"))
+    data = json.loads(json.loads(page.read_text(encoding="utf-8"))["body"])
+    # 放大到 2000 行，测量单页解析吞吐
+    data["rows"] = data["rows"] * (2000 // len(data["rows"]) + 1)
+    rows = benchmark(j._rows_from_payload, data)
+    assert len(rows) >= 2000
+
+
+@pytest.mark.parametrize("backend", [b for b, mod in (("json", json), ("orjson", serializers.orjson), ("msgspec", serializers.msgspec)) if mod is not None])
+def test_bench_decode_page(benchmark, replay, monkeypatch, backend):
+    # 2000 行响应从字节解码到 FundQuote，比较各 JSON 后端
+    monkeypatch.setattr(serializers, "BACKEND", backend)
+    page = next(replay.fixtures_dir.glob("www.jisilu.cn/GET_data_qdii_qdii_list_E_*.json"))
+    data = json.loads(json.loads(page.read_text(encoding="utf-8"))["body"])
+    data["rows"] = data["rows"] * (2000 // len(data["rows"]) + 1)
+    content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    rows, _ = benchmark(j._decode_page, content)
+    assert len(rows) >= 2000
+
+
+@pytest.mark.parametrize("unchanged", [False, True], ids=["decode", "unchanged"])
+def test_bench_payload_change_detection(benchmark, replay, unchanged):
+    # 同一份 2000 行响应：decode 为每轮都解码，unchanged 为摘要相同、复用上次解码结果
+    page = next(replay.fixtures_dir.glob("www.jisilu.cn/GET_data_qdii_qdii_list_E_*.json"))
+    data = json.loads(json.loads(page.read_text(encoding="utf-8"))["body"])
+    data["rows"] = data["rows"] * (2000 // len(data["rows"]) + 1)
+    content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    tracker = PayloadTracker()
+
+    def run():
+        if not unchanged:
+            tracker.clear()
+        hashed, previous = tracker.lookup("E", 200, content)
+        if previous is None:
+            previous = j._decode_page(content)
+            tracker.store("E", hashed, previous)
+        return previous
+
+    rows, _ = benchmark(run)
+    assert len(rows) >= 2000
+
+
+def test_bench_parse_html_page(benchmark, tmp_path):
+    path = tmp_path / "qdii.html"
+    _write_fixture(str(path), 5000)
+    page = path.read_text(encoding="utf-8")
+    rows = benchmark(hp.parse_rows, page)
+    assert len(rows) == 5000
+
+
+def test_bench_mcp_tool_call(benchmark, replay):
+    fastmcp = pytest.importorskip("fastmcp")
+    import mcp_server
+
+    # 在同一个事件循环和客户端会话中反复调用，只测量工具调用本身（缓存命中路径）
+    loop = asyncio.new_event_loop()
+    client = fastmcp.Client(mcp_server.mcp)
+    loop.run_until_complete(client.__aenter__())
+    try:
+        def call():
+            return loop.run_until_complete(client.call_tool("fetch_qdii_candidates", {"threshold": 2.0}))
+
+        result = benchmark(call)
+        assert json.loads(result.content[0].text)
+    finally:
+        loop.run_until_complete(client.__aexit__(None, None, None))
+        loop.close()
+
+
+def test_bench_histogram_observe(benchmark):
+    h = MetricsRegistry().histogram("x_seconds", "x", ["stage"])
+
+    def observe_many():
+        for i in range(1000):
+            h.observe(i * 1e-6, stage="parse")
+
+    benchmark(observe_many)
+    assert h.count(stage="parse") % 1000 == 0 and h.count(stage="parse") > 0
@@ -0,0 +1,123 @@
+"""
+后台轮询测试：快照差异、冷却去重与交易时段判断
+"""
+import asyncio
+from datetime import datetime
+
+from candidate_poller import CN_TZ, CandidatePoller, is_trading_time
+from fund_quote import FundQuote
+from snapshot_cache import Snapshot, SnapshotCache
+
+
+class _Feed:
+    def __init__(self):
+        self.version = 0
+        self.rows = []
+        self.sent = []
+        self.now = 1000.0
+
+    def push(self, *rows):
+        self.version += 1
+        self.rows = [FundQuote.from_raw(*r) for r in rows]
+
+    async def snapshot(self):
+        return Snapshot(self.rows, 0.0, self.version)
+
+    async def notify(self, title, desp):
+        self.sent.append((title, desp))
+
+
+def _poller(feed, cooldown=3600.0, alert_on_start=True):
+    return CandidatePoller(feed.snapshot, feed.notify, threshold=2.0, cooldown=cooldown,
+                           alert_on_start=alert_on_start, clock=lambda: feed.now)
+
+
+def test_only_changes_are_notified():
+    feed = _Feed()
+    poller = _poller(feed)
+
+    async def run():
+        feed.push(("100001", "a", "3%", "限100"), ("100002", "b", "1%", "限100"))
+        first = await poller.poll_once()
+        # 同一版本不重复比较
+        again = await poller.poll_once()
+        feed.push(("100001", "a", "3.5%", "限100"), ("100002", "b", "2.5%", "限100"))
+        second = await poller.poll_once()
+        feed.push(("100001", "a", "3.5%", "暂停申购"), ("100002", "b", "2.5%", "限100"))
+        third = await poller.poll_once()
+        return first, again, second, third
+
+    first, again, second, third = asyncio.run(run())
+    assert [(a.quote.code, a.reason) for a in first] == [("100001", "new")]
+    assert again == []
+    assert [(a.quote.code, a.reason) for a in second] == [("100002", "new")]
+    assert [(a.quote.code, a.reason, a.previous_status) for a in third] == [("100001", "status", "限100")]
+    assert len(feed.sent) == 3
+    assert "| 100001 | a | 3.50% | 暂停申购 | 限100 → 暂停申购 |" in feed.sent[-1][1]
+
+
+def test_cooldown_suppresses_flapping_fund():
+    feed = _Feed()
+    poller = _poller(feed, cooldown=600)
+
+    async def run():
+        counts = []
+        for premium in ("3%", "1%", "3%", "1%"):
+            feed.push(("100001", "a", premium, "限100"))
+            counts.append(len(await poller.poll_once()))
+        feed.now += 601
+        feed.push(("100001", "a", "3%", "限100"))
+        counts.append(len(await poller.poll_once()))
+        return counts
+
+    assert asyncio.run(run()) == [1, 0, 0, 0, 1]
+
+
+def test_restart_seeds_baseline_without_alerts():
+    feed = _Feed()
+
+    async def run():
+        feed.push(("100001", "a", "3%", "限100"), ("100002", "b", "2.5%", "限大额"))
+        # 进程重启：新的轮询器从第一份快照开始
+        poller = _poller(feed, alert_on_start=False)
+        first = await poller.poll_once()
+        feed.push(("100001", "a", "3.2%", "限100"), ("100002", "b", "2.5%", "暂停申购"), ("100003", "c", "4%", "限100"))
+        second = await poller.poll_once()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == []
+    assert sorted((a.quote.code, a.reason) for a in second) == [("100002", "status"), ("100003", "new")]
+    assert len(feed.sent) == 1
+
+
+def test_failed_first_fetch_does_not_seed_empty_baseline():
+    feed = _Feed()
+    results = [None, [("100001", "a", "3%", "限100"), ("100002", "b", "2.5%", "限大额")],
+               [("100001", "a", "3%", "限100"), ("100002", "b", "2.5%", "限大额"), ("100003", "c", "4%", "限100")]]
+
+    async def fetch():
+        rows = results.pop(0)
+        if rows is None:
+            raise ConnectionError("upstream down")
+        return [FundQuote.from_raw(*r) for r in rows]
+
+    async def run():
+        cache = SnapshotCache(fetch, ttl=0, max_stale=0)
+        poller = CandidatePoller(cache.get, feed.notify, threshold=2.0, clock=lambda: feed.now)
+        # 重启后第一次抓取失败：占位快照被跳过；第二次成功：作为基线，不发送提醒
+        first = await poller.poll_once()
+        second = await poller.poll_once()
+        third = await poller.poll_once()
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert first == [] and second == []
+    assert [(a.quote.code, a.reason) for a in third] == [("100003", "new")]
+    assert len(feed.sent) == 1
+
+
+def test_trading_time():
+    assert is_trading_time(datetime(2026, 10, 19, 10, 0, tzinfo=CN_TZ))
+    assert not is_trading_time(datetime(2026, 10, 19, 12, 0, tzinfo=CN_TZ))
+    assert not is_trading_time(datetime(2026, 10, 18, 10, 0, tzinfo=CN_TZ))
@@ -0,0 +1,186 @@
+"""
+熔断器与自适应超时的测试
+"""
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, BreakerTransport, CircuitBreaker, CircuitOpenError
+from snapshot_cache import SnapshotCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_opens_after_consecutive_failures_and_probes_once():
+    clock = FakeClock()
+    b = CircuitBreaker("jisilu", failure_threshold=3, reset_timeout=30, clock=clock)
+    for _ in range(2):
+        assert b.allow()
+        b.record_failure("HTTP 503")
+    assert b.state == CLOSED
+    b.record_failure("HTTP 503")
+    assert b.state == OPEN
+    assert not b.allow()
+    assert b.retry_after() == 30
+
+    clock.now += 30
+    assert b.allow()
+    assert b.state == HALF_OPEN
+    # 半开状态只放行一个探测请求
+    assert not b.allow()
+    b.record_failure("timeout")
+    assert b.state == OPEN
+
+    clock.now += 30
+    assert b.allow()
+    b.record_success(0.2)
+    assert b.state == CLOSED
+    assert b.stats()["opened"] == 2
+
+
+def test_success_resets_consecutive_failures():
+    b = CircuitBreaker("jisilu", failure_threshold=2)
+    b.record_failure("x")
+    b.record_success(0.1)
+    b.record_failure("x")
+    assert b.state == CLOSED
+
+
+def test_adaptive_timeout_from_latency_percentile():
+    b = CircuitBreaker("jisilu", max_timeout=20, min_timeout=1, timeout_multiplier=3, min_samples=10)
+    assert b.timeout() == 20
+    for _ in range(20):
+        b.record_success(0.5)
+    assert b.timeout() == pytest.approx(1.5)
+    for _ in range(100):
+        b.record_success(0.1)
+    assert b.timeout() == 1
+    for _ in range(100):
+        b.record_success(30)
+    assert b.timeout() == 20
+
+
+def test_transport_fails_fast_when_open_and_caps_timeout():
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.extensions["timeout"])
+        return httpx.Response(503)
+
+    b = CircuitBreaker("jisilu", failure_threshold=2, max_timeout=5)
+    client = httpx.Client(transport=BreakerTransport(b, httpx.MockTransport(handler)), timeout=20)
+    for _ in range(2):
+        assert client.get("https://www.jisilu.cn/x").status_code == 503
+    # 客户端 20s 超时被限制为熔断器的 5s 上限
+    assert calls[0]["read"] == 5
+    start = time.perf_counter()
+    with pytest.raises(CircuitOpenError):
+        client.get("https://www.jisilu.cn/x")
+    assert time.perf_counter() - start < 0.1
+    assert len(calls) == 2
+    assert b.stats()["rejected"] == 1
+
+
+def test_async_transport_records_errors_not_cancellation():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/slow":
+            await asyncio.sleep(1)
+        raise httpx.ConnectError("refused", request=request)
+
+    b = CircuitBreaker("serverchan", failure_threshold=1, reset_timeout=0)
+
+    async def run():
+        async with httpx.AsyncClient(transport=BreakerTransport(b, httpx.MockTransport(handler))) as client:
+            with pytest.raises(httpx.ConnectError):
+                await client.get("https://sctapi.ftqq.com/fail")
+            assert b.state == OPEN
+            # reset_timeout=0：下一个请求作为探测放行，取消后允许再次探测
+            task = asyncio.ensure_future(client.get("https://sctapi.ftqq.com/slow"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert b.state == HALF_OPEN
+            assert b.allow()
+
+    asyncio.run(run())
+
+
+def test_cache_serves_expired_snapshot_when_upstream_open():
+    calls = []
+    upstream_open = [False]
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.5)
+        return [1, 2, 3]
+
+    cache = SnapshotCache(fetch, ttl=0.01, max_stale=0.01, fast_fail=lambda: upstream_open[0])
+
+    async def run():
+        first = await cache.get()
+        await asyncio.sleep(0.05)
+        upstream_open[0] = True
+        start = time.perf_counter()
+        again = await cache.get()
+        return first, again, time.perf_counter() - start
+
+    first, again, elapsed = asyncio.run(run())
+    assert again is first
+    assert elapsed < 0.1
+    assert cache.stats()["stale"]
+
+
+def test_tool_marks_stale_data_when_jisilu_breaker_open(replay):
+    fastmcp = pytest.importorskip("fastmcp")
+    import jisilu_mcp_server as j
+    import mcp_server
+    from http_clients import registry
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            fresh = json.loads((await client.call_tool("fetch_qdii_candidates", {"threshold": 2.0})).content[0].text)
+            # 快照过期且集思录熔断
+            j._snapshot_cache.snapshot.fetched_at -= 3600
+            breaker = registry.breaker("jisilu")
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure("HTTP 429")
+            stale = json.loads((await client.call_tool("fetch_qdii_candidates", {"threshold": 2.0})).content[0].text)
+            status = json.loads((await client.read_resource("breakers://status"))[0].text)
+            cache = json.loads((await client.read_resource("cache://qdii"))[0].text)
+            return fresh, stale, status, cache
+
+    fresh, stale, status, cache = asyncio.run(run())
+    assert isinstance(fresh, list)
+    # 返回类型不变，旧数据标记通过 cache://qdii 查看
+    assert stale == fresh
+    assert cache["freshness"]["stale"] is True and cache["freshness"]["upstream"] == "open"
+    assert status["jisilu"]["state"] == "open"
+
+
+def test_tool_keeps_plain_list_on_healthy_stale_while_revalidate_hit(replay):
+    fastmcp = pytest.importorskip("fastmcp")
+    import jisilu_mcp_server as j
+    import mcp_server
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            fresh = json.loads((await client.call_tool("fetch_qdii_candidates", {"threshold": 2.0})).content[0].text)
+            # 过期但仍在 max_stale 范围内，熔断器关闭：返回旧快照并在后台刷新
+            j._snapshot_cache.snapshot.fetched_at -= j._snapshot_cache.ttl + 1
+            stale_hits = j.cache_stats()["stale_hits"]
+            again = json.loads((await client.call_tool("fetch_qdii_candidates", {"threshold": 2.0})).content[0].text)
+            return fresh, again, j.cache_stats()["stale_hits"] - stale_hits
+
+    fresh, again, stale_hits = asyncio.run(run())
+    assert stale_hits == 1
+    assert isinstance(again, list) and again == fresh
@@ -0,0 +1,238 @@
+"""
+集思录抓取逻辑的离线测试
+使用 httpx.MockTransport 模拟集思录接口，不访问网络
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import jisilu_mcp_server as j
+from fund_quote import ApplyStatus, FundQuote
+
+
+def _payload(code: str, premium: str, status: str) -> dict:
+    return {"rows": [{"id": code, "cell": {
+        "fund_id": code, "fund_nm": f"基金{code}", "discount_rt": premium, "apply_status": status,
+    }}]}
+
+
+def _mock_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.fixture(autouse=True)
+def _reset_payloads():
+    # 各测试的模拟响应互不相干，清空上次响应的摘要与解码结果
+    j._payloads.clear()
+    j._last_api_rows = None
+    yield
+    j._payloads.clear()
+    j._last_api_rows = None
+
+
+def test_sources_are_fetched_concurrently():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.2)
+        code = {"E": "100001", "C": "100002", "A": "100003"}.get(request.url.path.rsplit("/", 1)[-1], "160001")
+        return httpx.Response(200, json=_payload(code, "3.00%", "限100"))
+
+    async def run():
+        async with _mock_client(handler) as client:
+            start = time.perf_counter()
+            rows = await j._fetch_api_rows_async(client)
+            return rows, time.perf_counter() - start
+
+    rows, elapsed = asyncio.run(run())
+    assert sorted(r.code for r in rows) == ["100001", "100002", "100003", "160001"]
+    # 四个来源并发，总耗时接近单个来源而不是四倍
+    assert elapsed < 0.6
+
+
+def test_slow_and_failed_sources_return_partial_rows():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        cat = request.url.path.rstrip("/").rsplit("/", 1)[-1]
+        if cat == "E":
+            await asyncio.sleep(5)
+        if cat == "C":
+            return httpx.Response(503)
+        return httpx.Response(200, json=_payload("100003" if cat == "A" else "160001", "2.50%", "限大额"))
+
+    async def run():
+        async with _mock_client(handler) as client:
+            return await j._fetch_api_rows_async(client, deadline=0.3)
+
+    rows = asyncio.run(run())
+    assert sorted(r.code for r in rows) == ["100003", "160001"]
+
+
+def test_all_pages_are_fetched_with_bounded_parallelism():
+    in_flight = 0
+    peak = 0
+    total = 22 * 5 + 3
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, peak
+        if not request.url.path.endswith("/E"):
+            return httpx.Response(200, json={"page": 1, "rows": [], "total": 0})
+        page = int(request.url.params["page"])
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        start = (page - 1) * 22
+        rows = [{"cell": {"fund_id": f"{i:06d}", "fund_nm": "", "discount_rt": "1%", "apply_status": ""}}
+                for i in range(start, min(start + 22, total))]
+        return httpx.Response(200, json={"page": page, "rows": rows, "total": total})
+
+    async def run():
+        async with _mock_client(handler) as client:
+            return await j._fetch_api_rows_async(client)
+
+    rows = asyncio.run(run())
+    assert len({r.code for r in rows}) == total
+    # 第一页之后的页面受 PAGE_CONCURRENCY 限制
+    assert peak <= j.PAGE_CONCURRENCY
+
+
+def test_filter_uses_parsed_premium_and_status():
+    rows = [
+        FundQuote.from_raw("100001", "a", "3.21%", "限100"),
+        FundQuote.from_raw("100002", "b", "+5.00%", "暂停申购"),
+        FundQuote.from_raw("100003", "c", "4.0%", "开放申购"),
+        FundQuote.from_raw("100004", "d", "-", "限大额"),
+        FundQuote.from_raw("100005", "e", 2.5, ""),
+        FundQuote.from_raw("100006", "f", "1.9%", "限大额"),
+    ]
+    assert rows[0].premium == 3.21 and rows[0].status is ApplyStatus.LIMITED
+    out = j._filter_candidates(rows, 2.0)
+    assert [q.code for q in out] == ["100001", "100005"]
+    assert out[0].to_dict() == {"代码": "100001", "名称": "a", "T-1溢价率": 3.21, "申购状态": "限100"}
+
+
+def test_unchanged_payloads_skip_decoding(monkeypatch):
+    decoded = []
+    conditional = []
+    codes = {"E": "100001", "C": "100002", "A": "100003"}
+    decode = j._decode_page
+    monkeypatch.setattr(j, "_decode_page", lambda content: decoded.append(content) or decode(content))
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        cat = request.url.path.rstrip("/").rsplit("/", 1)[-1]
+        if cat not in codes:
+            # LOF 接口带 ETag，内容未变化时返回 304
+            if request.headers.get("If-None-Match") == '"v1"':
+                conditional.append(cat)
+                return httpx.Response(304)
+            return httpx.Response(200, json=_payload("160001", "2.00%", "限100"), headers={"ETag": '"v1"'})
+        return httpx.Response(200, json=_payload(codes[cat], "3.00%", "限100"))
+
+    async def run():
+        async with _mock_client(handler) as client:
+            first = await j._fetch_api_rows_async(client)
+            second = await j._fetch_api_rows_async(client)
+            codes["C"] = "100009"
+            third = await j._fetch_api_rows_async(client)
+            return first, second, third
+
+    first, second, third = asyncio.run(run())
+    # 第二轮：LOF 走 304，其余内容摘要相同，均不再解码，返回上一轮的同一个列表
+    assert len(decoded) == 4 + 1
+    assert second is first
+    assert conditional == ["index_lof_list", "index_lof_list"]
+    # 第三轮只有 C 类变化
+    assert third is not first
+    assert sorted(r.code for r in third) == ["100001", "100003", "100009", "160001"]
+    assert not j.payload_unchanged("qdii_C")
+    assert j.payload_unchanged("qdii_E") and j.payload_unchanged("lof")
+    assert j._payloads.stats()["not_modified"] == 2
+
+
+def test_not_modified_after_eviction_refetches_without_conditional_headers(monkeypatch):
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/E"):
+            return httpx.Response(200, json={"page": 1, "rows": [], "total": 0})
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json=_payload("100001", "3.00%", "限100"), headers={"ETag": '"v1"'})
+
+    headers = j._payloads.request_headers
+
+    def evict_after_headers(key):
+        # 发出条件请求后、收到 304 前该请求的记录被 LRU 淘汰
+        out = headers(key)
+        j._payloads._entries.pop(key, None)
+        return out
+
+    async def run():
+        async with _mock_client(handler) as client:
+            await j._fetch_api_rows_async(client)
+            monkeypatch.setattr(j._payloads, "request_headers", evict_after_headers)
+            return await j._fetch_api_rows_async(client)
+
+    rows = asyncio.run(run())
+    assert [r.code for r in rows] == ["100001"]
+    assert requests == [None, '"v1"', None]
+    assert j._payloads.stats()["evicted"] == 1
+
+
+def test_akshare_datasets_called_concurrently_with_timeouts(monkeypatch):
+    import threading
+
+    import pandas as pd
+
+    release = threading.Event()
+    frames = {
+        "qdii_e_index_jsl": pd.DataFrame({"代码": ["100001"], "名称": ["a"], "T-1溢价率": ["3.1%"], "申购状态": ["限100"]}),
+        "qdii_c_jsl": pd.DataFrame({"fund_id": ["100002", "100003"], "fund_nm": ["b", "c"], "discount_rt": [2.5, "-"], "现价": [1.0, 1.1]}),
+    }
+
+    def dataset(name):
+        def call():
+            if name == "qdii_e_comm_jsl":
+                raise RuntimeError("upstream error")
+            if name == "qdii_a_jsl":
+                release.wait(5)
+            time.sleep(0.2)
+            return frames.get(name)
+        return call
+
+    ak = SimpleNamespace(**{name: dataset(name) for name in j.AK_DATASETS})
+    monkeypatch.setattr(j, "AK_CALL_TIMEOUT", 0.5)
+    try:
+        start = time.perf_counter()
+        rows = j._fetch_ak_rows(ak)
+        elapsed = time.perf_counter() - start
+    finally:
+        release.set()
+    # 并发调用：总耗时取决于超时而不是各调用之和；出错与超时的数据集被跳过
+    assert elapsed < 0.9
+    assert [(q.code, q.name, q.status_text) for q in rows] == [("100001", "a", "限100"), ("100002", "b", ""), ("100003", "c", "")]
+    assert rows[1].premium == 2.5 and not rows[2].has_premium
+
+
+def test_pages_beyond_max_pages_are_counted_as_truncated(monkeypatch):
+    monkeypatch.setattr(j, "MAX_PAGES", 3)
+    requested = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if not request.url.path.endswith("/E"):
+            return httpx.Response(200, json={"page": 1, "rows": [], "total": 0})
+        page = int(request.url.params["page"])
+        requested.append(page)
+        rows = [{"cell": {"fund_id": f"{page}{i:05d}", "fund_nm": "", "discount_rt": "1%", "apply_status": ""}} for i in range(10)]
+        return httpx.Response(200, json={"page": page, "rows": rows, "total": 55})
+
+    async def run():
+        async with _mock_client(handler) as client:
+            return await j._fetch_api_rows_async(client)
+
+    before = j.SOURCE_ERRORS.value(source="jisilu_api", category="qdii_E", reason="truncated")
+    rows = asyncio.run(run())
+    assert sorted(requested) == [1, 2, 3] and len(rows) == 30
+    assert j.SOURCE_ERRORS.value(source="jisilu_api", category="qdii_E", reason="truncated") == before + 1
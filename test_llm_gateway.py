@@ -0,0 +1,130 @@
+"""
+LLM 网关测试：对本地桩服务（OpenAI 兼容的 /v1/chat/completions）发送请求，统计实际到达的调用数与最大并发
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from fund_quote import FundQuote
+from llm_gateway import LLMGateway, ResponseCache, request_key
+
+
+class StubLLM:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with stub.lock:
+                    stub.calls += 1
+                    stub.active += 1
+                    stub.max_active = max(stub.max_active, stub.active)
+                time.sleep(stub.delay)
+                with stub.lock:
+                    stub.active -= 1
+                prompt = body["messages"][-1]["content"]
+                data = json.dumps({"choices": [{"message": {"role": "assistant", "content": f"总结: {prompt[:20]}"}}]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubLLM()
+    yield server
+    server.close()
+
+
+def _gateway(stub, tmp_path, **kwargs) -> LLMGateway:
+    cache = ResponseCache(tmp_path / "cache", ttl=kwargs.pop("ttl", 3600))
+    return LLMGateway(lambda: "sk-test", cache, base_url=stub.url, state_path=tmp_path / "last_summary.json", **kwargs)
+
+
+def test_identical_requests_hit_disk_cache(stub, tmp_path):
+    gw = _gateway(stub, tmp_path)
+    first = gw.chat_sync("总结今日溢价", system="s")
+    assert gw.chat_sync("总结今日溢价", system="s") == first
+    assert stub.calls == 1
+    # 参数不同视为不同请求
+    gw.chat_sync("总结今日溢价", system="s", max_tokens=100)
+    assert stub.calls == 2
+    # 新实例（例如服务重启）读取同一缓存目录
+    again = _gateway(stub, tmp_path)
+    assert asyncio.run(again.chat("总结今日溢价", system="s")) == first
+    assert stub.calls == 2
+    assert gw.stats()["cache_hits"] == 1
+
+
+def test_cache_ttl_and_lru_eviction(tmp_path):
+    cache = ResponseCache(tmp_path, ttl=3600, max_entries=3)
+    keys = [request_key({"n": i}) for i in range(4)]
+    for i, key in enumerate(keys[:3]):
+        cache.put(key, {"n": i})
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    # 读取最旧的条目后它变为最近使用
+    assert cache.get(keys[0]) == {"n": 0}
+    cache.put(keys[3], {"n": 3})
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == {"n": 0}
+    assert cache.get(keys[3]) == {"n": 3}
+    assert cache.stats()["evicted"] == 2
+
+    short = ResponseCache(tmp_path / "ttl", ttl=0.05)
+    short.put(keys[0], {"n": 0})
+    time.sleep(0.06)
+    assert short.get(keys[0]) is None
+    assert not short._path(keys[0]).exists()
+
+
+def test_concurrency_cap_and_coalescing(stub, tmp_path):
+    stub.delay = 0.1
+    gw = _gateway(stub, tmp_path, max_concurrency=2)
+    prompts = [f"基金 {i}" for i in range(6)] + ["基金 0", "基金 1"]
+    results = asyncio.run(gw.chat_many(prompts))
+    assert not [r for r in results if isinstance(r, Exception)]
+    assert results[6] == results[0] and results[7] == results[1]
+    assert stub.calls == 6
+    assert stub.max_active <= 2
+    assert gw.stats()["coalesced"] == 2
+
+
+def test_summary_skipped_when_candidates_unchanged(stub, tmp_path):
+    gw = _gateway(stub, tmp_path)
+    quotes = [FundQuote.from_raw("164906", "中概互联", "5.12%", "限100"), FundQuote.from_raw("513100", "纳指ETF", "3.0%", "开放申购")]
+    first = asyncio.run(gw.summarize_candidates(quotes))
+    assert first["skipped"] is False and first["summary"]
+    # 顺序不同、溢价率变化不足 0.005 个百分点时视为相同
+    same = [FundQuote.from_raw("513100", "纳指ETF", "3.001%", "开放申购"), quotes[0]]
+    second = asyncio.run(gw.summarize_candidates(same))
+    assert second["skipped"] is True and second["summary"] == first["summary"]
+    assert stub.calls == 1
+    # 上次总结持久化，重启后仍可跳过
+    assert asyncio.run(_gateway(stub, tmp_path).summarize_candidates(quotes))["skipped"] is True
+    changed = [FundQuote.from_raw("164906", "中概互联", "5.12%", "暂停申购"), quotes[1]]
+    assert asyncio.run(gw.summarize_candidates(changed))["skipped"] is False
+    assert stub.calls == 2
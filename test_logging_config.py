@@ -0,0 +1,131 @@
+"""
+日志管道测试：队列处理器带上工具调用上下文、JSON 格式、按 logger 采样、按大小轮转并压缩
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import queue
+
+import fastmcp
+
+import logging_config as lc
+
+
+def _drain(q):
+    records = []
+    while not q.empty():
+        records.append(q.get_nowait())
+    return records
+
+
+def test_queue_handler_captures_call_context_and_json():
+    q = queue.Queue(3)
+    handler = lc.NonBlockingQueueHandler(q)
+    logger = logging.getLogger("test.logging_config")
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    try:
+        with lc.tool_call("fetch_qdii_candidates") as call:
+            lc.record_stage("fetch", 0.25)
+            lc.record_stage("fetch", 0.5)
+            logger.info("抓取 %d 只", 3, extra={"stages": call["stages"]})
+        logger.info("调用外")
+        try:
+            raise ValueError("坏数据")
+        except ValueError:
+            logger.exception("解析失败")
+        # 队列已满：丢弃并计数，不阻塞
+        logger.info("溢出")
+    finally:
+        logger.removeHandler(handler)
+    assert handler.dropped == 1
+    inside, outside, failed = [json.loads(lc.JsonFormatter().format(r)) for r in _drain(q)]
+    assert inside["msg"] == "抓取 3 只" and inside["tool"] == "fetch_qdii_candidates"
+    assert len(inside["tool_call_id"]) == 12 and inside["stages"] == {"fetch": 750.0}
+    assert "tool_call_id" not in outside and outside["logger"] == "test.logging_config"
+    assert failed["level"] == "ERROR" and "ValueError: 坏数据" in failed["exc"]
+    assert lc.current_call() is None
+
+
+def test_sampling_filter_per_logger():
+    sampler = lc.SamplingFilter(lc._parse_rates("mcp_server.poller=0.25, httpx=0, bad"))
+
+    def kept(name, level=logging.INFO, n=100):
+        return sum(sampler.filter(logging.LogRecord(name, level, "", 0, "x", None, None)) for _ in range(n))
+
+    assert kept("mcp_server.poller") == 25
+    assert kept("mcp_server.poller.tick") == 25
+    assert kept("httpx") == 0
+    assert kept("httpx", logging.WARNING) == 100
+    assert kept("mcp_server") == 100
+    assert sampler.dropped == {"mcp_server.poller": 75, "mcp_server.poller.tick": 75, "httpx": 100}
+
+
+def test_rotation_by_size_compresses_and_prunes(tmp_path):
+    handler = lc.RotatingCompressedFileHandler(str(tmp_path / "mcp_server.log"), max_bytes=200, interval=0, backup_count=2)
+    handler.setFormatter(lc.JsonFormatter())
+    logger = logging.getLogger("test.rotation")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(40):
+            logger.warning(f"第 {i} 条")
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+    rotated = handler.rotated_files()
+    assert handler.rollovers > 2 and len(rotated) == 2
+    assert all(f.endswith(".log.gz") for f in rotated)
+    lines = gzip.decompress(open(rotated[-1], "rb").read()).decode("utf-8").splitlines()
+    assert lines and all(json.loads(line)["logger"] == "test.rotation" for line in lines)
+    # 最后一条在当前文件里
+    current = open(tmp_path / "mcp_server.log", encoding="utf-8").read().splitlines()
+    assert json.loads(current[-1])["msg"] == "第 39 条"
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(f) for f in rotated] + ["mcp_server.log"])
+
+
+def test_setup_logging_prod_writes_json_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("ENV", "prod")
+    monkeypatch.setenv("LOG_SAMPLE", "test.sampled=0")
+    root = logging.getLogger()
+    level = root.level
+    try:
+        logger = lc.setup_logging(log_dir=str(tmp_path))
+        logging.getLogger("test.sampled").info("丢弃")
+        logger.info("保留")
+        assert lc.stats()["sampled_out"] == {"test.sampled": 1}
+    finally:
+        lc.shutdown_logging()
+        root.setLevel(level)
+    records = [json.loads(line) for line in open(tmp_path / "mcp_server.log", encoding="utf-8")]
+    assert [r["msg"] for r in records][-1] == "保留"
+    assert all(r["msg"] != "丢弃" for r in records)
+    assert lc.stats() == {}
+
+
+def test_tool_call_logs_id_and_stage_timings(replay):
+    import mcp_server
+
+    q = queue.Queue()
+    handler = lc.NonBlockingQueueHandler(q)
+    root = logging.getLogger()
+    root.addHandler(handler)
+    level = root.level
+    root.setLevel(logging.INFO)
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            await client.call_tool("fetch_qdii_candidates", {"threshold": 2.0})
+
+    try:
+        asyncio.run(run())
+    finally:
+        root.removeHandler(handler)
+        root.setLevel(level)
+    records = [r for r in _drain(q) if getattr(r, "tool", None) == "fetch_qdii_candidates"]
+    assert len({r.tool_call_id for r in records}) == 1
+    done = [r for r in records if r.getMessage().startswith("工具调用结束")]
+    assert len(done) == 1 and done[0].status == "ok" and done[0].duration_ms > 0
+    assert {"fetch", "screen", "encode"} <= set(done[0].stages)
@@ -0,0 +1,86 @@
+"""
+指标子系统的测试：导出格式、抓取流水线埋点与 /metrics 路由
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from metrics import MetricsRegistry
+
+
+def test_render_counter_gauge_histogram():
+    reg = MetricsRegistry()
+    c = reg.counter("rows_total", "行数", ["source"])
+    c.inc(3, source="api")
+    c.inc(source="api")
+    g = reg.gauge("age_seconds", "年龄")
+    g.set(1.5)
+    h = reg.histogram("stage_seconds", "耗时", ["stage"], buckets=(0.1, 1.0))
+    h.observe(0.05, stage="parse")
+    h.observe(0.1, stage="parse")
+    h.observe(5, stage="parse")
+    text = reg.render()
+    assert "# TYPE rows_total counter" in text
+    assert 'rows_total{source="api"} 4' in text
+    assert "age_seconds 1.5" in text
+    assert 'stage_seconds_bucket{stage="parse",le="0.1"} 2' in text
+    assert 'stage_seconds_bucket{stage="parse",le="1"} 2' in text
+    assert 'stage_seconds_bucket{stage="parse",le="+Inf"} 3' in text
+    assert 'stage_seconds_sum{stage="parse"} 5.15' in text
+    assert 'stage_seconds_count{stage="parse"} 3' in text
+
+
+def test_label_escaping_and_callbacks():
+    reg = MetricsRegistry()
+    g = reg.gauge("state", "状态", ["upstream"])
+    g.set_function(lambda: {('a"b',): 2})
+    broken = reg.counter("broken_total", "回调异常")
+    broken.set_function(lambda: 1 / 0)
+    text = reg.render()
+    assert 'state{upstream="a\\"b"} 2' in text
+    assert "# TYPE broken_total counter" in text
+    # 同名重复注册返回同一实例
+    assert reg.gauge("state", "状态", ["upstream"]) is g
+
+
+def test_pipeline_is_instrumented(replay):
+    import jisilu_mcp_server as j
+
+    fetched = j.ROWS_FETCHED.value(source="jisilu_api", category="qdii_E")
+    fetches = j.STAGE_SECONDS.count(stage="fetch")
+    asyncio.run(j.qdii_candidates_async(2.0))
+    # E 类两页共 25 行
+    assert j.ROWS_FETCHED.value(source="jisilu_api", category="qdii_E") - fetched == 25
+    assert j.STAGE_SECONDS.count(stage="fetch") == fetches + 1
+    assert j.STAGE_SECONDS.count(stage="parse_api") > 0
+    assert j.STAGE_SECONDS.count(stage="screen") > 0
+
+
+def test_category_failures_are_counted(replay):
+    import jisilu_mcp_server as j
+
+    before = j.SOURCE_ERRORS.value(source="jisilu_api", category="lof", reason="error")
+    replay.failure_rate = 1.0
+    assert asyncio.run(j._fetch_api_rows_async()) == []
+    assert j.SOURCE_ERRORS.value(source="jisilu_api", category="lof", reason="error") == before + 1
+
+
+def test_metrics_route(replay):
+    pytest.importorskip("fastmcp")
+    import mcp_server
+
+    async def run():
+        await mcp_server.j.qdii_candidates_async(2.0)
+        app = mcp_server.mcp.http_app(transport="sse")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/metrics")
+
+    resp = asyncio.run(run())
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    for name in ("qdii_stage_seconds_bucket", "qdii_rows_fetched_total", "upstream_request_seconds_count",
+                 "upstream_requests_total", "qdii_snapshot", "source_fetch_seconds_count"):
+        assert name in body
+    assert 'upstream_requests_total{upstream="jisilu",outcome="http_2xx"}' in body
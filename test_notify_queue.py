@@ -0,0 +1,63 @@
+"""
+微信通知队列测试：合并摘要、重试与状态查询
+"""
+import asyncio
+
+from notify_queue import NotificationQueue, TokenBucket, build_digest, QueuedMessage
+
+HEADER = "| 代码 | 名称 | T-1溢价率 | 申购状态 | 变化 |\n| --- | --- | --- | --- | --- |\n"
+
+
+def test_messages_within_window_are_coalesced():
+    sent = []
+
+    async def send(title, desp):
+        sent.append((title, desp))
+        return {"status_code": 200, "response": {"code": 0}}
+
+    async def run():
+        q = NotificationQueue(send, window=0.05, rate_per_minute=600, burst=5)
+        ids = [q.submit("提醒", HEADER + f"| 10000{i} | f | 3.00% | 限100 | 新越过阈值 |") for i in range(3)]
+        ids.append(q.submit("提醒", HEADER + "| 100000 | f | 4.00% | 限100 | 新越过阈值 |"))
+        assert q.status(ids[0])["status"] == "queued"
+        await asyncio.sleep(0.2)
+        statuses = [q.status(i) for i in ids]
+        await q.aclose()
+        return statuses
+
+    statuses = asyncio.run(run())
+    assert len(sent) == 1
+    assert all(s["status"] == "sent" and s["digest_size"] == 4 for s in statuses)
+    body = sent[0][1].splitlines()
+    # 表头 2 行 + 去重后 3 行，100000 取最新一行
+    assert len(body) == 5
+    assert "4.00%" in body[-1]
+
+
+def test_retry_with_backoff_then_fail():
+    calls = []
+
+    async def send(title, desp):
+        calls.append(title)
+        return {"status_code": 503, "response": {}}
+
+    async def run():
+        q = NotificationQueue(send, window=0, rate_per_minute=6000, burst=10, max_retries=2, backoff=0.01)
+        mid = q.submit("t", "d")
+        await asyncio.sleep(0.2)
+        return q.status(mid)
+
+    status = asyncio.run(run())
+    assert len(calls) == 3
+    assert status["status"] == "failed" and status["attempts"] == 3
+
+
+def test_token_bucket_and_plain_digest():
+    now = [0.0]
+    bucket = TokenBucket(rate=1.0, capacity=2, clock=lambda: now[0])
+    assert bucket.try_acquire() == 0 and bucket.try_acquire() == 0
+    assert bucket.try_acquire() > 0
+    now[0] += 1.0
+    assert bucket.try_acquire() == 0
+    title, desp = build_digest([QueuedMessage("1", "a", "hello"), QueuedMessage("2", "b", "world")])
+    assert title.startswith("汇总 2 条通知") and "### a" in desp and "### b" in desp
@@ -0,0 +1,131 @@
+"""
+溢价率历史存储的离线测试
+"""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import jisilu_mcp_server as j
+import premium_history as ph
+from fund_quote import ApplyStatus, FundQuote
+
+DAY = 86400
+# 2025-12-01 10:00 北京时间
+T0 = ph.parse_time("2025-12-01 10:00")
+
+
+def _quotes(premium: float, status: str = "限100"):
+    return [
+        FundQuote.from_raw("164906", "中概互联LOF", f"{premium:.2f}%", status),
+        FundQuote.from_raw("040046", "纳斯达克100华安", "1.00%", "开放申购"),
+        FundQuote.from_raw("abc", "无效代码", "9.00%", "限100"),
+    ]
+
+
+def test_append_and_query_across_partitions(tmp_path):
+    store = ph.PremiumHistory(tmp_path)
+    for i in range(3):
+        assert store.append(_quotes(3.0 + i), T0 + i * DAY) == 2
+        store.append(_quotes(3.5 + i, "暂停申购"), T0 + i * DAY + 60)
+    assert store.partitions() == ["20251201", "20251202", "20251203"]
+
+    s = store.series("164906", T0, T0 + 3 * DAY)
+    assert s["premium"].tolist() == pytest.approx([3.0, 3.5, 4.0, 4.5, 5.0, 5.5])
+    assert s["ts"].tolist() == sorted(s["ts"].tolist())
+
+    # 分区内按时间切片：半开区间 [start, end)
+    s = store.series("164906", T0 + DAY, T0 + DAY + 60)
+    assert s["premium"].tolist() == pytest.approx([4.0])
+
+    points = store.history("040046", T0, T0 + DAY)
+    assert len(points) == 2
+    assert points[0]["时间"] == "2025-12-01 10:00:00"
+    assert points[0]["申购状态"] == ApplyStatus.OPEN.value
+    assert store.history("999999", T0, T0 + 3 * DAY) == []
+
+
+def test_older_partitions_are_not_opened(tmp_path, monkeypatch):
+    store = ph.PremiumHistory(tmp_path)
+    for i in range(5):
+        store.append(_quotes(3.0), T0 + i * DAY)
+    opened = []
+    real_open = store._open
+    monkeypatch.setattr(store, "_open", lambda day: opened.append(day) or real_open(day))
+    store.series("164906", T0 + 3 * DAY, T0 + 5 * DAY)
+    assert opened == ["20251204", "20251205"]
+
+
+def test_sealed_partition_cache_is_bounded_lru(tmp_path):
+    store = ph.PremiumHistory(tmp_path, max_open=2)
+    for i in range(5):
+        store.append(_quotes(3.0 + i), T0 + i * DAY)
+    for i in range(5):
+        store.series("164906", T0 + i * DAY, T0 + i * DAY + 3600)
+    assert list(store._sealed) == ["20251204", "20251205"]
+    # 命中的分区移到最近使用端，淘汰的分区重新打开后仍可查询
+    store.series("164906", T0 + 3 * DAY, T0 + 3 * DAY + 3600)
+    s = store.series("164906", T0, T0 + 3600)
+    assert s["premium"].tolist() == pytest.approx([3.0])
+    assert list(store._sealed) == ["20251204", "20251201"]
+
+
+def test_scan_returns_memmap_views(tmp_path):
+    store = ph.PremiumHistory(tmp_path)
+    store.append(_quotes(3.0), T0)
+    (day, cols), = list(store.scan(T0, T0 + 1))
+    assert day == "20251201"
+    # 切片仍然引用映射文件，没有复制
+    import numpy as np
+    assert isinstance(cols["premium"], np.memmap)
+    assert not cols["premium"].flags.owndata
+
+
+def test_torn_write_uses_shortest_column(tmp_path):
+    store = ph.PremiumHistory(tmp_path)
+    store.append(_quotes(3.0), T0)
+    with open(tmp_path / "20251201" / "ts.i8", "ab") as f:
+        f.write(b"\x00" * 8)
+    assert len(store.series("164906", T0, T0 + DAY)["ts"]) == 1
+
+
+def test_nan_premium_round_trips(tmp_path):
+    store = ph.PremiumHistory(tmp_path)
+    store.append([FundQuote.from_raw("164906", "x", "-", "限100")], T0)
+    assert store.history("164906", T0, T0 + 1)[0]["T-1溢价率"] is None
+
+
+def test_disabled_store_is_noop(tmp_path):
+    store = ph.PremiumHistory(tmp_path, enabled=False)
+    assert store.append(_quotes(3.0), T0) == 0
+    assert store.history("164906", T0, T0 + DAY) == []
+    assert not any(tmp_path.iterdir())
+
+
+def test_parse_time():
+    assert ph.parse_time("2025-12-01", end=True) - ph.parse_time("2025-12-01") == DAY
+    assert ph.parse_time("1764554400") == 1764554400.0
+    with pytest.raises(ValueError):
+        ph.parse_time("yesterday")
+
+
+def test_snapshot_refresh_writes_history_and_tool_reads_it(replay, tmp_path, monkeypatch):
+    fastmcp = pytest.importorskip("fastmcp")
+    import mcp_server
+
+    monkeypatch.setattr(j, "history", ph.PremiumHistory(tmp_path))
+    monkeypatch.setattr(j._snapshot_cache, "_listeners", [j.history.on_snapshot])
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            await client.call_tool("fetch_qdii_candidates", {"threshold": 2.0})
+            result = await client.call_tool("fetch_premium_history", {"code": "164906"})
+            bad = await client.call_tool("fetch_premium_history", {"code": "164906", "start": "last week"})
+            return json.loads(result.content[0].text), json.loads(bad.content[0].text)
+
+    result, bad = asyncio.run(run())
+    assert result["count"] == 1
+    assert result["points"][0]["T-1溢价率"] is not None
+    assert "error" in bad
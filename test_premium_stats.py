@@ -0,0 +1,129 @@
+"""
+溢价率滚动统计的测试
+"""
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from fund_quote import FundQuote
+from premium_stats import RollingPremiumStats
+from premium_history import parse_time
+
+# 2025-12-01 是周一
+MONDAY = parse_time("2025-12-01 10:00")
+DAY = 86400
+
+
+def _trading_days(n: int):
+    # 依次返回 n 个交易日的时间戳（跳过周末）
+    out, ts = [], MONDAY
+    while len(out) < n:
+        if time.gmtime(ts + 8 * 3600).tm_wday < 5:
+            out.append(ts)
+        ts += DAY
+    return out
+
+
+def _q(code: str, premium: float, name: str = "") -> FundQuote:
+    return FundQuote.from_raw(code, name or f"基金{code}", f"{premium:.2f}%", "限100")
+
+
+def test_ewma_matches_daily_recurrence():
+    values = [1.0, 3.0, 2.0, 5.0, 4.0, 6.0]
+    stats = RollingPremiumStats(halflife=3)
+    for ts, v in zip(_trading_days(len(values)), values):
+        # 同一天多次快照只有最后一个值生效
+        stats.update([_q("164906", v - 10)], ts)
+        stats.update([_q("164906", v)], ts + 60)
+    a = stats.alpha
+    mean, var = values[0], 0.0
+    for x in values[1:-1]:
+        diff = x - mean
+        mean += a * diff
+        var = (1 - a) * (var + diff * a * diff)
+    assert stats.mean[0] == pytest.approx(mean)
+    assert stats.var[0] == pytest.approx(var)
+    (row,) = stats.rank("zscore", min_days=1)
+    assert row["z分数"] == pytest.approx(round((values[-1] - mean) / var ** 0.5, 2))
+    assert row["历史天数"] == len(values) - 1
+
+
+def test_streak_counts_trading_days_and_resets():
+    stats = RollingPremiumStats(threshold=2.0)
+    days = _trading_days(6)
+    for ts, v in zip(days, [3.0, 2.5, 1.0, 4.0, 5.0, 6.0]):
+        stats.update([_q("164906", v), _q("513100", 0.5)], ts)
+    (row,) = stats.rank("persistence")
+    assert row["代码"] == "164906"
+    # 第 3 天跌破阈值后重新计数：4.0、5.0 以及当日 6.0
+    assert row["连续超阈值天数"] == 3
+
+
+def test_streak_is_zero_when_currently_below_threshold():
+    stats = RollingPremiumStats(threshold=2.0)
+    for ts, v in zip(_trading_days(3), [3.0, 2.5, 1.0]):
+        stats.update([_q("164906", v)], ts)
+    assert int(stats._view()["streak"][0]) == 0
+    assert stats.rank("persistence") == []
+
+
+def test_weekend_snapshots_are_ignored():
+    stats = RollingPremiumStats()
+    saturday = MONDAY + 5 * DAY
+    assert stats.update([_q("164906", 3.0)], saturday) == 0
+    assert stats.stats()["funds"] == 0
+
+
+def test_rolling_max_expires_outside_window():
+    stats = RollingPremiumStats(window=3)
+    for ts, v in zip(_trading_days(5), [9.0, 1.0, 2.0, 3.0, 1.5]):
+        stats.update([_q("164906", v)], ts)
+    (row,) = stats.rank("zscore", min_days=1)
+    assert row["滚动最高"] == 3.0
+
+
+def test_rank_top_and_validation():
+    stats = RollingPremiumStats(threshold=0.0)
+    days = _trading_days(3)
+    for d, ts in enumerate(days):
+        stats.update([_q(f"{100000 + i}", i * 0.1 + d) for i in range(50)], ts)
+    ranked = stats.rank("persistence", top=5)
+    assert [r["代码"] for r in ranked] == ["100049", "100048", "100047", "100046", "100045"]
+    with pytest.raises(ValueError):
+        stats.rank("volume")
+
+
+def test_update_scales_to_thousands_of_funds():
+    stats = RollingPremiumStats(window=120, capacity=16)
+    rnd = np.random.default_rng(0)
+    codes = [f"{100000 + i}" for i in range(5000)]
+    days = _trading_days(120)
+    start = time.perf_counter()
+    for ts in days:
+        premiums = rnd.normal(1.0, 2.0, len(codes))
+        stats.update([_q(c, p) for c, p in zip(codes, premiums)], ts)
+    elapsed = time.perf_counter() - start
+    assert stats.stats()["funds"] == 5000
+    assert len(stats.rank("zscore", top=20)) == 20
+    # 每个快照的更新与快照规模成正比，与历史长度无关
+    assert elapsed < 10
+
+
+def test_rank_tool_offline(replay):
+    import asyncio
+    import json
+
+    fastmcp = pytest.importorskip("fastmcp")
+    import mcp_server
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            ok = await client.call_tool("rank_premium_signals", {"by": "persistence", "top": 5})
+            bad = await client.call_tool("rank_premium_signals", {"by": "volume"})
+            return json.loads(ok.content[0].text), json.loads(bad.content[0].text)
+
+    ranked, bad = asyncio.run(run())
+    assert isinstance(ranked, list) and len(ranked) <= 5
+    assert "error" in bad
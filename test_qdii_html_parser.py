@@ -0,0 +1,46 @@
+"""
+流式 HTML 解析测试：按任意块大小喂入结果一致
+"""
+import qdii_html_parser as hp
+
+PAGE = """<html><body><table id="flex_qdiie">
+<tr><th>代码</th><th>名称</th></tr>
+<tr id="164906"><td data-name="fund_id">164906</td><td data-name="fund_nm">交银中证海外&amp;中概</td>
+<td data-name="price">1.2</td><td data-name="discount_rt">3.21%</td><td data-name="apply_status">限100</td></tr>
+<tr><td data-name="fund_id">513100</td><td data-name="fund_nm">纳指ETF</td>
+<td data-name="discount_rt">-0.5%</td><td data-name="apply_status">暂停申购</td></tr>
+</table>
+<table><tr><td>160125 南方香港</td><td>T-1溢价率 2.50%</td><td>申购状态 限大额</td></tr>
+<tr><td>无代码</td></tr></table></body></html>"""
+
+
+def _summary(rows):
+    return [(q.code, q.name, q.premium, q.status_text) for q in rows]
+
+
+def test_parse_both_layouts():
+    rows = hp.parse_rows(PAGE)
+    assert _summary(rows) == [
+        ("164906", "交银中证海外&中概", 3.21, "限100"),
+        ("513100", "纳指ETF", -0.5, "暂停申购"),
+        ("160125", "南方香港", 2.5, "限大额"),
+    ]
+
+
+def test_chunked_feed_yields_rows_as_they_close():
+    data = PAGE.encode("utf-8")
+    whole = _summary(hp.parse_rows(PAGE))
+    for size in (1, 7, 64):
+        parser = hp.StreamingRowParser()
+        seen = []
+        for i in range(0, len(data), size):
+            seen.extend(parser.feed(data[i:i + size]))
+        seen.extend(parser.close())
+        assert _summary(seen) == whole
+
+
+def test_multibyte_characters_split_across_chunks():
+    expected = _summary(hp.parse_rows(PAGE))
+    data = PAGE.encode("utf-8")
+    # 逐字节喂入，验证多字节中文字符跨块时能正确解码
+    assert _summary(hp.iter_rows(data[i:i + 1] for i in range(len(data)))) == expected
@@ -0,0 +1,103 @@
+"""
+录制 / 回放传输层的离线测试
+所有请求都由 fixtures/replay 下的录制响应提供，不访问网络，也不需要启动服务
+"""
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import deepseek_client
+import jisilu_mcp_server as j
+import wechat_server
+from replay_transport import ReplayMissError, ReplayTransport, fixture_key
+
+
+def test_fixture_key_ignores_cache_buster_and_redacts_sendkey():
+    a = httpx.Request("GET", "https://www.jisilu.cn/data/qdii/qdii_list/E", params={"___jsl": "LST___t=1", "rp": "22"})
+    b = httpx.Request("GET", "https://www.jisilu.cn/data/qdii/qdii_list/E", params={"rp": "22", "___jsl": "LST___t=2"})
+    assert fixture_key(a) == fixture_key(b)
+    s1 = httpx.Request("POST", "https://sctapi.ftqq.com/SCT111.send")
+    s2 = httpx.Request("POST", "https://sctapi.ftqq.com/SCT222.send")
+    assert fixture_key(s1) == fixture_key(s2)
+    assert "SCT111" not in fixture_key(s1)
+
+
+def test_qdii_candidates_offline(replay):
+    rows = j._fetch_api_rows()
+    # 四个分类共 49 只基金，其中 E 类分两页
+    assert len(rows) == 49
+    assert len({r.code for r in rows}) == 49
+    candidates = j.qdii_candidates(2.0)
+    assert candidates
+    assert all(r.premium > 2.0 for r in candidates)
+    assert replay.requests == 10
+
+
+def test_wechat_and_deepseek_offline(replay, monkeypatch):
+    monkeypatch.setattr(deepseek_client, "_load_api_key", lambda: "sk-test")
+    monkeypatch.setattr(wechat_server, "_load_sct_key", lambda: "SCTtest")
+    result = asyncio.run(wechat_server.send_wechat("标题", "内容"))
+    assert result["status_code"] == 200
+    assert result["response"]["code"] == 0
+    reply = deepseek_client.chat("总结今日溢价")
+    assert reply["choices"][0]["message"]["content"]
+
+
+def test_missing_fixture_raises(tmp_path):
+    client = httpx.Client(transport=ReplayTransport(tmp_path))
+    with pytest.raises(ReplayMissError):
+        client.get("https://example.com/none")
+
+
+def test_injected_latency_and_failures(replay):
+    replay.latency = 0.05
+    start = time.perf_counter()
+    rows = asyncio.run(j._fetch_api_rows_async())
+    # 各来源并发，总耗时约为两轮延迟（E 类第二页在第一页之后）
+    assert len(rows) == 49
+    assert time.perf_counter() - start < 0.5
+
+    replay.latency = 0.0
+    replay.failure_rate = 1.0
+    # 全部失败时 API 返回空列表，由上层回退到 akshare
+    assert asyncio.run(j._fetch_api_rows_async()) == []
+
+
+def test_record_mode_saves_and_replays(tmp_path):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        return httpx.Response(200, json={"rows": [], "total": 0}, headers={"set-cookie": "sid=secret"})
+
+    recorder = ReplayTransport(tmp_path, mode="record", upstream=httpx.MockTransport(handler))
+    with httpx.Client(transport=recorder) as client:
+        assert client.get("https://www.jisilu.cn/data/lof/index_lof_list/", params={"___jsl": "1"}).json() == {"rows": [], "total": 0}
+    saved = list(tmp_path.rglob("*.json"))
+    assert len(saved) == 1
+    assert "secret" not in saved[0].read_text(encoding="utf-8")
+
+    with httpx.Client(transport=ReplayTransport(tmp_path)) as client:
+        assert client.get("https://www.jisilu.cn/data/lof/index_lof_list/", params={"___jsl": "2"}).json()["total"] == 0
+    assert len(calls) == 1
+
+
+def test_mcp_tools_offline(replay):
+    fastmcp = pytest.importorskip("fastmcp")
+    import mcp_server
+
+    misses = j.cache_stats()["misses"]
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            result = await client.call_tool("fetch_qdii_candidates", {"threshold": 2.0})
+            stats = await client.read_resource("cache://qdii")
+            return json.loads(result.content[0].text), json.loads(stats[0].text)
+
+    candidates, stats = asyncio.run(run())
+    assert candidates
+    assert all(c["T-1溢价率"] > 2.0 for c in candidates)
+    assert stats["misses"] == misses + 1
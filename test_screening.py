@@ -0,0 +1,83 @@
+"""
+溢价率索引测试：与逐行过滤结果一致
+"""
+import asyncio
+import json
+
+import fastmcp
+import pytest
+
+import jisilu_mcp_server as j
+import screening
+from fund_quote import ApplyStatus, FundQuote
+from screening import PremiumIndex, Screen
+
+
+def _quotes():
+    statuses = ["限100", "限大额", "暂停申购", "开放申购", "", "其他"]
+    premiums = ["3.5%", "-", "2.0%", "-1.2%", "10%", "2.01%", "nan"]
+    return [FundQuote.from_raw(f"{100000 + i}", f"f{i}", premiums[i % len(premiums)], statuses[i % len(statuses)])
+            for i in range(60)]
+
+
+def test_screen_many_matches_row_loop():
+    quotes = _quotes()
+    index = PremiumIndex(quotes)
+    thresholds = [-2.0, 0.0, 2.0, 3.0, 20.0]
+    for t, got in zip(thresholds, index.screen_many([Screen(t) for t in thresholds])):
+        assert got == j._filter_candidates(quotes, t)
+
+
+def test_custom_status_sets():
+    quotes = _quotes()
+    index = PremiumIndex(quotes)
+    only_limited = frozenset(s for s in ApplyStatus if s is not ApplyStatus.LIMITED)
+    (got,) = index.screen_many([Screen(2.0, only_limited)])
+    assert got and all(q.status is ApplyStatus.LIMITED and q.premium > 2.0 for q in got)
+    assert index.screen_many([]) == []
+
+
+@pytest.mark.parametrize("use_numpy", [True, False], ids=["numpy", "lists"])
+def test_premium_index_matches_row_loop(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(screening, "np", None)
+    quotes = _quotes()
+    index = PremiumIndex(quotes)
+    thresholds = [-2.0, 0.0, 2.0, 2.005, 3.0, 20.0]
+    screens = [Screen(t) for t in thresholds] + [Screen(2.0, frozenset())]
+    for s, got in zip(screens, index.screen_many(screens)):
+        expected = [q for q in quotes if q.premium > s.threshold and q.status not in s.excluded]
+        assert got == expected
+        assert index.count(s.threshold, s.excluded) == len(expected)
+    ranked = sorted((q for q in quotes if q.has_premium), key=lambda q: -q.premium)
+    assert index.top(5) == ranked[:5]
+    limited = index.top(100, frozenset(s for s in ApplyStatus if s is not ApplyStatus.LIMITED))
+    assert limited == [q for q in ranked if q.status is ApplyStatus.LIMITED]
+    buckets = index.buckets([3, 0, 2])
+    assert [(b["min"], b["max"]) for b in buckets] == [(None, 0), (0, 2), (2, 3), (3, None)]
+    assert [b["count"] for b in buckets] == [
+        sum(q.premium <= 0 for q in ranked),
+        sum(0 < q.premium <= 2 for q in ranked),
+        sum(2 < q.premium <= 3 for q in ranked),
+        sum(q.premium > 3 for q in ranked),
+    ]
+    empty = PremiumIndex([])
+    assert empty.top(3) == [] and empty.count(1.0) == 0 and empty.screen_many([Screen(1.0)]) == [[]]
+
+
+def test_query_premium_index_tool(replay):
+    import mcp_server
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            top = await client.call_tool("query_premium_index", {"view": "top", "top": 3})
+            buckets = await client.call_tool("query_premium_index", {"view": "buckets", "edges": "0,2,5", "exclude_status": "暂停申购"})
+            bad = await client.call_tool("query_premium_index", {"view": "median"})
+            return [json.loads(r.content[0].text) for r in (top, buckets, bad)]
+
+    top, buckets, bad = asyncio.run(run())
+    premiums = [f["T-1溢价率"] for f in top["funds"]]
+    assert len(premiums) == 3 and premiums == sorted(premiums, reverse=True)
+    assert len(buckets["buckets"]) == 4
+    assert sum(b["count"] for b in buckets["buckets"]) <= buckets["indexed"]
+    assert "error" in bad
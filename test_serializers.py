@@ -0,0 +1,81 @@
+"""
+JSON 编解码层测试：各后端结果一致、只解码用到的字段、候选列表编码结果随快照缓存
+"""
+import asyncio
+import json
+
+import fastmcp
+import pytest
+
+import jisilu_mcp_server as j
+import serializers
+
+BACKENDS = [b for b, mod in (("json", json), ("orjson", serializers.orjson), ("msgspec", serializers.msgspec)) if mod is not None]
+
+PAGE = {
+    "page": 1,
+    "total": 45,
+    "rows": [
+        {"id": "164906", "cell": {"fund_id": "164906", "fund_nm": "中概互联LOF", "discount_rt": "5.12%", "apply_status": "限100", "price": "1.234", "nav_dt": "2025-12-04"}},
+        {"id": "513100", "cell": {"fund_id": "513100", "fund_nm": "纳指ETF", "discount_rt": 3.5, "apply_status": None}},
+        {"id": "000001", "cell": {"fund_id": "000001"}},
+    ],
+}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_decode_same_fields(monkeypatch, backend):
+    monkeypatch.setattr(serializers, "BACKEND", backend)
+    content = json.dumps(PAGE, ensure_ascii=False).encode("utf-8")
+    cells, total = serializers.decode_fund_page(content)
+    assert int(total) == 45
+    assert cells[0] == ("164906", "中概互联LOF", "5.12%", "限100")
+    assert cells[1] == ("513100", "纳指ETF", 3.5, None)
+    assert cells[2][0] == "000001" and not cells[2][1]
+    rows, pages = j._decode_page(content)
+    assert [r.premium for r in rows[:2]] == [5.12, 3.5]
+    assert pages == 15
+    # 非列表响应与非法 UTF-8
+    assert serializers.decode_fund_page(b"[]") == ([], 0)
+    assert serializers.loads(b'{"a": "\xff\xe4\xb8\xad"}') == {"a": "中"}
+    text = serializers.dumps({"名称": "中概", 1: [1.5, None]})
+    assert "中概" in text and json.loads(text) == {"名称": "中概", "1": [1.5, None]}
+
+
+def test_encoded_candidates_cached_per_snapshot(replay, monkeypatch):
+    calls = []
+    dumps = serializers.dumps
+    monkeypatch.setattr(serializers, "dumps", lambda obj: calls.append(1) or dumps(obj))
+
+    async def run():
+        first = await j.qdii_candidates_json(2.0)
+        second = await j.qdii_candidates_json(2.0)
+        other = await j.qdii_candidates_json(3.0)
+        j._snapshot_cache.invalidate()
+        j._payloads.clear()
+        refreshed = await j.qdii_candidates_json(2.0)
+        return first, second, other, refreshed
+
+    first, second, other, refreshed = asyncio.run(run())
+    assert second[1] is first[1]
+    assert first[0] == len(json.loads(first[1])) and first[0] >= other[0]
+    assert first[2]["stale"] is False
+    # 新快照版本重新编码
+    assert refreshed[:2] == first[:2] and refreshed[1] is not first[1]
+    assert len(calls) == 3
+
+
+def test_stale_response_keeps_list_shape(replay, monkeypatch):
+    monkeypatch.setattr(j, "freshness", lambda snap=None: {"stale": True, "age": 700.0, "upstream": "open", "retry_after": 5.0})
+    import mcp_server
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            result = await client.call_tool("fetch_qdii_candidates", {"threshold": 2.0})
+            cache = await client.read_resource("cache://qdii")
+            return result.content[0].text, cache[0].text
+
+    text, cache = asyncio.run(run())
+    data = json.loads(text)
+    assert isinstance(data, list) and data and "代码" in data[0]
+    assert json.loads(cache)["freshness"]["upstream"] == "open"
@@ -0,0 +1,102 @@
+"""
+SnapshotCache 测试：TTL 命中、并发合并、旧数据返回与后台刷新
+"""
+import asyncio
+
+from snapshot_cache import SnapshotCache
+
+
+class _Counter:
+    def __init__(self, delay: float = 0.05):
+        self.calls = 0
+        self.delay = delay
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return [{"代码": "100001", "call": self.calls}]
+
+
+def test_concurrent_misses_share_one_fetch():
+    fetch = _Counter()
+    cache = SnapshotCache(fetch, ttl=60)
+
+    async def run():
+        return await asyncio.gather(*(cache.get() for _ in range(20)))
+
+    snaps = asyncio.run(run())
+    assert fetch.calls == 1
+    assert all(s is snaps[0] for s in snaps)
+    assert cache.stats()["misses"] == 20
+
+
+def test_hit_within_ttl():
+    fetch = _Counter()
+    cache = SnapshotCache(fetch, ttl=60)
+
+    async def run():
+        await cache.get()
+        await cache.get()
+
+    asyncio.run(run())
+    assert fetch.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_stale_snapshot_served_while_refreshing():
+    fetch = _Counter(delay=0.05)
+    cache = SnapshotCache(fetch, ttl=0, max_stale=60)
+
+    async def run():
+        first = await cache.get()
+        stale = await cache.get()
+        assert stale is first
+        await asyncio.sleep(0.1)
+        return cache.snapshot
+
+    latest = asyncio.run(run())
+    assert fetch.calls == 2
+    assert latest.rows[0]["call"] == 2
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_empty_result_keeps_previous_snapshot():
+    results = [[{"代码": "100001"}], []]
+
+    async def fetch():
+        return results.pop(0)
+
+    cache = SnapshotCache(fetch, ttl=0, max_stale=0)
+
+    async def run():
+        first = await cache.get()
+        second = await cache.get()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert second is first
+    assert cache.stats()["errors"] == 1
+
+
+def test_same_rows_keep_version_and_skip_listeners():
+    rows = [{"代码": "100001"}]
+    calls = []
+
+    async def fetch():
+        return rows
+
+    cache = SnapshotCache(fetch, ttl=0)
+    cache.add_listener(calls.append)
+
+    async def run():
+        first = await cache.get()
+        first.memo("columns", lambda: "view")
+        second = await cache.refresh()
+        return first, second
+
+    first, second = asyncio.run(run())
+    # 上游未变化：同一快照、同一版本，派生数据保留，监听器只在首次调用
+    assert second is first and second.version == 1
+    assert second.derived == {"columns": "view"}
+    assert len(calls) == 1
+    assert cache.stats()["unchanged"] == 1
@@ -0,0 +1,197 @@
+"""
+多副本共享快照的测试：SQLite 存储、租约选举、follower 同步与 leader 切换
+"""
+import asyncio
+import math
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from fund_quote import FundQuote
+from snapshot_cache import SnapshotCache
+from snapshot_store import SharedSnapshots, SQLiteSnapshotStore, decode_rows, encode_rows, open_store
+
+
+def rows(n=3, premium=3.0):
+    return [FundQuote.from_raw(f"16{i:04d}", f"基金{i}", f"{premium + i}%", "限100") for i in range(n)]
+
+
+def test_encode_roundtrip_keeps_nan_and_status():
+    src = rows(2) + [FundQuote.from_raw("513100", "纳指ETF", "-", "暂停申购")]
+    out = decode_rows(encode_rows(src))
+    assert [q.code for q in out] == [q.code for q in src]
+    assert out[0] == src[0]
+    assert math.isnan(out[2].premium) and out[2].status == src[2].status
+
+
+def test_sqlite_store_versions_and_lease(tmp_path):
+    a = SQLiteSnapshotStore(str(tmp_path / "s.db"), keep=2)
+    b = open_store(f"sqlite:///{tmp_path / 's.db'}")
+    assert b.latest() is None
+    for i in range(3):
+        a.publish(rows(premium=i), time.time(), "a")
+    latest = b.latest()
+    assert latest.version == 3 and latest.producer == "a" and latest.rows[0].premium == 2.0
+    assert b.wait_for_change(3, timeout=0.05) is None
+    assert b.wait_for_change(2, timeout=0.05).version == 3
+    # 同一时间只有一个持有者；过期后可被接管
+    assert a.try_acquire("a", ttl=0.2)
+    assert not b.try_acquire("b", ttl=0.2)
+    assert a.try_acquire("a", ttl=0.2)
+    assert b.leader() == "a"
+    time.sleep(0.25)
+    assert b.try_acquire("b", ttl=5)
+    b.release("b")
+    assert a.leader() is None
+
+
+def test_only_leader_fetches_and_followers_sync(tmp_path):
+    path = str(tmp_path / "shared.db")
+    upstream_calls = []
+    follower_calls = []
+
+    async def upstream():
+        upstream_calls.append(1)
+        return rows(premium=len(upstream_calls))
+
+    async def follower_upstream():
+        follower_calls.append(1)
+        return rows()
+
+    async def run():
+        leader = SharedSnapshots(SQLiteSnapshotStore(path), upstream, owner="a", lease_ttl=5, watch_interval=0.05)
+        followers = [SharedSnapshots(SQLiteSnapshotStore(path), follower_upstream, owner=f"f{i}", lease_ttl=5, watch_interval=0.05) for i in range(3)]
+        caches = [SnapshotCache(leader.fetch, ttl=0.3)] + [SnapshotCache(f.fetch, ttl=60) for f in followers]
+        received = {i: [] for i in range(1, 4)}
+        for i in range(1, 4):
+            caches[i].add_listener(lambda snap, i=i: received[i].append(snap.rows[0].premium))
+        first = await caches[0].get()
+        assert leader.is_leader and first.rows[0].premium == 1.0
+        for f, c in zip(followers, caches[1:]):
+            f.start(c)
+        leader.start(caches[0])
+        # leader 的快照过期后主动刷新，follower 通过版本变化收到新快照
+        for _ in range(100):
+            if all(len(v) >= 2 for v in received.values()):
+                break
+            await asyncio.sleep(0.05)
+        for f in followers:
+            await f.stop()
+        await leader.stop()
+        return received, [f.is_leader for f in followers]
+
+    received, follower_leaders = asyncio.run(run())
+    assert follower_leaders == [False, False, False]
+    for values in received.values():
+        assert values[:2] == [1.0, 2.0]
+    # 四个副本只有 leader 访问上游
+    assert len(upstream_calls) >= 2
+    assert follower_calls == []
+
+
+def test_follower_takes_over_after_leader_stops(tmp_path):
+    path = str(tmp_path / "shared.db")
+    calls = {"a": 0, "b": 0}
+
+    def upstream(name):
+        async def fetch():
+            calls[name] += 1
+            return rows()
+        return fetch
+
+    async def run():
+        a = SharedSnapshots(SQLiteSnapshotStore(path), upstream("a"), owner="a", lease_ttl=0.3, watch_interval=0.05)
+        b = SharedSnapshots(SQLiteSnapshotStore(path), upstream("b"), owner="b", lease_ttl=0.3, watch_interval=0.05)
+        assert await a.fetch()
+        assert await b.fetch()
+        assert (a.is_leader, b.is_leader) == (True, False)
+        await a.stop()
+        assert await b.fetch()
+        return b.is_leader, b.stats()
+
+    is_leader, stats = asyncio.run(run())
+    assert is_leader and stats["leader"] == "b"
+    assert calls == {"a": 1, "b": 1}
+
+
+def test_follower_started_before_leader_publishes_seeds_no_empty_baseline(tmp_path):
+    from candidate_poller import CandidatePoller
+
+    path = str(tmp_path / "shared.db")
+    sent = []
+
+    async def upstream():
+        return rows()
+
+    async def notify(title, desp):
+        sent.append(title)
+
+    async def run():
+        store = SQLiteSnapshotStore(path)
+        # 另一个副本持有租约但尚未发布快照
+        assert store.try_acquire("leader", ttl=30)
+        follower = SharedSnapshots(SQLiteSnapshotStore(path), upstream, owner="f", lease_ttl=30)
+        cache = SnapshotCache(follower.fetch, ttl=0, max_stale=0)
+        poller = CandidatePoller(cache.get, notify, threshold=2.0)
+        empty = await poller.poll_once()
+        store.publish(rows(), time.time(), "leader")
+        seeded = await poller.poll_once()
+        store.publish(rows(4), time.time(), "leader")
+        changed = await poller.poll_once()
+        return follower.is_leader, empty, seeded, changed
+
+    is_leader, empty, seeded, changed = asyncio.run(run())
+    assert not is_leader
+    assert empty == [] and seeded == []
+    # 只有 leader 发布后新增的基金被通知
+    assert [(a.quote.code, a.reason) for a in changed] == [("160003", "new")]
+    assert len(sent) == 1
+
+
+_WORKER = """
+import asyncio, sys
+sys.path.insert(0, {root!r})
+from fund_quote import FundQuote
+from snapshot_store import SharedSnapshots, SQLiteSnapshotStore
+
+async def upstream():
+    with open({log!r}, "a") as f:
+        f.write("fetch\\n")
+    await asyncio.sleep(0.2)
+    return [FundQuote.from_raw("164906", "中概互联", "5%", "限100")]
+
+async def main():
+    shared = SharedSnapshots(SQLiteSnapshotStore({db!r}), upstream, lease_ttl=30)
+    for _ in range(20):
+        rows = await shared.fetch()
+        if rows:
+            break
+        await asyncio.sleep(0.05)
+    print(shared.is_leader, rows[0].code)
+
+asyncio.run(main())
+"""
+
+
+def test_processes_share_one_upstream_fetch(tmp_path):
+    root = str(Path(__file__).parent)
+    log = str(tmp_path / "fetch.log")
+    code = _WORKER.format(root=root, log=log, db=str(tmp_path / "shared.db"))
+    procs = [subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE, text=True) for _ in range(4)]
+    outputs = [p.communicate(timeout=60)[0].split() for p in procs]
+    assert sorted(o[0] for o in outputs) == ["False", "False", "False", "True"]
+    assert all(o[1] == "164906" for o in outputs)
+    assert Path(log).read_text().count("fetch") == 1
+
+
+def test_redis_backend_requires_client():
+    try:
+        import redis  # noqa: F401
+    except ImportError:
+        with pytest.raises(RuntimeError):
+            open_store("redis://localhost:6379/0")
+    with pytest.raises(ValueError):
+        open_store("memcached://x")
@@ -0,0 +1,123 @@
+"""
+多数据源编排的测试：用假的异步来源模拟慢、失败与空结果
+"""
+import asyncio
+import time
+
+import pytest
+
+from fund_quote import FundQuote
+from source_orchestrator import Source, SourceOrchestrator, merge_rows
+
+
+def _rows(*codes: str):
+    return [FundQuote.from_raw(c, f"基金{c}", "3.00%", "限100") for c in codes]
+
+
+def _source(name: str, delay: float, rows=None, error: Exception = None, timeout: float = 5.0) -> Source:
+    async def fetch():
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return rows or []
+    return Source(name, fetch, timeout=timeout)
+
+
+def _timed(orch: SourceOrchestrator):
+    async def run():
+        start = time.perf_counter()
+        rows = await orch.fetch()
+        return rows, time.perf_counter() - start
+    return asyncio.run(run())
+
+
+def test_parallel_returns_first_good_answer():
+    api = _source("api", 0.5, _rows("100001"))
+    ak = _source("ak", 0.05, _rows("100002"))
+    rows, elapsed = _timed(SourceOrchestrator([api, ak], mode="parallel"))
+    assert [r.code for r in rows] == ["100002"]
+    assert elapsed < 0.3
+    assert api.metrics.cancelled == 1
+    assert ak.metrics.wins == 1
+
+
+def test_parallel_merge_prefers_earlier_source():
+    api = _source("api", 0.05, [FundQuote.from_raw("100001", "api", "3.00%", "限100")])
+    ak = _source("ak", 0.1, [FundQuote.from_raw("100001", "ak", "3.00%", "限100")] + _rows("100002"))
+    rows, _ = _timed(SourceOrchestrator([api, ak], mode="parallel", merge=True))
+    assert [(r.code, r.name) for r in rows] == [("100001", "api"), ("100002", "基金100002")]
+
+
+def test_hedged_launches_backup_after_delay():
+    api = _source("api", 1.0, _rows("100001"))
+    ak = _source("ak", 0.05, _rows("100002"))
+    rows, elapsed = _timed(SourceOrchestrator([api, ak], mode="hedged", hedge_delay=0.1))
+    assert [r.code for r in rows] == ["100002"]
+    assert 0.1 <= elapsed < 0.5
+
+
+def test_hedged_does_not_launch_backup_when_primary_is_fast():
+    api = _source("api", 0.01, _rows("100001"))
+    ak = _source("ak", 0.01, _rows("100002"))
+    rows, _ = _timed(SourceOrchestrator([api, ak], mode="hedged", hedge_delay=0.5))
+    assert [r.code for r in rows] == ["100001"]
+    assert ak.metrics.calls == 0 and ak.metrics.cancelled == 0
+
+
+def test_failed_primary_starts_backup_immediately():
+    api = _source("api", 0.01, error=RuntimeError("503"))
+    ak = _source("ak", 0.01, _rows("100002"))
+    rows, elapsed = _timed(SourceOrchestrator([api, ak], mode="hedged", hedge_delay=5))
+    assert [r.code for r in rows] == ["100002"]
+    assert elapsed < 0.5
+    assert api.metrics.stats()["last_error"] == "RuntimeError: 503"
+
+
+def test_timeout_counts_as_failure_and_all_fail_returns_empty():
+    api = _source("api", 1.0, _rows("100001"), timeout=0.05)
+    ak = _source("ak", 0.01, [])
+    rows, _ = _timed(SourceOrchestrator([api, ak], mode="sequential"))
+    assert rows == []
+    assert api.metrics.failures == 1 and ak.metrics.failures == 1
+
+
+def test_metrics_steer_source_order():
+    api = _source("api", 0.01, error=RuntimeError("down"))
+    ak = _source("ak", 0.01, _rows("100002"))
+    orch = SourceOrchestrator([api, ak], mode="sequential")
+    for _ in range(3):
+        asyncio.run(orch.fetch())
+    assert [s.name for s in orch.ranked()] == ["ak", "api"]
+    # 首选来源变为 akshare 后不再先等待失败的 API
+    asyncio.run(orch.fetch())
+    assert api.metrics.calls == 1
+    assert orch.stats()["last_source"] == "ak"
+
+
+def test_hedge_delay_follows_latency_percentile_with_floor():
+    api = _source("api", 0.01, _rows("100001"))
+    orch = SourceOrchestrator([api], hedge_percentile=0.9, hedge_delay=3, hedge_min_delay=0.2)
+    assert orch._hedge_after(api) == 3
+    for latency in [0.1] * 9 + [0.5]:
+        api.metrics.record(True, latency)
+    assert orch._hedge_after(api) == 0.2
+    for latency in [1.0] * 10:
+        api.metrics.record(True, latency)
+    assert orch._hedge_after(api) == 1.0
+
+
+def test_untried_source_does_not_jump_ahead():
+    api = _source("api", 0.01, _rows("100001"))
+    ak = _source("ak", 0.01, _rows("100002"))
+    orch = SourceOrchestrator([api, ak], mode="hedged", hedge_delay=1)
+    asyncio.run(orch.fetch())
+    assert [s.name for s in orch.ranked()] == ["api", "ak"]
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        SourceOrchestrator([], mode="fastest")
+
+
+def test_merge_rows_skips_empty_codes():
+    assert [r.code for r in merge_rows([_rows("1", ""), _rows("1", "2")])] == ["1", "2"]
@@ -0,0 +1,53 @@
+"""
+冷启动预算：导入 mcp_server 的耗时与延迟加载的模块（CI 中执行）
+
+预算可用环境变量 STARTUP_BUDGET_MS 调整，详见 bench_startup.py。
+"""
+import os
+import subprocess
+import sys
+
+import bench_startup
+
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     encodings\n"
+        "import time:      1500 |       2000 |   fund_quote\n"
+        "import time:       300 |       2300 | mcp_server\n"
+    )
+    modules = bench_startup.parse_importtime(stderr)
+    assert modules["fund_quote"] == (1500, 2000, 1)
+    assert bench_startup.total_ms(modules, "mcp_server") == 2.3
+
+
+def test_mcp_server_import_within_budget():
+    modules = bench_startup.measure("mcp_server")
+    assert bench_startup.loaded_lazy_modules(modules) == []
+    budget = float(os.getenv("STARTUP_BUDGET_MS", bench_startup.DEFAULT_BUDGET_MS))
+    assert bench_startup.total_ms(modules, "mcp_server") < budget
+
+
+def test_jisilu_module_does_not_load_mcp_sdk():
+    modules = bench_startup.measure("jisilu_mcp_server")
+    assert "mcp.server.fastmcp" not in modules
+    assert bench_startup.loaded_lazy_modules(modules) == []
+
+
+def test_no_duplicate_fastmcp_instances():
+    code = (
+        "import mcp_server, wechat_server, jisilu_mcp_server;"
+        "print(wechat_server._server is None and jisilu_mcp_server._server is None)"
+    )
+    out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True, timeout=120,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert out.stdout.strip().splitlines()[-1] == "True"
+
+
+def test_warmup_imports_akshare_off_loop():
+    import jisilu_mcp_server as j
+
+    timings = j.warmup()
+    assert set(timings) == {"akshare"}
+    assert timings["akshare"] >= 0
@@ -0,0 +1,163 @@
+"""
+候选基金订阅的测试：增量计算、一次筛选扇出到多个订阅、通过 MCP 通知推送
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+from fund_quote import FundQuote
+from screening import PremiumIndex, Screen
+from snapshot_cache import Snapshot
+from subscriptions import SubscriptionHub, diff_candidates
+
+
+def q(code, premium, status="限100"):
+    return FundQuote.from_raw(code, f"基金{code}", premium, status)
+
+
+def test_diff_candidates():
+    previous = {x.code: x for x in [q("1", 3.0), q("2", 4.0), q("3", 5.0)]}
+    delta = diff_candidates(previous, [q("1", 3.0), q("2", 4.5), q("4", 6.0)])
+    assert [d["代码"] for d in delta["added"]] == ["4"]
+    assert [d["代码"] for d in delta["removed"]] == ["3"]
+    assert [d["代码"] for d in delta["changed"]] == ["2"]
+
+
+def test_one_screen_pass_fans_out_to_all_subscribers(monkeypatch):
+    calls = []
+    original = PremiumIndex.screen_many
+
+    def spy(self, screens):
+        calls.append(len(screens))
+        return original(self, screens)
+
+    monkeypatch.setattr(PremiumIndex, "screen_many", spy)
+    snaps = [Snapshot([q("1", 3.0), q("2", 1.0), q("3", 5.0, "暂停申购")], time.time(), 1)]
+
+    async def get_snapshot():
+        return snaps[-1]
+
+    async def run():
+        hub = SubscriptionHub(get_snapshot)
+        pushed = {}
+
+        def sender(name):
+            async def send(payload):
+                pushed.setdefault(name, []).append(payload)
+            return send
+
+        a = await hub.subscribe(Screen(2.0), sender("a"))
+        b = await hub.subscribe(Screen(2.0), sender("b"))
+        c = await hub.subscribe(Screen(0.5, frozenset()), sender("c"))
+        assert [x.code for x in a.state.values()] == ["1"]
+        # 相同筛选条件的第二个订阅是独立的订阅，初始结果相同
+        assert b.id != a.id and list(b.state) == list(a.state)
+        assert sorted(c.state) == ["1", "2", "3"]
+        calls.clear()
+        # 新快照：2 号越过阈值，1 号溢价率变化，3 号不变
+        snaps.append(Snapshot([q("1", 3.5), q("2", 2.5), q("3", 5.0, "暂停申购")], time.time(), 2))
+        hub.on_snapshot(snaps[-1])
+        await asyncio.sleep(0.01)
+        hub.clear()
+        return pushed
+
+    pushed = asyncio.run(run())
+    # 三个订阅只有两种不同的筛选条件，一次 screen_many 完成
+    assert calls == [2]
+    for name in ("a", "b"):
+        (payload,) = pushed[name]
+        assert [d["代码"] for d in payload["added"]] == ["2"]
+        assert [d["代码"] for d in payload["changed"]] == ["1"]
+        assert payload["version"] == 2 and payload["previous_version"] == 1
+    (payload,) = pushed["c"]
+    assert payload["added"] == [] and [d["代码"] for d in payload["changed"]] == ["1", "2"]
+
+
+def test_unchanged_snapshot_pushes_nothing_and_dead_sessions_are_dropped():
+    snap = Snapshot([q("1", 3.0)], time.time(), 1)
+
+    async def get_snapshot():
+        return snap
+
+    async def run():
+        hub = SubscriptionHub(get_snapshot)
+        sent = []
+
+        async def ok(payload):
+            sent.append(payload)
+
+        async def broken(payload):
+            raise ConnectionError("closed")
+
+        await hub.subscribe(Screen(2.0), ok)
+        await hub.subscribe(Screen(2.0), broken)
+        hub.on_snapshot(Snapshot([q("1", 3.0)], time.time(), 2))
+        await asyncio.sleep(0.01)
+        assert sent == []
+        hub.on_snapshot(Snapshot([], time.time(), 3))
+        await asyncio.sleep(0.01)
+        stats = hub.stats()
+        hub.clear()
+        return sent, stats
+
+    sent, stats = asyncio.run(run())
+    assert len(sent) == 1 and sent[0]["removed"][0]["代码"] == "1"
+    assert stats["subscriptions"] == 1 and stats["dropped"] == 1
+
+
+def test_subscription_over_mcp(replay):
+    fastmcp = pytest.importorskip("fastmcp")
+    import jisilu_mcp_server as j
+    import mcp_server
+
+    notifications = []
+
+    async def on_message(message):
+        root = getattr(message, "root", message)
+        if getattr(root, "method", "") == "notifications/resources/updated":
+            notifications.append(root.params.model_dump())
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp, message_handler=on_message) as client:
+            result = await client.call_tool("subscribe_qdii_candidates", {"threshold": 2.0})
+            sub = json.loads(result.content[0].text)
+            base = {c["代码"]: c for c in sub["candidates"]}
+            assert base
+            # 下一次抓取中第一只候选的溢价率跌破阈值
+            dropped = next(iter(base))
+            snap = j._snapshot_cache.snapshot
+            rows = [FundQuote(r.code, r.name, 0.0 if r.code == dropped else r.premium, r.status, r.status_text) for r in snap.rows]
+
+            async def fetch():
+                return rows
+
+            j._snapshot_cache._fetch, original = fetch, j._snapshot_cache._fetch
+            try:
+                await j._snapshot_cache.refresh()
+            finally:
+                j._snapshot_cache._fetch = original
+            for _ in range(100):
+                if notifications:
+                    break
+                await asyncio.sleep(0.01)
+            state = json.loads((await client.read_resource(sub["uri"]))[0].text)
+            await client.call_tool("unsubscribe_qdii_candidates", {"subscription_id": sub["subscription_id"]})
+            return sub, dropped, state
+
+    sub, dropped, state = asyncio.run(run())
+    (note,) = notifications
+    assert str(note["uri"]) == sub["uri"]
+    assert [d["代码"] for d in note["removed"]] == [dropped]
+    assert note["added"] == []
+    assert dropped not in {c["代码"] for c in state["candidates"]}
+    assert len(mcp_server.subscriptions) == 0
+
+
+def test_unknown_status_is_rejected():
+    import mcp_server
+
+    with pytest.raises(ValueError):
+        mcp_server._parse_statuses("开放申购,不存在")
+    assert mcp_server._parse_statuses("") == frozenset()
@@ -0,0 +1,113 @@
+"""
+工作池与准入控制的测试，以及 50 个并发客户端的负载测试（回放夹具，不访问网络）
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from worker_pool import PoolBusyError, WorkerPool
+
+
+def test_blocking_work_does_not_stall_loop():
+    pool = WorkerPool(threads=2)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        t = asyncio.ensure_future(ticker())
+        await asyncio.gather(pool.run(time.sleep, 0.3), pool.run(time.sleep, 0.3))
+        t.cancel()
+        return ticks
+
+    # 两个阻塞 0.3s 的任务并行执行期间，事件循环仍在调度其他协程
+    assert asyncio.run(run()) >= 10
+    pool.shutdown()
+
+
+def test_queue_full_is_rejected_immediately():
+    pool = WorkerPool(threads=1, max_queue=1)
+    gate = threading.Event()
+
+    async def run():
+        first = asyncio.ensure_future(pool.run(gate.wait))
+        second = asyncio.ensure_future(pool.run(gate.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolBusyError) as exc:
+            await pool.run(gate.wait)
+        assert exc.value.retry_after > 0
+        # 内部任务不受排队深度限制
+        third = asyncio.ensure_future(pool.run(lambda: 3, admit=False))
+        gate.set()
+        return await asyncio.gather(first, second, third)
+
+    assert asyncio.run(run()) == [True, True, 3]
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["pending"] == 0
+    pool.shutdown()
+
+
+def test_tool_limit_only_affects_that_tool():
+    pool = WorkerPool(tool_limit=2, tool_limits={"slow": 1})
+    with pool.admit("slow"):
+        with pytest.raises(PoolBusyError):
+            with pool.admit("slow"):
+                pass
+        with pool.admit("fast"), pool.admit("fast"):
+            assert pool.stats()["inflight"] == {"slow": 1, "fast": 2}
+    with pool.admit("slow"):
+        pass
+    assert pool.stats()["tool_rejected"] == 1
+
+
+def test_process_pool_for_cpu_tasks():
+    pool = WorkerPool(threads=1, processes=1)
+    assert asyncio.run(pool.run(pow, 2, 10, cpu=True)) == 1024
+    pool.shutdown()
+
+
+def test_busy_tool_returns_retry_after(replay):
+    import json
+
+    import fastmcp
+    import mcp_server
+
+    async def run():
+        async with fastmcp.Client(mcp_server.mcp) as client:
+            mcp_server.worker_pool.tool_limits["fetch_premium_history"] = 0
+            try:
+                return await client.call_tool("fetch_premium_history", {"code": "164906"})
+            finally:
+                del mcp_server.worker_pool.tool_limits["fetch_premium_history"]
+
+    data = json.loads(asyncio.run(run()).content[0].text)
+    assert data["error"] == "busy"
+    assert data["retry_after"] > 0
+
+
+def test_fifty_concurrent_clients(replay, monkeypatch):
+    import bench_load
+    import jisilu_mcp_server as j
+    from worker_pool import pool
+
+    replay.latency = 0.05
+    # 抓取工具的在途上限低于客户端数，准入控制必然拒绝一部分调用
+    monkeypatch.setitem(pool.tool_limits, "fetch_qdii_candidates", 10)
+    before = pool.stats()
+    stats = asyncio.run(bench_load.run_load(clients=50, rounds=2, invalidate=j._snapshot_cache.invalidate))
+    after = pool.stats()
+    assert stats["calls"] == 50 * 2 * len(bench_load.CALLS)
+    # 统计到的 busy 响应数与工作池的拒绝数一致
+    rejected = (after["rejected"] + after["tool_rejected"]) - (before["rejected"] + before["tool_rejected"])
+    assert stats["busy"] == rejected > 0
+    # 慢抓取期间轻量工具仍能及时返回，事件循环没有被阻塞
+    assert stats["tools"]["get_wechat_status"]["p99"] < 2.0
+    assert stats["p99"] < 10.0
+    assert stats["max_loop_lag"] < 0.5
@@ -14,9 +14,27 @@ import json
 import os
 from pathlib import Path
 import httpx
-from mcp.server.fastmcp import FastMCP
+from circuit_breaker import CircuitOpenError
+from http_clients import registry as _clients
 
-mcp = FastMCP("wechat-notify", json_response=True)
+# 独立运行时的 FastMCP 实例按需创建；mcp_server 只使用 send_wechat，不会再建一个服务实例
+_server = None
+
+
+def build_server():
+    global _server
+    if _server is None:
+        from mcp.server.fastmcp import FastMCP
+        _server = FastMCP("wechat-notify", json_response=True)
+        _server.tool()(send_wechat)
+    return _server
+
+
+def __getattr__(name: str) -> Any:
+    # 兼容原来的模块属性 mcp
+    if name == "mcp":
+        return build_server()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def _load_sct_key() -> str | None:
@@ -42,22 +60,24 @@ def _build_api_url() -> str:
     return f"https://sctapi.ftqq.com/{key}.send"
 
 
-@mcp.tool()
 async def send_wechat(title: str, desp: str) -> dict[str, Any]:
     api_url = _build_api_url()
-    async with httpx.AsyncClient() as client:
-        headers = {"Content-Type": "application/json"}
-        payload = {"title": title, "desp": desp}
+    client = _clients.async_client("serverchan")
+    headers = {"Content-Type": "application/json"}
+    payload = {"title": title, "desp": desp}
+    try:
+        resp = await client.post(api_url, json=payload, headers=headers, timeout=30.0)
+        data: Any
         try:
-            resp = await client.post(api_url, json=payload, headers=headers, timeout=30.0)
-            data: Any
-            try:
-                data = resp.json()
-            except Exception:
-                data = {"text": resp.text}
-            return {"status_code": resp.status_code, "response": data}
-        except Exception as e:
-            return {"error": str(e)}
+            data = resp.json()
+        except Exception:
+            data = {"text": resp.text}
+        return {"status_code": resp.status_code, "response": data}
+    except CircuitOpenError as e:
+        # 熔断中直接返回，不等待超时
+        return {"error": str(e), "circuit": "open", "retry_after": _clients.breaker("serverchan").retry_after()}
+    except httpx.HTTPError as e:
+        return {"error": f"{type(e).__name__}: {e}"}
 
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(prog="wechat_server")
@@ -75,7 +95,7 @@ def _parse_args() -> argparse.Namespace:
 
 
 def _run_server(port: int) -> None:
-    mcp.run(transport="streamable-http", port=port)
+    build_server().run(transport="streamable-http", port=port)
 
 
 async def _run_send(api_url: str, title: str, desp: str, dry_run: bool) -> None:
@@ -0,0 +1,191 @@
+"""
+阻塞任务的有界工作池与准入控制
+
+工具处理函数与快照刷新中的阻塞工作（历史文件扫描、JSON 解码、监听器写盘、akshare 等）
+放到固定大小的线程池执行，事件循环只负责调度，一个慢调用不会拖住其他 SSE 会话：
+- 线程池处理 I/O 与轻量计算；配置 WORKER_PROCESSES 后 cpu=True 的任务改走进程池（绕开 GIL）
+- 排队深度有上限，超过时立即抛出 PoolBusyError（附带建议的重试秒数），而不是无限堆积
+- 每个工具的同时在途调用数有上限，单个工具被大量调用时只拒绝该工具，不影响其他工具
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from metrics import registry as _metrics
+
+logger = logging.getLogger("mcp_server.pool")
+
+QUEUE_SECONDS = _metrics.histogram("worker_queue_seconds", "任务提交到开始执行的等待时间", ["kind"])
+RUN_SECONDS = _metrics.histogram("worker_run_seconds", "任务执行耗时", ["kind"])
+REJECTED = _metrics.counter("worker_rejected_total", "被准入控制拒绝的请求数", ["reason"])
+
+
+class PoolBusyError(RuntimeError):
+    """工作池排队已满或工具在途调用数已达上限"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        threads: int = 8,
+        processes: int = 0,
+        max_queue: int = 32,
+        tool_limit: int = 32,
+        tool_limits: Optional[Dict[str, int]] = None,
+    ):
+        """
+        Args:
+            threads: 线程池大小
+            processes: 进程池大小，0 表示不使用进程池（cpu=True 的任务也走线程池）
+            max_queue: 线程全部占用时最多排队的任务数，超过时拒绝
+            tool_limit: 每个工具默认的同时在途调用数上限
+            tool_limits: 按工具名单独设置的上限
+        """
+        self.threads = threads
+        self.processes = processes
+        self.max_queue = max_queue
+        self.tool_limit = tool_limit
+        self.tool_limits = dict(tool_limits or {})
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0  # 已提交未完成（排队 + 执行中）
+        self._running = 0
+        self._inflight: Dict[str, int] = {}
+        self._avg_run = 0.1  # 任务耗时的 EWMA，用于估算重试等待时间
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0, "tool_rejected": 0}
+
+    @classmethod
+    def from_env(cls) -> "WorkerPool":
+        limits: Dict[str, int] = {}
+        # WORKER_TOOL_LIMITS=fetch_premium_history:4,rank_premium_signals:4
+        for item in os.getenv("WORKER_TOOL_LIMITS", "").split(","):
+            name, _, value = item.partition(":")
+            if name.strip() and value.strip().isdigit():
+                limits[name.strip()] = int(value)
+        return cls(
+            threads=int(os.getenv("WORKER_THREADS", "8")),
+            processes=int(os.getenv("WORKER_PROCESSES", "0")),
+            max_queue=int(os.getenv("WORKER_MAX_QUEUE", "32")),
+            tool_limit=int(os.getenv("WORKER_TOOL_LIMIT", "32")),
+            tool_limits=limits,
+        )
+
+    def _executor(self, cpu: bool) -> Executor:
+        with self._lock:
+            if cpu and self.processes > 0:
+                if self._processes is None:
+                    self._processes = ProcessPoolExecutor(max_workers=self.processes)
+                return self._processes
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="worker")
+            return self._threads
+
+    def retry_after(self) -> float:
+        # 按排队深度与平均耗时估算多久后会有空位
+        waves = max(1.0, self._pending / max(1, self.threads))
+        return round(max(0.5, waves * self._avg_run), 2)
+
+    def _reject(self, reason: str, message: str) -> PoolBusyError:
+        REJECTED.inc(reason=reason)
+        return PoolBusyError(message, self.retry_after())
+
+    async def run(self, fn: Callable[..., Any], *args: Any, cpu: bool = False, admit: bool = True) -> Any:
+        """
+        在工作池中执行阻塞函数
+
+        Args:
+            fn: 阻塞函数；进程池执行时必须是模块级函数
+            args: 位置参数
+            cpu: 计算密集型任务，配置了进程池时在进程池中执行
+            admit: 是否受排队深度限制（快照监听器等内部任务传 False，总会执行）
+        """
+        kind = "process" if cpu and self.processes > 0 else "thread"
+        with self._lock:
+            if admit and self._pending >= self.threads + self.max_queue:
+                self._stats["rejected"] += 1
+                raise self._reject("queue_full", f"工作池已满: {self._pending} 个任务在排队或执行")
+            self._pending += 1
+            self._stats["submitted"] += 1
+        submitted = time.perf_counter()
+        try:
+            if kind == "process":
+                future = asyncio.get_running_loop().run_in_executor(self._executor(True), fn, *args)
+                result = await future
+                RUN_SECONDS.observe(time.perf_counter() - submitted, kind=kind)
+                return result
+            # 与 asyncio.to_thread 一样带上调用方的 contextvars（日志里的工具调用 ID 与阶段耗时）
+            ctx = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(self._executor(False), ctx.run, self._timed, fn, args, submitted)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._stats["completed"] += 1
+
+    def _timed(self, fn: Callable[..., Any], args: Any, submitted: float) -> Any:
+        start = time.perf_counter()
+        QUEUE_SECONDS.observe(start - submitted, kind="thread")
+        with self._lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            RUN_SECONDS.observe(elapsed, kind="thread")
+            with self._lock:
+                self._running -= 1
+                self._avg_run += 0.2 * (elapsed - self._avg_run)
+
+    @contextmanager
+    def admit(self, tool: str) -> Iterator[None]:
+        """工具调用的准入控制：在途调用数达到上限时立即抛出 PoolBusyError"""
+        limit = self.tool_limits.get(tool, self.tool_limit)
+        with self._lock:
+            current = self._inflight.get(tool, 0)
+            if current >= limit:
+                self._stats["tool_rejected"] += 1
+                raise self._reject("tool_limit", f"{tool} 同时在途调用已达上限 {limit}")
+            self._inflight[tool] = current + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight[tool] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threads": self.threads,
+            "processes": self.processes,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "running": self._running,
+            "inflight": {k: v for k, v in self._inflight.items() if v},
+            "avg_run": round(self._avg_run, 4),
+            **self._stats,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            threads, processes = self._threads, self._processes
+            self._threads = self._processes = None
+        if threads is not None:
+            threads.shutdown(wait=False, cancel_futures=True)
+        if processes is not None:
+            processes.shutdown(wait=False, cancel_futures=True)
+
+
+pool = WorkerPool.from_env()
+
+_metrics.gauge("worker_pool_tasks", "工作池中排队与执行中的任务数", ["state"]).set_function(
+    lambda: {("pending",): pool._pending, ("running",): pool._running}
+)